@@ -1,114 +1,478 @@
 from typing import Annotated, Literal, TypedDict
-from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, START, END
-from langgraph.prebuilt import ToolNode
-from langgraph.checkpoint.memory import MemorySaver
-from langchain_core.messages import HumanMessage, SystemMessage, BaseMessage
+from tool_executor import ParallelToolExecutor
+from checkpointer import SqliteCheckpointer
+from langchain_core.messages import HumanMessage, SystemMessage, BaseMessage, AIMessage, AIMessageChunk, ToolMessage
 from tools import tools # 從我們的 tools.py 匯入工具
+import context_budget
+import fast_path
+import response_cache
+import telemetry
 
 from langgraph.graph.message import add_messages
 
 # 定義狀態
-class AgentState(TypedDict):
+class AgentState(TypedDict, total=False):
     messages: Annotated[list[BaseMessage], add_messages]
+    # 較早對話的滾動摘要，以及已併入摘要的訊息數 (見 context_budget.py)
+    summary: str
+    summarized_count: int
 
-from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from collections import OrderedDict
+import asyncio
+import hashlib
+import importlib
 import os
+import queue
+import threading
+import time
 
+CEREBRAS_BASE_URL = "https://api.cerebras.ai/v1"
 
-# 定義代理人
-def agent(state: AgentState, config: RunnableConfig):
+# 已綁定工具的 LLM 用戶端快取 (LRU)，key 為 (provider, model)
+MODEL_CACHE_SIZE = int(os.environ.get("LLM_CLIENT_CACHE_SIZE", "8"))
+_model_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_model_cache_lock = threading.Lock()
+# 事件迴圈 -> 該迴圈專屬的用戶端快取 (迴圈關閉後的項目在下次存取時移除)
+_async_model_cache: "dict[asyncio.AbstractEventLoop, OrderedDict]" = {}
+
+# 常駐的背景事件迴圈 (見 stream_events)：每則訊息都在同一個迴圈上執行，非同步連線池可跨訊息重複使用
+_background_loop = None
+_background_loop_lock = threading.Lock()
+
+# LLM 呼叫失敗 (連線、逾時、429、5xx) 時的重試次數；由節點自行重試，才能記錄重試次數
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))
+
+# langchain_openai / openai 約佔匯入本模組時間的一半，延遲到第一次建立 LLM 用戶端時才載入
+# (仍可透過 agent_engine.ChatOpenAI 存取或 patch；見 benchmark.py 的 startup 量測)
+_LAZY_IMPORTS = {"ChatOpenAI": ("langchain_openai", "ChatOpenAI"), "openai": ("openai", None)}
+
+
+def __getattr__(name: str):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module_name, attr = _LAZY_IMPORTS[name]
+    value = importlib.import_module(module_name)
+    if attr:
+        value = getattr(value, attr)
+    globals()[name] = value
+    return value
+
+
+def _lazy(name: str):
+    """取得延遲匯入的名稱 (已被 patch 時回傳 patch 後的物件)。"""
+    return globals()[name] if name in globals() else __getattr__(name)
+
+
+def _retryable_errors() -> tuple:
+    openai = _lazy("openai")
+    return (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+
+def _resolve_model(provider: str, model_name: str) -> tuple:
     """
-    主要的代理人節點，使用工具調用 LLM。
-    支援透過 config 切換不同模型提供者。
+    將 (provider, model_name) 解析為實際的 (model, base_url, API 金鑰環境變數)。
+
+    設定 LLM_BASE_URL 時改連到該 OpenAI 相容端點 (例如 benchmark.py 的本地 stub 伺服器)。
     """
-    messages = state['messages']
-    
-    # 定義系統提示
-    system_prompt = SystemMessage(content="""You are a helpful AI Research Assistant.
+    base_url = os.environ.get("LLM_BASE_URL") or CEREBRAS_BASE_URL
+    if provider == "cerebras":
+        return model_name, base_url, "CEREBRAS_API_KEY"
+    # 其他 provider 目前一律回退到 Cerebras Llama-3.3-70B
+    return "llama-3.3-70b", base_url, "CEREBRAS_API_KEY"
+
+
+def _get_clients(provider: str, model_name: str, loop=None) -> tuple:
+    """
+    取得 (provider, model_name) 對應的 (用戶端, 已執行 bind_tools 的用戶端)。
+
+    用戶端以 LRU 快取重複使用 (保留 HTTP 連線池與工具 schema)，
+    若 API 金鑰或端點變更則自動重建該項目。
+
+    非同步連線綁定在建立它的事件迴圈上，因此指定 loop 時使用該事件迴圈專屬的快取與 HTTP 連線池；
+    被淘汰或取代的項目會在其事件迴圈上關閉連線池。
+    """
+    model, base_url, key_env = _resolve_model(provider, model_name)
+    api_key = os.environ.get(key_env)
+    # 只保存金鑰指紋，不在快取中留下明文比對
+    fingerprint = (hashlib.sha256(api_key.encode()).hexdigest() if api_key else None, base_url)
+    cache_key = (provider, model)
+
+    with _model_cache_lock:
+        if loop is None:
+            cache = _model_cache
+        else:
+            # 已關閉的事件迴圈無法再使用其連線，直接丟棄
+            for closed in [l for l in _async_model_cache if l.is_closed()]:
+                del _async_model_cache[closed]
+            cache = _async_model_cache.setdefault(loop, OrderedDict())
+        entry = cache.get(cache_key)
+        if entry is not None and entry[0] == fingerprint:
+            cache.move_to_end(cache_key)
+            return entry[1], entry[2]
+        if entry is not None:
+            _close_async_client(loop, entry[3])
+
+        http_client = None if loop is None else _lazy("openai").DefaultAsyncHttpxClient()
+        client = _lazy("ChatOpenAI")(
+            model=model,
+            temperature=0,
+            base_url=base_url,
+            api_key=api_key,
+            # 重試由 _invoke_with_retries 處理 (見 telemetry 的 retries 欄位)
+            max_retries=0,
+            # 串流時也回報 token 用量
+            stream_usage=True,
+            **({} if http_client is None else {"http_async_client": http_client})
+        )
+        bound = client.bind_tools(tools)
+        cache[cache_key] = (fingerprint, client, bound, http_client)
+        cache.move_to_end(cache_key)
+        while len(cache) > MODEL_CACHE_SIZE:
+            _close_async_client(loop, cache.popitem(last=False)[1][3])
+        return client, bound
+
+
+def _close_async_client(loop, http_client):
+    """在所屬的事件迴圈上關閉非同步 HTTP 連線池 (迴圈已關閉時連線已無法使用，略過)。"""
+    if http_client is None or loop is None or loop.is_closed():
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        loop.create_task(http_client.aclose())
+    else:
+        asyncio.run_coroutine_threadsafe(http_client.aclose(), loop)
+
+
+def get_bound_model(provider: str, model_name: str, loop=None):
+    """取得已綁定工具的 LLM 用戶端 (代理人節點使用；非同步節點傳入目前的事件迴圈)。"""
+    return _get_clients(provider, model_name, loop)[1]
+
+
+def get_chat_model(provider: str, model_name: str):
+    """取得未綁定工具的 LLM 用戶端 (例如產生對話摘要)，與 get_bound_model 共用連線。"""
+    return _get_clients(provider, model_name)[0]
+
+
+def clear_model_cache():
+    """清空 LLM 用戶端快取 (測試或切換設定時使用)。"""
+    with _model_cache_lock:
+        _model_cache.clear()
+        for loop, cache in _async_model_cache.items():
+            for entry in cache.values():
+                _close_async_client(loop, entry[3])
+        _async_model_cache.clear()
+
+
+# 定義系統提示
+SYSTEM_PROMPT = """You are a helpful AI Research Assistant.
 You have access to the following tools:
 1. multiply: Multiply two integers.
 2. add: Add two integers.
 3. search_duckduckgo: Search the web.
-4. train_tabular_model: AutoML tool to train machine learning models on tabular data.
+4. train_tabular_model: AutoML tool to train machine learning models on tabular data. Returns a Job ID immediately.
+5. get_training_status: Check an AutoML job and get the final results when it is done.
+6. get_training_results: Get the (partial) leaderboard of an AutoML job.
+7. cancel_training: Cancel an AutoML job.
+8. predict: Make predictions with a trained model (use the Model ID from the training results).
+9. batch_predict: Score a whole CSV file with a trained model and write the predictions to a file.
 
-When asked to analyze data or train a model, use 'train_tabular_model'.
+When asked to analyze data or train a model, use 'train_tabular_model', then use 'get_training_status' with the returned Job ID.
 For Titanic dataset, use 'openml:40945'. For Iris, use 'openml:61'.
 If the user mentions an uploaded file, look for it in the 'data/' directory (e.g., 'data/filename.csv').
-Always use the tools provided. Do not halllucinate answers for math or data training.""")
+Always use the tools provided. Do not halllucinate answers for math or data training."""
+
+
+def _prepare_call(state: AgentState, config: RunnableConfig, loop=None):
+    """
+    建構 LLM 輸入訊息並取得對應模型 (同步與非同步節點共用；非同步節點傳入事件迴圈)。
+
+    回傳 (model, input_messages, updates)；updates 為需要寫回 state 的摘要變更。
+    """
+    messages = state['messages']
+    system_prompt = SystemMessage(content=SYSTEM_PROMPT)
     
     # 安全地建構輸入訊息列表 (不要修改原始 state)
-    # 檢查第一則訊息是否已經是 SystemMessage
-    if messages and isinstance(messages[0], SystemMessage):
-        # 如果已經有了，我們用新的取代它 (建立新列表)
-        input_messages = [system_prompt] + messages[1:]
-    else:
-        # 如果沒有，插入在最前面
-        input_messages = [system_prompt] + messages
+    # 檢查第一則訊息是否已經是 SystemMessage，若是則以新的系統提示取代
+    offset = 1 if messages and isinstance(messages[0], SystemMessage) else 0
     
     # 讀取配置
     configurable = config.get("configurable", {})
     provider = configurable.get("provider", "openai")
     model_name = configurable.get("model_name", "gpt-3.5-turbo")
-    
-    # ... (Model init code)
-    
-    # 這裡省略模型初始化程式碼，因為上面 context 沒包含到，但我們只需要確保下面 invoke 用的是 input_messages
 
-    # (Re-stating the model init block to be safe in replacement if needed, 
-    # but since I am using replace_file_content with context, I will just focus on the logic block)
-    
-    # 根據 provider 初始化模型
-    if provider == "cerebras":
-        model = ChatOpenAI(
-            model=model_name,
-            temperature=0,
-            base_url="https://api.cerebras.ai/v1",
-            api_key=os.environ.get("CEREBRAS_API_KEY")
-        )
-    else:
-        model = ChatOpenAI(
-            model="llama-3.3-70b",
-            temperature=0,
-            base_url="https://api.cerebras.ai/v1",
-            api_key=os.environ.get("CEREBRAS_API_KEY")
-        )
+    # 依 token 預算保留近期對話，較早的輪次摺疊成摘要 (摘要只在邊界前移時更新)
+    summary = state.get("summary", "")
+    summarized_count = state.get("summarized_count", 0)
+    history, new_summary, new_count = context_budget.build_context(
+        messages[offset:],
+        summary=summary,
+        summarized_count=summarized_count,
+        summarize_fn=lambda previous, dropped: context_budget.summarize(
+            get_chat_model(provider, model_name), previous, dropped),
+        max_tokens=configurable.get("context_max_tokens"),
+    )
+    input_messages = [system_prompt] + history
+    updates = {}
+    if (new_summary, new_count) != (summary, summarized_count):
+        updates = {"summary": new_summary, "summarized_count": new_count}
+
+    # 從快取取得已綁定工具的模型 (避免每個步驟重建用戶端與序列化工具 schema)
+    model = get_bound_model(provider, model_name, loop)
+    return model, input_messages, updates
+
+
+def _backoff(attempt: int) -> float:
+    return min(8.0, 0.5 * 2 ** attempt)
+
 
-    model = model.bind_tools(tools)
-    response = model.invoke(input_messages) # 使用 input_messages
-    return {"messages": [response]}
+def _invoke_with_retries(model, input_messages, event: dict):
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            return model.invoke(input_messages)
+        except _retryable_errors():
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            event["retries"] = attempt + 1
+            time.sleep(_backoff(attempt))
 
-# 定義工具節點
-tool_node = ToolNode(tools)
+
+async def _ainvoke_with_retries(model, input_messages, event: dict):
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            return await model.ainvoke(input_messages)
+        except _retryable_errors():
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            event["retries"] = attempt + 1
+            await asyncio.sleep(_backoff(attempt))
+
+
+def _record_llm_call(event: dict, response, llm_start: float):
+    event["llm_ms"] = (time.perf_counter() - llm_start) * 1000
+    event.update(telemetry.token_usage(response))
+
+
+# 定義代理人
+def agent(state: AgentState, config: RunnableConfig):
+    """
+    主要的代理人節點，使用工具調用 LLM。
+    支援透過 config 切換不同模型提供者。
+    """
+    with telemetry.step("agent", config, retries=0) as event:
+        model, input_messages, updates = _prepare_call(state, config)
+        llm_start = time.perf_counter()
+        response = _invoke_with_retries(model, input_messages, event) # 使用 input_messages
+        _record_llm_call(event, response, llm_start)
+    return {"messages": [response], **updates}
+
+
+async def aagent(state: AgentState, config: RunnableConfig):
+    """
+    代理人節點的非同步版本 (app.astream / app.ainvoke 時使用)。
+    等待 LLM 回應時不佔用 OS 執行緒，單一事件迴圈可同時服務大量對話。
+    """
+    with telemetry.step("agent", config, retries=0) as event:
+        model, input_messages, updates = await asyncio.to_thread(
+            _prepare_call, state, config, asyncio.get_running_loop())
+        llm_start = time.perf_counter()
+        response = await _ainvoke_with_retries(model, input_messages, event)
+        _record_llm_call(event, response, llm_start)
+    return {"messages": [response], **updates}
+
+def _last_human_text(state: AgentState):
+    for message in reversed(state['messages']):
+        if isinstance(message, HumanMessage):
+            return message.content if isinstance(message.content, str) else None
+    return None
+
+
+def route_start(state: AgentState, config: RunnableConfig) -> Literal["fast_path", "agent"]:
+    """
+    預先路由 (預設關閉)：configurable["fast_path"] 為 True 且問題是純算術時，
+    不呼叫 LLM，直接由 fast_path 節點回答。
+    """
+    if config.get("configurable", {}).get("fast_path"):
+        text = _last_human_text(state)
+        if text and fast_path.try_answer(text) is not None:
+            return "fast_path"
+    return "agent"
+
+
+def answer_directly(state: AgentState):
+    """以安全的運算式求值器直接回答 (不呼叫 LLM)。"""
+    return {"messages": [AIMessage(content=fast_path.try_answer(_last_human_text(state)))]}
+
+# 定義工具節點 (多個 tool_calls 平行執行，各工具有同時執行上限與逾時)
+tool_executor = ParallelToolExecutor(tools)
+tool_node = tool_executor.as_node()
 
 # 定義圖表
 workflow = StateGraph(AgentState)
 
-# 新增節點
-workflow.add_node("agent", agent)
+# 新增節點 (同時提供同步與非同步實作，stream 與 astream 皆可使用)
+workflow.add_node("agent", RunnableLambda(agent, afunc=aagent, name="agent"))
 workflow.add_node("tools", tool_node)
+workflow.add_node("fast_path", answer_directly)
 
 # 新增邊
-workflow.add_edge(START, "agent")
+workflow.add_conditional_edges(START, route_start)
+workflow.add_edge("fast_path", END)
 
-def should_continue(state: AgentState) -> Literal["tools", END]:
-    messages = state['messages']
-    last_message = messages[-1]
-    # 如果 LLM 返回 tool_calls，我們進入 tools
-    if last_message.tool_calls:
-        return "tools"
-    # 否則我們結束
-    return END
+def should_continue(state: AgentState, config: RunnableConfig) -> Literal["tools", END]:
+    with telemetry.step("should_continue", config):
+        messages = state['messages']
+        last_message = messages[-1]
+        # 如果 LLM 返回 tool_calls，我們進入 tools
+        if last_message.tool_calls:
+            return "tools"
+        # 否則我們結束
+        return END
 
 workflow.add_conditional_edges("agent", should_continue)
 workflow.add_edge("tools", "agent")
 
-# 初始化記憶
-memory = MemorySaver()
+# 初始化記憶 (SQLite 持久化，多個工作程序可共用；閒置 thread 依 TTL/LRU 淘汰)
+CHECKPOINT_DB = os.environ.get("CHECKPOINT_DB", ".checkpoints/agent.sqlite")
+memory = SqliteCheckpointer(
+    CHECKPOINT_DB,
+    ttl_seconds=float(os.environ.get("CHECKPOINT_TTL_HOURS", "168")) * 3600,
+    max_threads=int(os.environ.get("CHECKPOINT_MAX_THREADS", "1000")),
+    keep_checkpoints=int(os.environ.get("CHECKPOINT_KEEP_PER_THREAD", "4")),
+)
+# 資料庫大小與 RSS 隨 metrics.prom 一起輸出
+telemetry.register_gauges("checkpoint", memory.gauges)
 
 # 編譯圖表
 app = workflow.compile(checkpointer=memory)
 
+def _cacheable_prompt(inputs: dict):
+    """只有單一文字 HumanMessage 的輸入可以使用回答快取。"""
+    messages = inputs.get("messages", [])
+    if len(messages) == 1 and isinstance(messages[0], HumanMessage) and isinstance(messages[0].content, str):
+        return messages[0].content
+    return None
+
+
+async def _cached_answer(inputs: dict, config: dict):
+    """
+    回答快取 (configurable["response_cache"] 為 True 時只比對完全相同的問題，
+    為 "similar" 時也使用相似問題的第二層，見 response_cache.py)。
+
+    只用於新的對話 (thread 尚無訊息)：既有對話的回答取決於先前的脈絡，不能直接重複使用。
+    命中時把問題與回答寫入 thread 的 state，之後的追問仍有完整脈絡。
+    回傳 (prompt, answer)；不適用快取時 prompt 為 None。
+    """
+    configurable = config.get("configurable", {})
+    prompt = _cacheable_prompt(inputs)
+    if not configurable.get("response_cache") or prompt is None:
+        return None, None
+    snapshot = await app.aget_state(config)
+    if snapshot.values.get("messages"):
+        return None, None
+    hit = response_cache.lookup(configurable.get("provider", "openai"),
+                                configurable.get("model_name", "gpt-3.5-turbo"), prompt,
+                                similarity=configurable.get("response_cache") == "similar")
+    if hit is None:
+        return prompt, None
+    answer = hit[0]
+    await app.aupdate_state(config, {"messages": [inputs["messages"][0], AIMessage(content=answer)]},
+                            as_node="agent")
+    return prompt, answer
+
+
+async def astream_events(inputs: dict, config: dict):
+    """
+    以 token 為單位串流 Agent 的輸出 (供 UI 即時顯示)。
+
+    結合 LangGraph 的 "messages" (LLM token) 與 "updates" (節點結果) 串流模式，產生 (kind, data)：
+        ("token", str)                目前這一步 LLM 已產生的文字 (累積)
+        ("tool_call", dict)           LLM 決定呼叫的工具 (name, args, id)
+        ("tool_result", ToolMessage)  工具執行完成
+        ("final", str)                本輪對話的最終回答
+    """
+    prompt, answer = await _cached_answer(inputs, config)
+    if answer is not None:
+        yield "final", answer
+        return
+
+    current_step = None
+    text = ""
+    final = ""
+    tools_used = set()
+    async for mode, payload in app.astream(inputs, config=config, stream_mode=["messages", "updates"]):
+        if mode == "messages":
+            chunk, metadata = payload
+            if metadata.get("langgraph_node") != "agent" or not isinstance(chunk, AIMessageChunk):
+                continue
+            # 新的 agent 步驟 (例如工具呼叫之後) 從頭累積文字
+            if metadata.get("langgraph_step") != current_step:
+                current_step, text = metadata.get("langgraph_step"), ""
+            if isinstance(chunk.content, str) and chunk.content:
+                text += chunk.content
+                yield "token", text
+        elif mode == "updates":
+            for update in payload.values():
+                if not isinstance(update, dict):
+                    continue
+                for message in update.get("messages", []):
+                    if isinstance(message, ToolMessage):
+                        yield "tool_result", message
+                    elif isinstance(message, AIMessage):
+                        for tool_call in message.tool_calls:
+                            tools_used.add(tool_call["name"])
+                            yield "tool_call", tool_call
+                        if message.content and not message.tool_calls:
+                            final = message.content
+    if prompt is not None:
+        configurable = config.get("configurable", {})
+        response_cache.store(configurable.get("provider", "openai"), configurable.get("model_name", "gpt-3.5-turbo"),
+                             prompt, final, tools_used)
+    telemetry.write_prometheus()
+    yield "final", final
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """取得 (必要時啟動) 在背景執行緒中常駐的事件迴圈。"""
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None or _background_loop.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="agent-event-loop", daemon=True).start()
+            _background_loop = loop
+        return _background_loop
+
+
+def stream_events(inputs: dict, config: dict):
+    """
+    astream_events 的同步版本 (供 Streamlit 等同步呼叫端使用)。
+
+    在常駐的背景事件迴圈上執行，而不是每則訊息以 asyncio.run 建立新的迴圈：
+    LLM 用戶端的非同步連線池綁定在建立它的迴圈上，迴圈關閉後就無法再使用。
+    事件透過佇列交回呼叫端的執行緒，UI 更新仍在呼叫端執行；提前結束時取消背景工作。
+    """
+    events = queue.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async for item in astream_events(inputs, config):
+                events.put(item)
+        finally:
+            events.put(done)
+
+    future = asyncio.run_coroutine_threadsafe(pump(), get_background_loop())
+    try:
+        while (item := events.get()) is not done:
+            yield item
+        future.result()
+    finally:
+        future.cancel()
+
 # 如果直接執行，用於演示的簡單進入點
 if __name__ == "__main__":
     import uuid
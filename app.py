@@ -1,13 +1,60 @@
 import streamlit as st
 import os
 import sys
+import time
 import uuid
 
 # 將當前目錄加入 sys.path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from agent_engine import app as agent_app
-from langchain_core.messages import HumanMessage, AIMessage
+from agent_engine import memory, stream_events
+import response_cache
+import telemetry
+from langchain_core.messages import HumanMessage
+
+def drive_agent(inputs, config, message_placeholder, status_placeholder) -> str:
+    """
+    驅動 Agent 並逐 token 更新回答、顯示工具執行進度；回傳最終回答。
+
+    Agent 在 agent_engine 常駐的背景事件迴圈上以 astream 執行 (連線池跨訊息重複使用)，
+    畫面更新留在 Streamlit 的腳本執行緒。
+    """
+    full_response = ""
+    tool_lines = []
+    render_seconds = 0.0
+    for kind, data in stream_events(inputs, config):
+        render_start = time.perf_counter()
+        if kind == "token":
+            message_placeholder.markdown(data + "▌")
+        elif kind == "tool_call":
+            tool_lines.append(f"🔧 Running `{data['name']}`...")
+            status_placeholder.caption("  \n".join(tool_lines))
+        elif kind == "tool_result":
+            tool_lines.append(f"✅ `{data.name}` finished")
+            status_placeholder.caption("  \n".join(tool_lines))
+        elif kind == "final":
+            full_response = data
+        render_seconds += time.perf_counter() - render_start
+    # 記錄本輪花在 Streamlit 畫面更新的時間
+    configurable = config["configurable"]
+    telemetry.record({"node": "ui_render", "thread_id": configurable.get("thread_id"),
+                      "model": configurable.get("model_name"), "wall_ms": render_seconds * 1000})
+    return full_response
+
+
+MODEL_OPTIONS = {
+    "Cerebras (Llama-3.3-70B)": "llama-3.3-70b",
+    "Cerebras (GPT-OSS-120B)": "gpt-oss-120b",
+}
+
+
+def format_model_option(option: str) -> str:
+    """在模型選單中顯示該模型 agent 步驟的 p50/p95/p99 延遲。"""
+    latency = telemetry.latency_percentiles("agent").get(MODEL_OPTIONS[option])
+    if not latency:
+        return option
+    return (f"{option} · p50 {latency['p50'] / 1000:.1f}s / p95 {latency['p95'] / 1000:.1f}s"
+            f" / p99 {latency['p99'] / 1000:.1f}s")
 
 # 設定頁面資訊
 st.set_page_config(page_title="AI Research Assistant", page_icon="🤖", layout="centered")
@@ -21,10 +68,8 @@ with st.sidebar:
     # 1. 模型選單
     model_option = st.selectbox(
         "選擇模型 / Select Model",
-        (
-            "Cerebras (Llama-3.3-70B)",
-            "Cerebras (GPT-OSS-120B)"
-        )
+        tuple(MODEL_OPTIONS),
+        format_func=format_model_option
     )
     
     # 側邊欄按鈕
@@ -33,12 +78,16 @@ with st.sidebar:
         st.session_state.messages = []
         st.rerun()
 
+    cache_stats = response_cache.stats()
+    st.caption(f"⚡ Response cache: {cache_stats['hit_rate']:.0%} hit rate "
+               f"({cache_stats['exact_hits'] + cache_stats['similar_hits']} hits, {cache_stats['entries']} entries)")
+    memory_stats = memory.stats()
+    st.caption(f"💾 Memory: {memory_stats['threads']} threads, "
+               f"checkpoint DB {memory_stats['db_bytes'] / 2**20:.1f} MB, RSS {memory_stats['rss_bytes'] / 2**20:.0f} MB")
+
     # 2. 設定 Cerebras
     provider = "cerebras"
-    if "Llama" in model_option:
-        model_name = "llama-3.3-70b"
-    else:
-        model_name = "gpt-oss-120b"
+    model_name = MODEL_OPTIONS[model_option]
         
     api_key = st.text_input("Cerebras API Key", type="password")
     if api_key:
@@ -81,6 +130,7 @@ if prompt := st.chat_input("Input message..."):
 
     # 2. 呼叫 Agent
     with st.chat_message("assistant"):
+        status_placeholder = st.empty()
         message_placeholder = st.empty()
         full_response = ""
         
@@ -97,19 +147,18 @@ if prompt := st.chat_input("Input message..."):
                 "configurable": {
                     "thread_id": st.session_state.thread_id,
                     "provider": provider,
-                    "model_name": model_name
+                    "model_name": model_name,
+                    # 純算術問題直接計算，不呼叫 LLM
+                    "fast_path": True,
+                    # 新對話中與先前完全相同的問題直接使用快取的回答 (不使用相似問題比對)
+                    "response_cache": True
                 }
             }
             
             # 串流回應
             # 不顯示 Spinner 文字，僅顯示轉圈圈 (預設行為) 或自訂空 spinner
             with st.spinner():
-                for event in agent_app.stream(inputs, config=config, stream_mode="values"):
-                    if "messages" in event:
-                        latest_msg = event["messages"][-1]
-                        if isinstance(latest_msg, AIMessage) and latest_msg.content:
-                            full_response = latest_msg.content
-                            message_placeholder.markdown(full_response + "▌")
+                full_response = drive_agent(inputs, config, message_placeholder, status_placeholder)
             
             message_placeholder.markdown(full_response)
             st.session_state.messages.append({"role": "assistant", "content": full_response})
@@ -0,0 +1,156 @@
+"""
+依基數 (cardinality) 選擇各欄位的前處理方式，避免 one-hot 讓特徵寬度爆炸。
+
+以訓練集統計決定每個欄位的策略 (plan_columns)：
+
+- drop:      ID-like 欄位：名稱像 ID 的唯一整數欄位 (例如 PassengerId)、連號的列索引 (例如 "Unnamed: 0")，
+             或幾乎每列都不同的文字欄位 (例如 Name)
+- numeric:   其他數值欄位 (中位數補值 + 標準化)
+- onehot:    不同值不超過 ONEHOT_MAX_CATEGORIES 的類別欄位 (例如 Sex、Embarked)
+- ordinal:   有序的 pandas Categorical
+- frequency: 高基數且不同值佔列數比例超過 FREQUENCY_RATIO 的欄位 (例如 Ticket)；
+             這類近乎唯一的值做 target encoding 容易過擬合，改用出現比例
+- target:    其他高基數欄位 (例如 Cabin)；sklearn TargetEncoder 在 fit 時以交叉擬合避免目標洩漏
+
+build_preprocessor() 依計畫組成 ColumnTransformer，轉換後的矩陣維持窄而稠密。
+"""
+import os
+import re
+
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.compose import ColumnTransformer
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer, OneHotEncoder, OrdinalEncoder, StandardScaler, TargetEncoder
+
+ONEHOT_MAX_CATEGORIES = int(os.environ.get("AUTOML_ONEHOT_MAX_CATEGORIES", "10"))
+ID_UNIQUE_RATIO = float(os.environ.get("AUTOML_ID_UNIQUE_RATIO", "0.95"))
+FREQUENCY_RATIO = 0.5
+# 列數太少時無法可靠地判斷 ID-like
+MIN_ROWS_FOR_ID_CHECK = 20
+
+_ID_NAME_RE = re.compile(r"(^id$|[_\s\-.]id$|[a-z0-9](Id|ID)$|^unnamed: \d+$|^index$)", re.IGNORECASE)
+_MISSING = "__missing__"
+
+
+class FrequencyEncoder(TransformerMixin, BaseEstimator):
+    """以訓練集中的出現比例取代類別值 (缺值視為一個類別，未見過的值為 0)。"""
+
+    def fit(self, X, y=None):
+        X = self._frame(X)
+        self.n_features_in_ = X.shape[1]
+        self.frequencies_ = [self._values(X.iloc[:, i]).value_counts(normalize=True).to_dict()
+                             for i in range(X.shape[1])]
+        return self
+
+    def transform(self, X):
+        X = self._frame(X)
+        columns = [self._values(X.iloc[:, i]).map(freq).fillna(0.0).to_numpy(dtype=float)
+                   for i, freq in enumerate(self.frequencies_)]
+        return np.column_stack(columns) if columns else np.empty((len(X), 0))
+
+    def get_feature_names_out(self, input_features=None):
+        if input_features is None:
+            input_features = [f"x{i}" for i in range(self.n_features_in_)]
+        return np.asarray([f"{name}_freq" for name in input_features], dtype=object)
+
+    @staticmethod
+    def _frame(X) -> pd.DataFrame:
+        return X if isinstance(X, pd.DataFrame) else pd.DataFrame(X)
+
+    @staticmethod
+    def _values(column: pd.Series) -> pd.Series:
+        column = column.astype(object)
+        return column.where(column.notna(), _MISSING)
+
+
+def _as_object(X) -> pd.DataFrame:
+    """StringDtype 等可空型別轉為 object，缺值統一為 np.nan (SimpleImputer 無法比較 pd.NA)。"""
+    X = X if isinstance(X, pd.DataFrame) else pd.DataFrame(X)
+    return X.astype(object).where(X.notna(), np.nan)
+
+
+def _is_id_like(name, column: pd.Series, n_rows: int) -> bool:
+    if n_rows < MIN_ROWS_FOR_ID_CHECK:
+        return False
+    values = column.dropna()
+    n_unique = values.nunique()
+    if n_unique < ID_UNIQUE_RATIO * n_rows:
+        return False
+    if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+        if not np.all(np.mod(values.to_numpy(dtype=float), 1) == 0):
+            return False
+        # 名稱像 ID，或是連號的列索引
+        ordered = np.sort(values.to_numpy())
+        consecutive = n_unique == len(values) and len(ordered) > 1 and np.all(np.diff(ordered) == 1)
+        return bool(_ID_NAME_RE.search(str(name))) or bool(consecutive)
+    # 幾乎每列都不同的文字欄位 (姓名、UUID、自由文字)
+    return True
+
+
+def plan_columns(X: pd.DataFrame) -> dict:
+    """回傳 {欄位: 策略}，策略為 drop / numeric / onehot / ordinal / frequency / target。"""
+    n_rows = len(X)
+    plan = {}
+    numeric = set(X.select_dtypes(include='number').columns)
+    categorical = set(X.select_dtypes(include=['object', 'string', 'category']).columns)
+    for name in X.columns:
+        if name not in numeric and name not in categorical:
+            continue
+        column = X[name]
+        if _is_id_like(name, column, n_rows):
+            plan[name] = "drop"
+        elif name in numeric:
+            plan[name] = "numeric"
+        elif isinstance(column.dtype, pd.CategoricalDtype) and column.dtype.ordered:
+            plan[name] = "ordinal"
+        else:
+            n_unique = column.nunique()
+            if n_unique <= ONEHOT_MAX_CATEGORIES:
+                plan[name] = "onehot"
+            elif n_unique > FREQUENCY_RATIO * n_rows:
+                plan[name] = "frequency"
+            else:
+                plan[name] = "target"
+    return plan
+
+
+def build_preprocessor(X: pd.DataFrame, task: str = "classification") -> tuple:
+    """
+    依 plan_columns(X) 建立 (未 fit 的) ColumnTransformer。
+
+    Returns:
+        (preprocessor, plan)；plan 中為 drop 的欄位不會出現在轉換後的矩陣中。
+    """
+    plan = plan_columns(X)
+
+    def columns(strategy: str) -> list:
+        return [name for name, s in plan.items() if s == strategy]
+
+    transformers = [
+        ('num', Pipeline(steps=[
+            ('imputer', SimpleImputer(strategy='median')),
+            ('scaler', StandardScaler()),
+        ]), columns("numeric")),
+        ('cat', Pipeline(steps=[
+            ('as_object', FunctionTransformer(_as_object, feature_names_out='one-to-one')),
+            ('imputer', SimpleImputer(strategy='constant', fill_value='missing')),
+            ('onehot', OneHotEncoder(handle_unknown='ignore')),
+        ]), columns("onehot")),
+        ('ord', OrdinalEncoder(
+            categories=[list(X[name].dtype.categories) for name in columns("ordinal")],
+            handle_unknown='use_encoded_value', unknown_value=-1, encoded_missing_value=-1,
+        ), columns("ordinal")),
+        ('freq', FrequencyEncoder(), columns("frequency")),
+        ('target', Pipeline(steps=[
+            ('as_object', FunctionTransformer(_as_object, feature_names_out='one-to-one')),
+            ('imputer', SimpleImputer(strategy='constant', fill_value='missing')),
+            # 迴歸目標可能是整數，明確指定避免被推斷為多類別
+            ('encoder', TargetEncoder(target_type="continuous" if task == "regression" else "auto")),
+            ('scaler', StandardScaler()),
+        ]), columns("target")),
+    ]
+    preprocessor = ColumnTransformer(transformers=[t for t in transformers if t[2]])
+    return preprocessor, plan
@@ -0,0 +1,92 @@
+"""
+候選模型的評估策略 (SuccessiveHalvingSearch 使用)。
+
+兩種策略的驗證資料都取自訓練列本身；測試集只用來回報最終指標，不參與選模型
+(在測試集上排名與晉級會讓回報的測試分數過於樂觀)。
+
+- HoldoutEvaluator: 從訓練列切出 HOLDOUT_FRACTION 作為驗證集，每個候選只需訓練一次 (大型資料)。
+- CrossValidationEvaluator: k-fold 交叉驗證，每個 fold 是獨立的排程工作，可平行執行；
+  小資料上單一切分的分數雜訊很大 (例如 Titanic)，以多個 fold 的平均選模型較可靠。
+
+兩者都在選出最佳設定後以完整的訓練列重新訓練一次。
+
+交叉驗證時 fold 陸續完成，can_beat() 以「剩餘 fold 都拿到最高分」的樂觀上界與同一輪目前最佳
+(incumbent) 的平均分數比較，已不可能勝出的候選會被提前中止，其餘 fold 不再執行。
+
+choose_evaluator() 依訓練列數選擇：超過 AUTOML_CV_MAX_ROWS 時改用 holdout。
+"""
+import os
+
+import numpy as np
+from sklearn.model_selection import KFold, StratifiedKFold, train_test_split
+
+CV_FOLDS = int(os.environ.get("AUTOML_CV_FOLDS", "5"))
+CV_MAX_ROWS = int(os.environ.get("AUTOML_CV_MAX_ROWS", "20000"))
+HOLDOUT_FRACTION = float(os.environ.get("AUTOML_HOLDOUT_FRACTION", "0.2"))
+
+
+class HoldoutEvaluator:
+    name = "holdout"
+    # 候選模型只在切出驗證集後剩下的列上訓練；選出最佳設定後以完整的訓練列重新訓練
+    refit = True
+    refit_reserve = 0.15
+
+    def __init__(self, validation_fraction: float = HOLDOUT_FRACTION, stratify: bool = True,
+                 random_state: int = 42):
+        self.validation_fraction = validation_fraction
+        self.stratify = stratify
+        self.random_state = random_state
+
+    def splits(self, rows, y) -> list:
+        """回傳 [(train_rows, val_rows)]：驗證集取自訓練列 (分類時盡量分層抽樣)。"""
+        y_rows = np.asarray(y)[rows]
+        try:
+            train, val = train_test_split(rows, test_size=self.validation_fraction, random_state=self.random_state,
+                                          stratify=y_rows if self.stratify else None)
+        except ValueError:
+            # 某些類別太少無法分層
+            train, val = train_test_split(rows, test_size=self.validation_fraction, random_state=self.random_state)
+        return [(np.sort(train), np.sort(val))]
+
+
+class CrossValidationEvaluator:
+    # 選出最佳設定後以完整的訓練列重新訓練一次；搜尋保留此比例的剩餘時間給重新訓練
+    refit = True
+    refit_reserve = 0.15
+
+    def __init__(self, n_splits: int = CV_FOLDS, stratify: bool = True, random_state: int = 42):
+        self.n_splits = n_splits
+        self.stratify = stratify
+        self.random_state = random_state
+
+    @property
+    def name(self) -> str:
+        return f"cv-{self.n_splits}"
+
+    def splits(self, rows, y) -> list:
+        """回傳 [(train_rows, val_rows), ...]：驗證 fold 取自訓練列本身。"""
+        if len(rows) < 2 * self.n_splits:
+            # 列數太少無法切成 k 個 fold，改從訓練列切出單一驗證集
+            return HoldoutEvaluator(stratify=self.stratify, random_state=self.random_state).splits(rows, y)
+        y_rows = np.asarray(y)[rows]
+        _, counts = np.unique(y_rows, return_counts=True)
+        if self.stratify and counts.min() >= self.n_splits:
+            splitter = StratifiedKFold(self.n_splits, shuffle=True, random_state=self.random_state)
+        else:
+            splitter = KFold(self.n_splits, shuffle=True, random_state=self.random_state)
+        return [(rows[train], rows[val]) for train, val in splitter.split(np.zeros(len(rows)), y_rows)]
+
+
+def can_beat(fold_scores: list, n_folds: int, incumbent, max_score: float = 1.0) -> bool:
+    """剩餘 fold 都拿到 max_score 時，平均分數是否仍可能超過 incumbent。"""
+    if incumbent is None:
+        return True
+    bound = (sum(fold_scores) + (n_folds - len(fold_scores)) * max_score) / n_folds
+    return bound > incumbent
+
+
+def choose_evaluator(n_rows: int, cv_folds: int = CV_FOLDS, max_rows: int = CV_MAX_ROWS, stratify: bool = True):
+    """小資料使用 k-fold 交叉驗證，大資料 (或 cv_folds < 2) 使用 holdout。"""
+    if not cv_folds or cv_folds < 2 or n_rows > max_rows:
+        return HoldoutEvaluator(stratify=stratify)
+    return CrossValidationEvaluator(cv_folds, stratify=stratify)
@@ -0,0 +1,179 @@
+"""
+非同步 AutoML 工作 API。
+
+訓練工作提交到 automl_pool 後立即回傳 job ID，不會佔住 LangGraph 的工具執行緒。
+工作狀態保存在本地工作目錄 (AUTOML_JOB_DIR，預設 .automl_jobs/)：
+
+    <job_id>/job.json          狀態、參數與最終結果 (feature importance / classification report 稍後補上)
+    <job_id>/leaderboard.json  已完成的候選模型 (部分結果)
+    <job_id>/cancel            取消標記，工作程序在每個候選模型之間檢查
+"""
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+import automl_pool
+
+JOB_DIR = os.environ.get("AUTOML_JOB_DIR", ".automl_jobs")
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINAL_STATES = (COMPLETED, FAILED, CANCELLED)
+
+# submit_job 產生的 job ID 格式 (uuid4 hex 前 12 碼)；ID 來自 LLM 的工具參數，必須先驗證才能組成路徑
+_JOB_ID_RE = re.compile(r"[0-9a-f]{12}")
+
+# 本程序提交的工作 (用於取消尚未開始的工作)
+_futures = {}
+_futures_lock = threading.Lock()
+
+
+def is_valid_job_id(job_id) -> bool:
+    return isinstance(job_id, str) and _JOB_ID_RE.fullmatch(job_id) is not None
+
+
+def _job_path(job_dir: str, job_id: str, name: str) -> str:
+    # 拒絕 "../.." 等格式不符的 ID，避免跳出工作目錄
+    if not is_valid_job_id(job_id):
+        raise ValueError(f"Invalid job ID: {job_id!r}")
+    return os.path.join(job_dir, job_id, name)
+
+
+def _write_json(path: str, data):
+    """原子寫入 JSON，避免讀取端看到寫到一半的檔案。"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, default=str)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str, default=None):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def _update_job(job_dir: str, job_id: str, **fields):
+    path = _job_path(job_dir, job_id, "job.json")
+    job = _read_json(path, {})
+    job.update(fields)
+    _write_json(path, job)
+    return job
+
+
+def run_job(job_dir: str, job_id: str, dataset_source: str, target_column: str, time_budget: int) -> dict:
+    """在 AutoML 工作程序中執行一個工作，並把進度寫回工作目錄。"""
+    from automl_v3_final import AutoMLEngine
+
+    cancel_path = _job_path(job_dir, job_id, "cancel")
+    leaderboard_path = _job_path(job_dir, job_id, "leaderboard.json")
+
+    if os.path.exists(cancel_path):
+        return _update_job(job_dir, job_id, status=CANCELLED, finished_at=time.time())
+    _update_job(job_dir, job_id, status=RUNNING, started_at=time.time())
+
+    leaderboard = []
+
+    def on_progress(entry: dict):
+        leaderboard.append(entry)
+        _write_json(leaderboard_path, leaderboard)
+
+    def should_stop() -> bool:
+        return os.path.exists(cancel_path)
+
+    try:
+        engine = AutoMLEngine(time_budget=time_budget, progress_callback=on_progress, should_stop=should_stop)
+        if dataset_source.startswith("openml:"):
+            result = engine.train_from_openml(int(dataset_source.split(":")[1]))
+        else:
+            result = engine.train_from_csv(dataset_source, target_column)
+    except Exception as e:
+        return _update_job(job_dir, job_id, status=FAILED, error=str(e), finished_at=time.time())
+
+    if should_stop():
+        return _update_job(job_dir, job_id, status=CANCELLED, finished_at=time.time())
+    if "error" in result:
+        return _update_job(job_dir, job_id, status=FAILED, error=result["error"], finished_at=time.time())
+    # 先以便宜的指標標記完成 (不等待背景計算)，
+    # feature importance / classification report 算好後再補進 job.json
+    _update_job(job_dir, job_id, status=COMPLETED, result=result.to_dict(extras=False), finished_at=time.time())
+    return _update_job(job_dir, job_id, result=result.to_dict())
+
+
+def submit_job(dataset_source: str, target_column: str = "target", time_budget: int = 20) -> str:
+    """提交訓練工作並立即回傳 job ID。"""
+    job_id = uuid.uuid4().hex[:12]
+    os.makedirs(os.path.join(JOB_DIR, job_id), exist_ok=True)
+    _write_json(_job_path(JOB_DIR, job_id, "job.json"), {
+        "job_id": job_id,
+        "status": QUEUED,
+        "dataset_source": dataset_source,
+        "target_column": target_column,
+        "time_budget": time_budget,
+        "submitted_at": time.time(),
+    })
+
+    future = automl_pool.submit(run_job, JOB_DIR, job_id, dataset_source, target_column, time_budget)
+    with _futures_lock:
+        _futures[job_id] = future
+
+    def _on_done(fut):
+        with _futures_lock:
+            _futures.pop(job_id, None)
+        # 工作程序崩潰時 run_job 無法自行記錄失敗
+        if not fut.cancelled() and fut.exception() is not None:
+            _update_job(JOB_DIR, job_id, status=FAILED, error=str(fut.exception()), finished_at=time.time())
+
+    future.add_done_callback(_on_done)
+    return job_id
+
+
+def get_job(job_id: str) -> dict:
+    """讀取工作狀態；找不到 (或 ID 格式不符) 時回傳 None。"""
+    if not is_valid_job_id(job_id):
+        return None
+    return _read_json(_job_path(JOB_DIR, job_id, "job.json"))
+
+
+def get_leaderboard(job_id: str) -> list:
+    """讀取目前已完成的候選模型 (依分數由高到低)。"""
+    if not is_valid_job_id(job_id):
+        return []
+    leaderboard = _read_json(_job_path(JOB_DIR, job_id, "leaderboard.json"), [])
+    return sorted(leaderboard, key=lambda entry: entry.get("score", 0), reverse=True)
+
+
+def cancel_job(job_id: str) -> dict:
+    """取消工作：尚未開始的直接取消，執行中的在下一個候選模型前停止。"""
+    job = get_job(job_id)
+    if job is None or job.get("status") in FINAL_STATES:
+        return job
+
+    with open(_job_path(JOB_DIR, job_id, "cancel"), "w") as f:
+        f.write(str(time.time()))
+
+    with _futures_lock:
+        future = _futures.get(job_id)
+    if future is not None and future.cancel():
+        return _update_job(JOB_DIR, job_id, status=CANCELLED, finished_at=time.time())
+    return get_job(job_id)
+
+
+def wait_for_job(job_id: str, timeout: float = None, poll_interval: float = 0.2) -> dict:
+    """輪詢直到工作結束 (或逾時)，回傳最後的狀態。"""
+    deadline = None if timeout is None else time.time() + timeout
+    while True:
+        job = get_job(job_id)
+        if job is None or job.get("status") in FINAL_STATES:
+            return job
+        if deadline is not None and time.time() >= deadline:
+            return job
+        time.sleep(poll_interval)
@@ -0,0 +1,106 @@
+"""
+AutoML 常駐工作程序池。
+
+工作程序在啟動時預先匯入 automl_v3_final (sklearn / pandas / openml)，
+之後的訓練工作不需再付出匯入成本，並且在獨立程序中執行，不受 GIL 限制。
+
+開發模式 (AUTOML_DEV_RELOAD=1) 下，若 automl_v3_final.py 的修改時間改變，
+會回收整個程序池，讓新的工作程序重新匯入最新程式碼。
+
+工作程序由 forkserver 建立 (見 automl_scheduler.mp_context)，不繼承主程序的模組狀態，
+模型登錄與資料集快取目錄在建立程序池時傳入。
+"""
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+AUTOML_MODULE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "automl_v3_final.py")
+MAX_WORKERS = int(os.environ.get("AUTOML_MAX_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+DEV_RELOAD = os.environ.get("AUTOML_DEV_RELOAD", "0") == "1"
+
+_pool = None
+_pool_mtime = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker(registry_dir: str = None, cache_dir: str = None):
+    """工作程序初始化：套用主程序的目錄設定並預先匯入 AutoML 模組。"""
+    import dataset_cache
+    import model_registry
+    if registry_dir is not None:
+        model_registry.REGISTRY_DIR = registry_dir
+    if cache_dir is not None:
+        dataset_cache.CACHE_DIR = cache_dir
+    import automl_v3_final  # noqa: F401
+
+
+def run_training(dataset_source: str, target_column: str, time_budget: int = 20) -> dict:
+    """在工作程序中執行一次 AutoML 訓練，回傳結果 dict。"""
+    from automl_v3_final import AutoMLEngine
+
+    engine = AutoMLEngine(time_budget=time_budget)
+    if dataset_source.startswith("openml:"):
+        ds_id = int(dataset_source.split(":")[1])
+        result = engine.train_from_openml(ds_id)
+    else:
+        result = engine.train_from_csv(dataset_source, target_column)
+    # 包含 feature importance / classification report 的完整結果 (等待背景計算)
+    return result if "error" in result else result.to_dict()
+
+
+def _module_mtime():
+    try:
+        return os.path.getmtime(AUTOML_MODULE_PATH)
+    except OSError:
+        return None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """取得 (必要時建立) 共用的 AutoML 程序池。"""
+    global _pool, _pool_mtime
+    with _pool_lock:
+        if _pool is not None and DEV_RELOAD:
+            mtime = _module_mtime()
+            if mtime != _pool_mtime:
+                print("♻️ automl_v3_final.py changed, recycling AutoML workers...")
+                _pool.shutdown(wait=False, cancel_futures=False)
+                _pool = None
+
+        if _pool is None:
+            import dataset_cache
+            import model_registry
+            from automl_scheduler import mp_context
+            _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=mp_context(), initializer=_init_worker,
+                                        initargs=(model_registry.REGISTRY_DIR, dataset_cache.CACHE_DIR))
+            _pool_mtime = _module_mtime()
+        return _pool
+
+
+def submit(fn, *args, **kwargs):
+    """提交工作到程序池；若程序池已損毀 (工作程序崩潰) 則重建一次。"""
+    global _pool
+    try:
+        return get_pool().submit(fn, *args, **kwargs)
+    except BrokenProcessPool:
+        with _pool_lock:
+            _pool = None
+        return get_pool().submit(fn, *args, **kwargs)
+
+
+def submit_training(dataset_source: str, target_column: str, time_budget: int = 20):
+    """提交訓練工作，回傳 concurrent.futures.Future。"""
+    return submit(run_training, dataset_source, target_column, time_budget)
+
+
+def shutdown_pool(wait: bool = True):
+    """關閉程序池 (程式結束或測試清理時使用)。"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown_pool, False)
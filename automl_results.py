@@ -0,0 +1,162 @@
+"""
+AutoML 訓練結果物件。
+
+選出最佳模型時就能得到的指標 (分類：準確率、precision / recall / F1、混淆矩陣；迴歸：R²、MAE、RMSE；
+模型 ID...) 直接存在物件上；
+較昂貴的附加資訊在第一次存取時才計算並快取：
+
+- feature_importance: 樹模型讀取 feature_importances_ (轉換後的特徵)；其他模型 (例如 LogisticRegression)
+  以測試集上的 permutation importance 計算原始欄位的重要性。
+- classification_report: 由保存的測試集標籤與預測產生 (僅分類)。
+
+start_background() 會在背景執行緒預先計算這些資訊；背景計算尚未完成時存取屬性會等待其結果。
+
+為了相容原本回傳 dict 的呼叫端，支援 result["key"]、"key" in result、result.get() 與 to_dict()
+(值為 None 的指標不列入；to_dict(extras=False) 只含便宜的欄位，不等待延遲欄位)。
+跨程序傳遞 (pickle) 時不帶模型與測試資料，延遲欄位只帶已經算好的值，不會為此觸發計算。
+"""
+import threading
+from dataclasses import dataclass, field, fields
+
+import numpy as np
+
+# permutation importance 的重複次數與最多使用的測試列數
+PERMUTATION_REPEATS = 5
+PERMUTATION_MAX_ROWS = 2000
+
+LAZY_KEYS = ("feature_importance", "classification_report")
+
+
+def _clean_feature_name(name) -> str:
+    # 去除 ColumnTransformer 的前綴 (例如 'num__', 'cat__') 讓名稱更乾淨
+    return str(name).split("__", 1)[-1]
+
+
+@dataclass(slots=True)
+class TrainingResult:
+    best_estimator: str
+    best_params: dict
+    task: str
+    # 選模型時的驗證分數 (交叉驗證為各 fold 平均；分類為 accuracy，迴歸為 R²) 與評估方式 ("cv-5" / "holdout")
+    validation_score: float
+    evaluation: str
+    training_duration: float
+    saved_model_path: str
+    model_id: str
+    trials: list
+    # 各欄位的前處理策略 (見 automl_encoding.py)
+    encoding: dict = None
+    # 分類指標 (測試集)
+    classes: list = None
+    test_accuracy: float = None
+    precision: float = None
+    recall: float = None
+    f1_score: float = None
+    confusion_matrix: list = None
+    # 迴歸指標 (測試集)
+    r2: float = None
+    mae: float = None
+    rmse: float = None
+    # 延遲計算所需的模型與測試資料 (不序列化)
+    _model: object = field(default=None, init=False, repr=False, compare=False)
+    _X_test: object = field(default=None, init=False, repr=False, compare=False)
+    _y_test: object = field(default=None, init=False, repr=False, compare=False)
+    _y_pred: object = field(default=None, init=False, repr=False, compare=False)
+    _feature_importance: dict = field(default=None, init=False, repr=False, compare=False)
+    _classification_report: dict = field(default=None, init=False, repr=False, compare=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False, compare=False)
+
+    def with_evaluation(self, model, X_test, y_test, y_pred) -> "TrainingResult":
+        """保存延遲計算所需的 Pipeline 與測試集 (原始欄位、編碼後標籤、預測)。"""
+        self._model, self._X_test, self._y_test, self._y_pred = model, X_test, y_test, y_pred
+        return self
+
+    def start_background(self) -> threading.Thread:
+        """在背景執行緒預先計算 feature_importance 與 classification_report。"""
+        def compute():
+            self.feature_importance
+            self.classification_report
+
+        thread = threading.Thread(target=compute, name=f"automl-extras-{self.model_id}", daemon=True)
+        thread.start()
+        return thread
+
+    @property
+    def feature_importance(self) -> dict:
+        with self._lock:
+            if self._feature_importance is None:
+                try:
+                    self._feature_importance = self._compute_feature_importance()
+                except Exception as e:
+                    print(f"Feature importance extraction failed: {e}")
+                    self._feature_importance = {}
+            return self._feature_importance
+
+    @property
+    def classification_report(self) -> dict:
+        with self._lock:
+            if self._classification_report is None:
+                if self._y_pred is None or self.task == "regression":
+                    return {}
+                from sklearn.metrics import classification_report
+                self._classification_report = classification_report(
+                    self._y_test, self._y_pred, output_dict=True, zero_division=0)
+            return self._classification_report
+
+    def _compute_feature_importance(self) -> dict:
+        if self._model is None:
+            return {}
+        preprocessor, estimator = self._model.steps[0][1], self._model.steps[-1][1]
+        if hasattr(estimator, "feature_importances_"):
+            names = [_clean_feature_name(name) for name in preprocessor.get_feature_names_out()]
+            importances = estimator.feature_importances_
+        else:
+            from sklearn.inspection import permutation_importance
+
+            X, y = self._X_test, np.asarray(self._y_test)
+            if len(X) > PERMUTATION_MAX_ROWS:
+                rows = np.random.RandomState(42).choice(len(X), PERMUTATION_MAX_ROWS, replace=False)
+                X, y = X.iloc[rows], y[rows]
+            scores = permutation_importance(self._model, X, y, n_repeats=PERMUTATION_REPEATS, random_state=42)
+            names, importances = [str(col) for col in X.columns], scores.importances_mean
+        if len(names) != len(importances):
+            return {}
+        return dict(sorted(((name, float(value)) for name, value in zip(names, importances)),
+                           key=lambda item: item[1], reverse=True))
+
+    # --- 與原本 dict 結果相容 ---
+
+    def keys(self) -> list:
+        keys = [f.name for f in fields(self) if not f.name.startswith("_") and getattr(self, f.name) is not None]
+        return keys + [key for key in LAZY_KEYS if key != "classification_report" or self.task != "regression"]
+
+    def __getitem__(self, key: str):
+        if key not in self.keys():
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key) -> bool:
+        return key in self.keys()
+
+    def get(self, key: str, default=None):
+        return self[key] if key in self else default
+
+    def to_dict(self, extras: bool = True) -> dict:
+        """可 JSON 序列化的 dict；extras=True 時包含延遲欄位 (會等待 / 觸發其計算)。"""
+        return {key: self[key] for key in self.keys() if extras or key not in LAZY_KEYS}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TrainingResult":
+        result = cls(**{f.name: data[f.name] for f in fields(cls) if f.init and f.name in data})
+        result._feature_importance = data.get("feature_importance") or {}
+        result._classification_report = data.get("classification_report") or {}
+        return result
+
+    def __reduce__(self):
+        # 跨程序傳遞 (例如 automl_pool) 時不帶模型與測試資料；延遲欄位只帶已算好的值
+        data = self.to_dict(extras=False)
+        if self._feature_importance is not None:
+            data["feature_importance"] = self._feature_importance
+        if self._classification_report is not None:
+            data["classification_report"] = self._classification_report
+        return TrainingResult.from_dict, (data,)
@@ -0,0 +1,249 @@
+"""
+預算感知的超參數搜尋 (Successive Halving)。
+
+每一輪 (rung) 以部分訓練樣本與縮減的 n_estimators 評估所有存活的設定，
+只把前 1/eta 晉級到下一輪，最後一輪使用完整資源。
+同一輪內的設定依預估成本由低到高排程，並共用 AutoMLEngine 的硬性截止時間。
+每個設定以 evaluator (automl_evaluation.py) 在訓練列切出的驗證資料上評分：holdout 為單一工作；
+交叉驗證時每個 fold 是一個工作，已不可能勝過本輪最佳的設定會被提前中止。搜尋不會看到測試集。
+"""
+import time
+
+import numpy as np
+from sklearn.ensemble import (GradientBoostingClassifier, GradientBoostingRegressor, RandomForestClassifier,
+                              RandomForestRegressor)
+from sklearn.linear_model import LogisticRegression, Ridge
+
+from automl_evaluation import HoldoutEvaluator, can_beat
+from automl_scheduler import run_with_deadline, default_n_jobs, OK, TIMEOUT, CANCELLED, ABORTED
+
+CLASSIFICATION = "classification"
+REGRESSION = "regression"
+
+# 各模型家族的預設設定 (與原本固定三模型相同，永遠作為第一批候選)
+DEFAULT_CONFIGS = [
+    ("RandomForest", {"n_estimators": 100}),
+    ("GradientBoosting", {"n_estimators": 100}),
+    ("LogisticRegression", {"C": 1.0}),
+]
+# 迴歸任務：樹模型家族相同 (改用 Regressor)，線性模型改為 Ridge
+REGRESSION_DEFAULT_CONFIGS = [
+    ("RandomForest", {"n_estimators": 100}),
+    ("GradientBoosting", {"n_estimators": 100}),
+    ("Ridge", {"alpha": 1.0}),
+]
+
+# 具有 n_estimators 的家族會在低資源輪次按比例縮減樹的數量
+ENSEMBLE_FAMILIES = ("RandomForest", "GradientBoosting")
+MIN_ESTIMATORS = 10
+
+
+def sample_config(family: str, rng: np.random.RandomState) -> dict:
+    """從搜尋空間隨機抽樣一組超參數。"""
+    if family == "RandomForest":
+        return {
+            "n_estimators": int(rng.choice([50, 100, 200, 300])),
+            "max_depth": [None, 4, 8, 16][rng.randint(4)],
+            "min_samples_leaf": int(rng.choice([1, 2, 4, 8])),
+            "max_features": ["sqrt", "log2", None][rng.randint(3)],
+        }
+    if family == "GradientBoosting":
+        return {
+            "n_estimators": int(rng.choice([50, 100, 200])),
+            "learning_rate": float(10 ** rng.uniform(-2, -0.5)),
+            "max_depth": int(rng.choice([2, 3, 4, 5])),
+            "subsample": float(rng.uniform(0.6, 1.0)),
+        }
+    if family == "Ridge":
+        return {"alpha": float(10 ** rng.uniform(-3, 2))}
+    return {"C": float(10 ** rng.uniform(-3, 2))}
+
+
+def build_estimator(family: str, params: dict, n_jobs: int = 1, task: str = CLASSIFICATION):
+    """依家族名稱、任務與超參數建立 sklearn 估計器。"""
+    regression = task == REGRESSION
+    if family == "RandomForest":
+        cls = RandomForestRegressor if regression else RandomForestClassifier
+        return cls(n_jobs=n_jobs, random_state=42, **params)
+    if family == "GradientBoosting":
+        cls = GradientBoostingRegressor if regression else GradientBoostingClassifier
+        return cls(random_state=42, **params)
+    if family == "Ridge":
+        return Ridge(**params)
+    return LogisticRegression(max_iter=1000, **params)
+
+
+def estimate_cost(family: str, params: dict, n_samples: int) -> float:
+    """粗略的相對訓練成本，用來決定同一輪內的排程順序。"""
+    if family == "RandomForest":
+        depth = params.get("max_depth") or 20
+        return params.get("n_estimators", 100) * n_samples * depth / 10
+    if family == "GradientBoosting":
+        return params.get("n_estimators", 100) * n_samples * params.get("max_depth", 3) * params.get("subsample", 1.0)
+    return n_samples * 5
+
+
+def scale_params(family: str, params: dict, fraction: float) -> dict:
+    """在低資源輪次按比例縮減 n_estimators。"""
+    if family not in ENSEMBLE_FAMILIES or fraction >= 1.0:
+        return dict(params)
+    scaled = dict(params)
+    scaled["n_estimators"] = max(MIN_ESTIMATORS, int(round(params.get("n_estimators", 100) * fraction)))
+    return scaled
+
+
+def _run_trial(family, params, n_jobs, task, X, y, train_rows, val_rows):
+    """
+    在排程器子程序中以 X[train_rows] 訓練一組設定，並在 X[val_rows] 上評分。
+    分數為 estimator.score：分類為 accuracy，迴歸為 R²。
+    """
+    fit_start = time.time()
+    model = build_estimator(family, params, n_jobs=n_jobs, task=task)
+    model.fit(X[train_rows], y[train_rows])
+    score = model.score(X[val_rows], y[val_rows])
+    return score, model, time.time() - fit_start
+
+
+def _refit(family, params, n_jobs, task, X, y, rows):
+    """以完整的訓練列重新訓練選出的設定。"""
+    model = build_estimator(family, params, n_jobs=n_jobs, task=task)
+    return model.fit(X[rows], y[rows])
+
+
+class SuccessiveHalvingSearch:
+    def __init__(self, n_configs=27, eta=3, min_samples=100, n_jobs=None, random_state=42,
+                 should_stop=None, on_trial=None, evaluator=None, max_score=1.0, task=CLASSIFICATION):
+        self.task = task
+        self.default_configs = REGRESSION_DEFAULT_CONFIGS if task == REGRESSION else DEFAULT_CONFIGS
+        self.n_configs = max(len(self.default_configs), n_configs)
+        self.eta = eta
+        self.min_samples = min_samples
+        self.n_jobs = n_jobs or default_n_jobs()
+        self.random_state = random_state
+        self.should_stop = should_stop
+        # on_trial(entry: dict): 每個 trial 完成時呼叫
+        self.on_trial = on_trial
+        # 評估策略 (預設從訓練列切出 holdout 驗證集)；max_score 為分數上限，用於提前中止的上界
+        self.evaluator = evaluator or HoldoutEvaluator()
+        self.max_score = max_score
+        self.trials = []
+
+    def _schedule(self, n_samples: int) -> list:
+        """計算每一輪使用的樣本數，最後一輪為完整訓練集。"""
+        n_rungs = 1
+        while n_samples / self.eta ** n_rungs >= self.min_samples and self.eta ** n_rungs < self.n_configs:
+            n_rungs += 1
+        return [int(n_samples / self.eta ** (n_rungs - 1 - r)) for r in range(n_rungs)]
+
+    def _sample_configs(self) -> list:
+        rng = np.random.RandomState(self.random_state)
+        configs = list(self.default_configs)
+        families = [family for family, _ in self.default_configs]
+        while len(configs) < self.n_configs:
+            family = families[len(configs) % len(families)]
+            configs.append((family, sample_config(family, rng)))
+        return configs
+
+    def run(self, Xt_train, y_train, deadline: float):
+        """
+        執行搜尋直到完成或到達截止時間 (驗證資料由 evaluator 從 Xt_train 切出)。
+
+        Returns:
+            (family, params, fitted_model, score)；沒有任何 trial 完成時回傳 None。
+            score 為 evaluator 的驗證分數 (交叉驗證時為各 fold 的平均)。
+        """
+        y_train = np.asarray(y_train)
+        n_total = Xt_train.shape[0]
+        rung_samples = self._schedule(n_total)
+        # 固定一組隨機排列，各輪次使用巢狀的樣本子集
+        order = np.random.RandomState(self.random_state).permutation(n_total)
+        survivors = list(enumerate(self._sample_configs()))
+        best = None
+        # 需要重新訓練時保留部分時間
+        search_deadline = deadline - (deadline - time.time()) * self.evaluator.refit_reserve
+
+        for rung, n_samples in enumerate(rung_samples):
+            fraction = n_samples / n_total
+            rows = np.sort(order[:n_samples])
+            splits = self.evaluator.splits(rows, y_train)
+            n_folds = len(splits)
+            inner_jobs = max(1, default_n_jobs() // min(self.n_jobs, len(survivors) * n_folds))
+
+            # 成本感知排序：便宜的設定先跑，確保截止前有結果 (同一設定的 fold 排在一起)
+            survivors.sort(key=lambda item: estimate_cost(item[1][0], item[1][1], n_samples))
+            configs = dict(survivors)
+            scaled = {cid: scale_params(family, params, fraction) for cid, (family, params) in survivors}
+            tasks = [
+                ((cid, fold), _run_trial, (family, scaled[cid], inner_jobs, self.task, Xt_train, y_train, *split))
+                for cid, (family, params) in survivors
+                for fold, split in enumerate(splits)
+            ]
+
+            fold_results = {cid: [] for cid in configs}
+            rung_scores = {}
+            interrupted = []
+            finished = set()
+
+            def log(cid, status, rung=rung, n_samples=n_samples, scaled=scaled, **fields):
+                finished.add(cid)
+                entry = {"trial": cid, "model": configs[cid][0], "params": scaled[cid], "rung": rung,
+                         "n_samples": n_samples, "status": status}
+                results = fold_results[cid]
+                if results:
+                    entry.update(score=float(np.mean([r[0] for r in results])),
+                                 fit_time=sum(r[2] for r in results))
+                    if n_folds > 1:
+                        entry.update(folds=len(results), fold_scores=[r[0] for r in results])
+                entry.update(fields)
+                if status == OK and self.on_trial:
+                    self.on_trial(entry)
+                self.trials.append(entry)
+
+            def on_result(key, status, value):
+                cid, _ = key
+                if cid in finished:
+                    return
+                if status == OK:
+                    fold_results[cid].append(value)
+                    scores = [r[0] for r in fold_results[cid]]
+                    incumbent = max((score for score, _ in rung_scores.values()), default=None)
+                    if len(scores) == n_folds:
+                        # 保留分數最高的 fold 模型 (重新訓練失敗時使用)
+                        rung_scores[cid] = (float(np.mean(scores)), max(fold_results[cid], key=lambda r: r[0])[1])
+                        log(cid, OK)
+                    elif not can_beat(scores, n_folds, incumbent, self.max_score):
+                        log(cid, ABORTED, incumbent=incumbent)
+                elif status in (TIMEOUT, CANCELLED):
+                    interrupted.append(cid)
+                    log(cid, status)
+                elif status != ABORTED:
+                    log(cid, status, error=value)
+
+            run_with_deadline(tasks, deadline=search_deadline, n_jobs=self.n_jobs,
+                              should_stop=self.should_stop, on_result=on_result,
+                              should_cancel=lambda key: key[0] in finished)
+
+            if not rung_scores:
+                break
+
+            # 取本輪最佳 (同分時保留編號較小的設定，即預設設定優先)；較高輪次的結果優先於較低輪次
+            ranked = sorted(rung_scores.items(), key=lambda item: (-item[1][0], item[0]))
+            top_cid, (top_score, top_model) = ranked[0]
+            best = (configs[top_cid][0], scaled[top_cid], top_model, top_score, rows)
+
+            if interrupted or rung == len(rung_samples) - 1:
+                # 有 trial 被截止時間或取消中斷，不再晉級
+                break
+            keep = max(1, len(survivors) // self.eta)
+            promoted = {cid for cid, _ in ranked[:keep]}
+            survivors = [item for item in survivors if item[0] in promoted]
+
+        if best is None:
+            return None
+        family, params, model, score, rows = best
+        if self.evaluator.refit:
+            refit_task = ("refit", _refit, (family, params, default_n_jobs(), self.task, Xt_train, y_train, rows))
+            outcome = run_with_deadline([refit_task], deadline=deadline, should_stop=self.should_stop).get("refit")
+            if outcome and outcome[0] == OK:
+                model = outcome[1]
+        return family, params, model, score
@@ -1,49 +1,114 @@
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split, RandomizedSearchCV
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
-from sklearn.linear_model import LogisticRegression
-from sklearn.metrics import accuracy_score, classification_report
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import (accuracy_score, confusion_matrix, mean_absolute_error, mean_squared_error,
+                             precision_recall_fscore_support, r2_score)
 from sklearn.pipeline import Pipeline
-from sklearn.impute import SimpleImputer
-from sklearn.preprocessing import StandardScaler, OneHotEncoder, LabelEncoder
-from sklearn.compose import ColumnTransformer
+from sklearn.preprocessing import LabelEncoder
 import openml
+import functools
 import os
 import time
 
+import csv_ingest
+import dataset_cache
+import model_registry
+from automl_encoding import build_preprocessor
+from automl_evaluation import CV_FOLDS, choose_evaluator
+from automl_results import TrainingResult
+from automl_scheduler import default_n_jobs
+from automl_search import CLASSIFICATION, REGRESSION, SuccessiveHalvingSearch
+
+# 整數目標的不同值超過此數量時視為迴歸 (例如年齡、價格)，避免被當成上千個類別
+MAX_CLASSES = int(os.environ.get("AUTOML_MAX_CLASSES", "20"))
+
+
+def detect_task(y) -> str:
+    """
+    依目標欄位的 dtype 與基數判斷任務。
+
+    非數值 / 布林 / 二元目標為分類；數值目標含非整數值，或不同值超過 MAX_CLASSES 時為迴歸。
+    """
+    y = pd.Series(y).dropna()
+    if not pd.api.types.is_numeric_dtype(y) or pd.api.types.is_bool_dtype(y):
+        return CLASSIFICATION
+    n_unique = y.nunique()
+    if n_unique <= 2:
+        return CLASSIFICATION
+    if n_unique > MAX_CLASSES or not np.all(np.mod(y.to_numpy(dtype=float), 1) == 0):
+        return REGRESSION
+    return CLASSIFICATION
+
+
 class AutoMLEngine:
-    def __init__(self, time_budget=30, metric='accuracy', task='classification'):
+    def __init__(self, time_budget=30, metric='accuracy', task='auto',
+                 progress_callback=None, should_stop=None, n_jobs=None, n_configs=27,
+                 use_cache=True, background_extras=True, cv_folds=CV_FOLDS):
         self.time_budget = time_budget
+        # 回傳結果後在背景計算 feature importance / classification report (見 automl_results.py)
+        self.background_extras = background_extras
+        # 是否使用本地資料集快取 (dataset_cache)
+        self.use_cache = use_cache
+        # 同時訓練的候選設定數量 (預設為 CPU 核心數)
+        self.n_jobs = n_jobs or default_n_jobs()
+        # 超參數搜尋的初始設定數量 (Successive Halving 第一輪)
+        self.n_configs = n_configs
+        # 交叉驗證的 fold 數 (訓練列數超過 AUTOML_CV_MAX_ROWS 或設為 0 / 1 時改用 holdout)
+        self.cv_folds = cv_folds
+        self.best_params = {}
+        self.trials = []
+        # 註冊模型時使用的名稱 (train_from_csv / train_from_openml 會自動設定)
+        self.dataset_name = None
         self.metric = metric
+        # 'classification' / 'regression'；'auto' 時由 detect_task 依目標欄位判斷
         self.task = task
+        # progress_callback(entry: dict): 每個候選模型完成時呼叫 (供工作 API 回報部分結果)
+        # should_stop() -> bool: 回傳 True 時停止嘗試後續候選模型 (取消工作)
+        self.progress_callback = progress_callback
+        self.should_stop = should_stop
         self.best_model = None
         self.best_score = -1
         self.best_name = ""
         
     def train_from_openml(self, dataset_id: int):
-        """從 OpenML 下載資料集並進行訓練"""
-        print(f"📥 Downloading dataset ID {dataset_id} from OpenML...")
+        """從 OpenML 下載資料集並進行訓練 (已下載過的資料集直接從本地快取讀取)"""
+        print(f"📥 Loading dataset ID {dataset_id} from OpenML...")
+        self.dataset_name = f"openml-{dataset_id}"
         try:
-            dataset = openml.datasets.get_dataset(dataset_id)
-            X, y, categorical_indicator, attribute_names = dataset.get_data(
-                target=dataset.default_target_attribute, dataset_format="dataframe"
-            )
+            if self.use_cache:
+                X, y = dataset_cache.load_openml(dataset_id)
+            else:
+                dataset = openml.datasets.get_dataset(dataset_id)
+                X, y, categorical_indicator, attribute_names = dataset.get_data(
+                    target=dataset.default_target_attribute, dataset_format="dataframe"
+                )
             return self.train(X, y)
         except Exception as e:
             return {"error": f"OpenML Download Failed: {str(e)}"}
 
     def train_from_csv(self, file_path: str, target_column: str):
-        """從 CSV 檔案讀取資料並訓練"""
+        """從 CSV 檔案讀取資料並訓練 (內容相同的檔案只解析一次)"""
         if not os.path.exists(file_path):
             return {"error": f"File not found: {file_path}"}
+        self.dataset_name = os.path.splitext(os.path.basename(file_path))[0]
         try:    
-            df = pd.read_csv(file_path)
+            reader, variant = pd.read_csv, None
+            if os.path.getsize(file_path) > csv_ingest.STREAMING_THRESHOLD_BYTES:
+                # 大型檔案：分塊讀取、縮減 dtype，並抽樣到預算可負擔的列數
+                if target_column not in pd.read_csv(file_path, nrows=0).columns:
+                    return {"error": f"Target column '{target_column}' not found."}
+                row_cap = csv_ingest.row_cap_for_budget(self.time_budget)
+                print(f"🌊 Large CSV detected, streaming with row cap {row_cap}...")
+                reader = functools.partial(csv_ingest.read_csv_streaming, target_column=target_column, row_cap=row_cap)
+                variant = f"stream:{target_column}:{row_cap}"
+
+            df = dataset_cache.load_csv(file_path, reader=reader, variant=variant) if self.use_cache else reader(file_path)
             if target_column not in df.columns:
                 return {"error": f"Target column '{target_column}' not found."}
                 
-            X = df.drop(columns=[target_column])
-            y = df[target_column]
+            # 使用 pop 取出目標欄位，避免 drop 複製整個 DataFrame
+            y = df.pop(target_column)
+            X = df
             return self.train(X, y)
         except Exception as e:
             return {"error": f"CSV Read Failed: {str(e)}"}
@@ -52,124 +117,110 @@ class AutoMLEngine:
         """
         執行輕量級 AutoML 訓練流程 (Native Sklearn)
         """
-        # 手動處理缺值與類別特徵
-        numeric_features = X.select_dtypes(include=['int64', 'float64']).columns
-        categorical_features = X.select_dtypes(include=['object', 'category']).columns
-
-        numeric_transformer = Pipeline(steps=[
-            ('imputer', SimpleImputer(strategy='median')),
-            ('scaler', StandardScaler())
-        ])
-
-        categorical_transformer = Pipeline(steps=[
-            ('imputer', SimpleImputer(strategy='constant', fill_value='missing')),
-            ('onehot', OneHotEncoder(handle_unknown='ignore'))
-        ])
-
-        preprocessor = ColumnTransformer(
-            transformers=[
-                ('num', numeric_transformer, numeric_features),
-                ('cat', categorical_transformer, categorical_features)
-            ])
-
-        # 定義候選模型
-        models = [
-            ("RandomForest", RandomForestClassifier(n_jobs=-1, random_state=42)),
-            ("GradientBoosting", GradientBoostingClassifier(random_state=42)),
-            ("LogisticRegression", LogisticRegression(max_iter=1000))
-        ]
-
-        # Encoding Target Variable if needed (e.g. for strings '0', '1' or 'died', 'survived')
-        le = LabelEncoder()
-        y = le.fit_transform(y)
+        # 目標為缺值的列無法用於訓練或評分
+        target_known = pd.notna(pd.Series(y)).to_numpy()
+        if not target_known.all():
+            X, y = X[target_known], y[target_known]
+
+        task = detect_task(y) if self.task not in (CLASSIFICATION, REGRESSION) else self.task
+        if task == REGRESSION:
+            classes = None
+            y = pd.to_numeric(pd.Series(y)).to_numpy(dtype=float)
+        else:
+            # Encoding Target Variable if needed (e.g. for strings '0', '1' or 'died', 'survived')
+            le = LabelEncoder()
+            y = le.fit_transform(y)
+            classes = le.classes_.tolist()
 
         X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
         
-        print(f"🚀 Starting AutoML training (Budget: {self.time_budget}s)...")
+        print(f"🚀 Starting AutoML {task} training (Budget: {self.time_budget}s, Workers: {self.n_jobs})...")
         start_time = time.time()
-        
-        results = []
-        
-        for name, model in models:
-            if time.time() - start_time > self.time_budget:
-                break
-                
-            pipe = Pipeline(steps=[('preprocessor', preprocessor), ('classifier', model)])
-            
-            try:
-                pipe.fit(X_train, y_train)
-                score = pipe.score(X_test, y_test)
-                results.append((name, score, pipe))
-                
-                if score > self.best_score:
-                    self.best_score = score
-                    self.best_model = pipe
-                    self.best_name = name
-            except Exception as e:
-                print(f"Model {name} failed: {e}")
 
-        if not self.best_model:
-            return {"error": "Training failed for all models."}
+        # 依訓練集的基數為每個欄位選擇編碼方式 (one-hot / ordinal / frequency / target)，並丟棄 ID-like 欄位
+        preprocessor, encoding = build_preprocessor(X_train, task)
+        dropped = [str(col) for col, strategy in encoding.items() if strategy == "drop"]
+        if dropped:
+            print(f"🧹 Dropping ID-like columns: {dropped}")
 
-        # 整理結果
-        y_pred = self.best_model.predict(X_test)
-        report = classification_report(y_test, y_pred, output_dict=True)
-        
-        # 計算額外指標
-        from sklearn.metrics import precision_score, recall_score, f1_score, confusion_matrix
-        
-        # 自動判斷 average 参数 (二元 vs 多類別)
-        avg_method = 'binary' if len(np.unique(y)) == 2 else 'weighted'
-        
-        precision = precision_score(y_test, y_pred, average=avg_method, zero_division=0)
-        recall = recall_score(y_test, y_pred, average=avg_method, zero_division=0)
-        f1 = f1_score(y_test, y_pred, average=avg_method, zero_division=0)
-        cm = confusion_matrix(y_test, y_pred).tolist()
+        # 前處理只在訓練集上 fit 一次，所有候選模型共用轉換後的矩陣
+        # (target encoding 需要 y；ColumnTransformer 在 one-hot 後夠稀疏時會回傳 sparse matrix)
+        Xt_train = preprocessor.fit_transform(X_train, y_train)
 
-        # 嘗試提取特徵重要性 (對於 Tree-based model)
-        feature_importance = {}
-        try:
-            regressor = self.best_model.named_steps['classifier']
-            preprocessor = self.best_model.named_steps['preprocessor']
-            
-            if hasattr(regressor, 'feature_importances_'):
-                importances = regressor.feature_importances_
-                
-                # 取得轉換後的特徵名稱
-                try:
-                    feature_names = preprocessor.get_feature_names_out()
-                except:
-                    # Fallback if get_feature_names_out fails
-                    feature_names = numeric_features.tolist() + [f"cat_{i}" for i in range(len(importances) - len(numeric_features))]
-                
-                # 確保長度一致
-                if len(feature_names) == len(importances):
-                    feature_importance = dict(zip(feature_names, importances))
-                    # 去除前綴 (例如 'num__', 'cat__') 讓名稱更乾淨
-                    clean_importance = {}
-                    for k, v in feature_importance.items():
-                        clean_k = k.replace("num__", "").replace("cat__", "")
-                        clean_importance[clean_k] = v
-                    
-                    feature_importance = dict(sorted(clean_importance.items(), key=lambda item: item[1], reverse=True))
-        except Exception as e:
-            print(f"Feature importance extraction failed: {e}")
-            pass
+        # Successive Halving 超參數搜尋，所有 trial 共用同一個硬性截止時間；
+        # 驗證資料一律取自訓練列 (小資料 k-fold 交叉驗證，大資料 holdout)，搜尋不會看到測試集
+        evaluator = choose_evaluator(len(y_train), self.cv_folds, stratify=task == CLASSIFICATION)
+        search = SuccessiveHalvingSearch(
+            task=task,
+            n_configs=self.n_configs,
+            n_jobs=self.n_jobs,
+            should_stop=self.should_stop,
+            on_trial=self.progress_callback,
+            evaluator=evaluator,
+        )
+        best = search.run(Xt_train, y_train, deadline=start_time + self.time_budget)
+        self.trials = search.trials
+
+        best_estimator = None
+        if best is not None:
+            self.best_name, self.best_params, best_estimator, self.best_score = best
+            # 以已 fit 的前處理器與最佳模型組成可部署的 Pipeline
+            step = 'regressor' if task == REGRESSION else 'classifier'
+            self.best_model = Pipeline(steps=[('preprocessor', preprocessor), (step, best_estimator)])
+
+        if not self.best_model:
+            return {"error": "Training failed for all models."}
 
-        # 模型保存 (Deployment Ready)
-        import joblib
-        model_filename = f"best_model_{int(time.time())}.pkl"
-        joblib.dump(self.best_model, model_filename)
+        # 測試集只在選定模型後轉換一次，用來回報最終指標；只計算便宜的指標，
+        # feature importance 與 classification report 由 TrainingResult 在背景 / 第一次存取時計算
+        Xt_test = preprocessor.transform(X_test)
+        y_pred = best_estimator.predict(Xt_test)
+        if task == REGRESSION:
+            metrics = {
+                "r2": float(r2_score(y_test, y_pred)),
+                "mae": float(mean_absolute_error(y_test, y_pred)),
+                "rmse": float(np.sqrt(mean_squared_error(y_test, y_pred))),
+            }
+        else:
+            # 自動判斷 average 參數 (二元 vs 多類別)
+            avg_method = 'binary' if len(classes) == 2 else 'weighted'
+            precision, recall, f1, _ = precision_recall_fscore_support(
+                y_test, y_pred, average=avg_method, zero_division=0)
+            metrics = {
+                "test_accuracy": float(accuracy_score(y_test, y_pred)),
+                "precision": float(precision),
+                "recall": float(recall),
+                "f1_score": float(f1),
+                "confusion_matrix": confusion_matrix(y_test, y_pred).tolist(),
+            }
 
-        return {
+        # 模型保存到註冊表 (版本化，供 predict 工具直接載入)
+        model_meta = model_registry.register(self.best_model, self.dataset_name or "model", {
             "best_estimator": self.best_name,
-            "test_accuracy": self.best_score,
-            "precision": precision,
-            "recall": recall,
-            "f1_score": f1,
-            "confusion_matrix": cm,
-            "training_duration": time.time() - start_time,
-            "feature_importance": feature_importance,
-            "classification_report": str(report),
-            "saved_model_path": model_filename
-        }
+            "best_params": self.best_params,
+            "task": task,
+            "validation_score": self.best_score,
+            "evaluation": evaluator.name,
+            "classes": classes,
+            "encoding": {str(col): strategy for col, strategy in encoding.items()},
+            **{k: v for k, v in metrics.items() if k != "confusion_matrix"},
+            "feature_columns": [str(col) for col in X.columns],
+        })
+
+        result = TrainingResult(
+            best_estimator=self.best_name,
+            best_params=self.best_params,
+            task=task,
+            validation_score=float(self.best_score),
+            evaluation=evaluator.name,
+            training_duration=time.time() - start_time,
+            saved_model_path=model_meta["path"],
+            model_id=model_meta["model_id"],
+            trials=self.trials,
+            classes=classes,
+            encoding={str(col): strategy for col, strategy in encoding.items()},
+            **metrics,
+        ).with_evaluation(self.best_model, X_test, y_test, y_pred)
+        if self.background_extras:
+            result.start_background()
+        return result
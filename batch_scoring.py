@@ -0,0 +1,162 @@
+"""
+批次預測：以固定大小的 chunk 串流讀取 CSV，交給註冊表中的模型評分。
+
+- 同時處理中的 chunk 數量有上限，記憶體用量與檔案大小無關。
+- chunk 分散到多個工作程序平行評分，每個程序各自保留 mmap 載入的常駐模型；
+  工作程序池常駐於模組層級 (與 automl_pool 相同)，之後的批次預測直接使用已載入的模型。
+- 結果依原始順序逐塊寫入輸出檔。
+"""
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+import model_registry
+from automl_scheduler import mp_context
+
+CHUNK_SIZE = int(os.environ.get("BATCH_CHUNK_SIZE", "50000"))
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(n_workers: int) -> ProcessPoolExecutor:
+    """取得 (必要時建立) 共用的評分程序池；工作程序數改變時重建。"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None and _pool_workers != n_workers:
+            _pool.shutdown(wait=False, cancel_futures=False)
+            _pool = None
+        if _pool is None:
+            # forkserver 建立工作程序，不從有背景執行緒的主程序直接 fork
+            _pool = ProcessPoolExecutor(max_workers=n_workers, mp_context=mp_context())
+            _pool_workers = n_workers
+        return _pool
+
+
+def _submit(n_workers: int, fn, *args):
+    """提交到評分程序池；若程序池已損毀 (工作程序崩潰) 則重建一次。"""
+    global _pool
+    try:
+        return get_pool(n_workers).submit(fn, *args)
+    except BrokenProcessPool:
+        with _pool_lock:
+            _pool = None
+        return get_pool(n_workers).submit(fn, *args)
+
+
+def shutdown_pool(wait: bool = True):
+    """關閉評分程序池 (程式結束或測試清理時使用)。"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown_pool, False)
+
+
+def _score_chunk(model_id: str, chunk: pd.DataFrame, start_row: int, keep_columns: list,
+                 registry_dir: str = None) -> pd.DataFrame:
+    """評分單一 chunk (在工作程序中執行)。"""
+    if registry_dir is not None and registry_dir != model_registry.REGISTRY_DIR:
+        # 常駐的工作程序建立後註冊表目錄改變 (例如測試)，舊的常駐模型不再適用
+        model_registry.REGISTRY_DIR = registry_dir
+        model_registry.clear_warm_cache()
+    pipeline, meta = model_registry.load(model_id)
+    feature_columns = meta.get("feature_columns")
+    # 缺少的特徵欄位以缺值補上，交給 Pipeline 的 imputer 處理
+    X = chunk.reindex(columns=feature_columns) if feature_columns else chunk
+
+    out = pd.DataFrame({"row": np.arange(start_row, start_row + len(chunk))})
+    for col in keep_columns:
+        out[col] = chunk[col].to_numpy()
+
+    encoded = pipeline.predict(X)
+    classes = meta.get("classes")
+    out["prediction"] = np.asarray(classes, dtype=object)[encoded.astype(int)] if classes else encoded
+
+    if classes and hasattr(pipeline, "predict_proba"):
+        probabilities = pipeline.predict_proba(X)
+        for i, cls in enumerate(classes):
+            out[f"proba_{cls}"] = probabilities[:, i].astype("float32")
+    return out
+
+
+def default_output_path(input_path: str) -> str:
+    stem, _ = os.path.splitext(input_path)
+    return f"{stem}_predictions.csv"
+
+
+def score_csv(model_id: str, input_path: str, output_path: str = None, chunksize: int = None,
+              n_workers: int = None, keep_columns: list = None) -> dict:
+    """
+    以模型評分整個 CSV 檔案，將預測結果寫入 output_path。
+
+    Args:
+        model_id: 註冊表中的模型 ("name" 或 "name:vN")。
+        input_path: 輸入 CSV。
+        output_path: 輸出 CSV，預設為 <input>_predictions.csv。
+        chunksize: 每個 chunk 的列數。
+        n_workers: 平行評分的工作程序數量，預設為 CPU 核心數；1 表示在目前程序中執行。
+        keep_columns: 要原樣複製到輸出檔的欄位 (例如 ID 欄位)。
+
+    Returns:
+        dict: rows, seconds, rows_per_sec, output_path, model_id。
+    """
+    chunksize = chunksize or CHUNK_SIZE
+    n_workers = n_workers or os.cpu_count() or 1
+    output_path = output_path or default_output_path(input_path)
+    keep_columns = keep_columns or []
+    model_id = model_registry.get_metadata(model_id)["model_id"]  # 固定版本，避免評分途中換模型
+
+    start = time.time()
+    rows = 0
+    header = True
+
+    def write(result: pd.DataFrame):
+        nonlocal header, rows
+        result.to_csv(output_path, mode="w" if header else "a", header=header, index=False)
+        header = False
+        rows += len(result)
+
+    reader = pd.read_csv(input_path, chunksize=chunksize)
+    if n_workers == 1:
+        start_row = 0
+        for chunk in reader:
+            write(_score_chunk(model_id, chunk, start_row, keep_columns))
+            start_row += len(chunk)
+    else:
+        # 最多同時有 2 * n_workers 個 chunk 在處理中，讀取速度不會超前寫入太多
+        max_inflight = 2 * n_workers
+        inflight = deque()
+        start_row = 0
+        for chunk in reader:
+            inflight.append(_submit(n_workers, _score_chunk, model_id, chunk, start_row, keep_columns,
+                                    model_registry.REGISTRY_DIR))
+            start_row += len(chunk)
+            if len(inflight) >= max_inflight:
+                write(inflight.popleft().result())
+        while inflight:
+            write(inflight.popleft().result())
+
+    if header:
+        # 空檔案也輸出只有標題的結果
+        pd.DataFrame(columns=["row", "prediction"]).to_csv(output_path, index=False)
+
+    seconds = time.time() - start
+    return {
+        "model_id": model_id,
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_sec": rows / seconds if seconds > 0 else float(rows),
+        "output_path": output_path,
+    }
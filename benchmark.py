@@ -0,0 +1,482 @@
+"""
+效能基準測試 (CLI)。
+
+以本地的 OpenAI 相容 stub 伺服器 (可設定延遲與 token 速率) 驅動 agent_engine.app，量測：
+
+- startup:        新程序匯入 agent_engine 的時間 (python -X importtime)，並列出被提前載入的重量級模組
+- graph_overhead: LLM 幾乎零延遲時，每輪對話中 LLM 以外的時間 (圖、工具、checkpoint、HTTP 序列化)
+- latency:        各情境 (工具呼叫 / 純對話) 的端對端延遲分佈
+- concurrency:    不同同時請求數下的吞吐量與延遲
+- automl:         不同資料大小的 AutoML 訓練時間
+- memory:         各階段的程序記憶體 (RSS)
+
+結果寫成 JSON (benchmark_visualization.py 讀取並繪圖)，並可與先前的結果比較找出效能退步：
+
+    python benchmark.py --output benchmark_results.json
+    python benchmark.py --compare baseline.json --threshold 0.1
+    python benchmark.py --max-startup-ms 1500   # 匯入時間超過上限時以狀態碼 1 結束
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+STUB_MODEL = "stub-llm"
+
+# 這些模組只應在第一次使用時才載入 (見 tools.py / agent_engine._LAZY_IMPORTS)
+HEAVY_MODULES = ("langchain_openai", "openai", "langchain_community", "duckduckgo_search",
+                 "sklearn", "pandas", "openml", "numpy")
+
+SCENARIOS = {
+    # 兩次 LLM 呼叫 + 一次工具呼叫
+    "tool_call": "What is 100 * 200?",
+    # 一次 LLM 呼叫
+    "chat": "Give me a short overview of LangGraph.",
+}
+
+
+class StubLLMServer:
+    """
+    OpenAI 相容的 /v1/chat/completions stub 伺服器 (在背景執行緒中執行)。
+
+    - 使用者訊息含有 "a * b" 或 "a + b" 時回傳 multiply / add 的工具呼叫，收到工具結果後回答。
+    - 其他訊息回傳 completion_tokens 個 token 的文字。
+    - latency_ms 為第一個 token 之前的延遲，token_rate 為每秒產生的 token 數 (0 表示不限速)。
+    - 支援 stream=True (SSE) 與 stream_options.include_usage。
+    """
+
+    def __init__(self, latency_ms: float = 0, token_rate: float = 0, completion_tokens: int = 20,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.latency_ms = latency_ms
+        self.token_rate = token_rate
+        self.completion_tokens = completion_tokens
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reply(self, messages: list) -> tuple:
+        """依對話內容決定回應：(文字 token 列表, 工具呼叫或 None)。"""
+        last = messages[-1] if messages else {}
+        if last.get("role") == "tool":
+            return [f"The result is {last.get('content')}."], None
+        match = re.search(r"(-?\d+)\s*([*+])\s*(-?\d+)", str(last.get("content", "")))
+        if last.get("role") == "user" and match:
+            a, op, b = match.groups()
+            name = "multiply" if op == "*" else "add"
+            return [], {"id": f"call_{uuid.uuid4().hex[:8]}", "type": "function",
+                        "function": {"name": name, "arguments": json.dumps({"a": int(a), "b": int(b)})}}
+        return [f"token{i} " for i in range(self.completion_tokens)], None
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with stub._lock:
+                    stub.requests += 1
+                messages = body.get("messages", [])
+                tokens, tool_call = stub.reply(messages)
+                prompt_tokens = sum(len(str(m.get("content") or "")) for m in messages) // 4 + 1
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": max(1, len(tokens)),
+                         "total_tokens": prompt_tokens + max(1, len(tokens))}
+                base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()),
+                        "model": body.get("model", STUB_MODEL)}
+                finish_reason = "tool_calls" if tool_call else "stop"
+
+                time.sleep(stub.latency_ms / 1000)
+                if body.get("stream"):
+                    self._stream(base, tokens, tool_call, finish_reason, usage,
+                                 (body.get("stream_options") or {}).get("include_usage"))
+                    return
+
+                if stub.token_rate:
+                    time.sleep(len(tokens) / stub.token_rate)
+                message = {"role": "assistant", "content": "".join(tokens) or None}
+                if tool_call:
+                    message["tool_calls"] = [tool_call]
+                payload = json.dumps({**base, "object": "chat.completion", "usage": usage, "choices": [
+                    {"index": 0, "message": message, "finish_reason": finish_reason}
+                ]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self, base, tokens, tool_call, finish_reason, usage, include_usage):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+
+                def send(choices, **extra):
+                    chunk = {**base, "object": "chat.completion.chunk", "choices": choices, **extra}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+
+                send([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+                for token in tokens:
+                    if stub.token_rate:
+                        time.sleep(1 / stub.token_rate)
+                    send([{"index": 0, "delta": {"content": token}, "finish_reason": None}])
+                if tool_call:
+                    send([{"index": 0, "delta": {"tool_calls": [{"index": 0, **tool_call}]}, "finish_reason": None}])
+                send([{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+                if include_usage:
+                    send([], usage=usage)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def summarize(values_ms: list) -> dict:
+    """延遲分佈 (毫秒)。"""
+    if not values_ms:
+        return {"count": 0}
+    values = np.asarray(values_ms, dtype=float)
+    return {
+        "count": int(len(values)),
+        "mean_ms": float(values.mean()),
+        "min_ms": float(values.min()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+    }
+
+
+def _rss_mb() -> float:
+    from checkpointer import process_rss_bytes
+    return process_rss_bytes() / 1024 / 1024
+
+
+def _config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id, "provider": "cerebras", "model_name": STUB_MODEL}}
+
+
+def _run_turn(app, prompt: str) -> tuple:
+    """執行一輪對話，回傳 (thread_id, 秒數)。"""
+    from langchain_core.messages import HumanMessage
+
+    thread_id = f"bench-{uuid.uuid4().hex}"
+    start = time.perf_counter()
+    app.invoke({"messages": [HumanMessage(content=prompt)]}, _config(thread_id))
+    return thread_id, time.perf_counter() - start
+
+
+def bench_startup(module: str = "agent_engine", runs: int = 5) -> dict:
+    """
+    以新的 Python 程序 (python -X importtime) 量測匯入 module 的時間。
+
+    回傳匯入時間分佈、自身匯入時間最長的模組，以及被提前載入的 HEAVY_MODULES。
+    """
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, "CHECKPOINT_DB": ":memory:", "TELEMETRY_DIR": ""}
+    line_re = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+    import_ms, self_us, heavy = [], {}, set()
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=repo_dir,
+                              env=env, capture_output=True, text=True, check=True)
+        for line in proc.stderr.splitlines():
+            match = line_re.match(line)
+            if not match:
+                continue
+            name = match.group(4)
+            self_us[name] = self_us.get(name, 0) + int(match.group(1))
+            if name == module and len(match.group(3)) == 1:
+                import_ms.append(int(match.group(2)) / 1000)
+            if name.split(".")[0] in HEAVY_MODULES:
+                heavy.add(name.split(".")[0])
+    slowest = sorted(self_us.items(), key=lambda item: item[1], reverse=True)[:10]
+    return {
+        "module": module,
+        "import_ms": summarize(import_ms),
+        "slowest_modules": {name: us / runs / 1000 for name, us in slowest},
+        "heavy_modules": sorted(heavy),
+    }
+
+
+def bench_graph_overhead(app, server: StubLLMServer, n: int) -> dict:
+    """LLM 零延遲時，每輪對話扣除 LLM 呼叫時間後剩下的時間。"""
+    import telemetry
+
+    latency, rate = server.latency_ms, server.token_rate
+    server.latency_ms, server.token_rate = 0, 0
+    try:
+        _run_turn(app, SCENARIOS["tool_call"])  # 暖機 (建立用戶端與連線)
+        totals, overheads = [], []
+        for _ in range(n):
+            thread_id, seconds = _run_turn(app, SCENARIOS["tool_call"])
+            llm_ms = sum(e.get("llm_ms", 0) for e in telemetry.events("agent") if e.get("thread_id") == thread_id)
+            totals.append(seconds * 1000)
+            overheads.append(seconds * 1000 - llm_ms)
+    finally:
+        server.latency_ms, server.token_rate = latency, rate
+    return {"turn": summarize(totals), "overhead": summarize(overheads)}
+
+
+def bench_latency(app, n: int) -> dict:
+    """各情境循序執行 n 次的端對端延遲分佈。"""
+    return {
+        name: summarize([_run_turn(app, prompt)[1] * 1000 for _ in range(n)])
+        for name, prompt in SCENARIOS.items()
+    }
+
+
+def bench_concurrency(app, levels: list, n: int) -> list:
+    """以 app.ainvoke 同時執行 level 個請求 (共 n 個)，量測吞吐量與延遲。"""
+    from langchain_core.messages import HumanMessage
+
+    async def run_level(level: int):
+        semaphore = asyncio.Semaphore(level)
+        latencies = []
+
+        async def one():
+            async with semaphore:
+                start = time.perf_counter()
+                await app.ainvoke({"messages": [HumanMessage(content=SCENARIOS["tool_call"])]},
+                                  _config(f"bench-{uuid.uuid4().hex}"))
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(n)))
+        return time.perf_counter() - start, latencies
+
+    results = []
+    for level in levels:
+        seconds, latencies = asyncio.run(run_level(level))
+        results.append({"concurrency": level, "requests": n, "seconds": seconds,
+                        "throughput_rps": n / seconds if seconds else 0.0, **summarize(latencies)})
+    return results
+
+
+def bench_automl(sizes: list, time_budget: float, n_features: int = 20) -> list:
+    """以合成分類資料量測不同列數的 AutoML 訓練時間 (模型寫入暫存的註冊表目錄)。"""
+    import pandas as pd
+    from sklearn.datasets import make_classification
+
+    import model_registry
+    from automl_v3_final import AutoMLEngine
+
+    results = []
+    registry_dir = model_registry.REGISTRY_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        model_registry.REGISTRY_DIR = tmp
+        try:
+            for rows in sizes:
+                X, y = make_classification(n_samples=rows, n_features=n_features, n_informative=n_features // 2,
+                                           random_state=42)
+                X = pd.DataFrame(X, columns=[f"f{i}" for i in range(n_features)])
+                engine = AutoMLEngine(time_budget=time_budget)
+                engine.dataset_name = f"bench-{rows}"
+                rss_before = _rss_mb()
+                start = time.perf_counter()
+                result = engine.train(X, pd.Series(y))
+                seconds = time.perf_counter() - start
+                results.append({
+                    "rows": rows,
+                    "features": n_features,
+                    "seconds": seconds,
+                    "best_estimator": result.get("best_estimator"),
+                    "test_accuracy": result.get("test_accuracy"),
+                    "rss_delta_mb": _rss_mb() - rss_before,
+                })
+        finally:
+            model_registry.REGISTRY_DIR = registry_dir
+    return results
+
+
+def run_benchmarks(requests: int = 20, concurrency: list = (1, 2, 4, 8), latency_ms: float = 50,
+                   token_rate: float = 200, completion_tokens: int = 20, automl_sizes: list = (1000, 5000),
+                   automl_budget: float = 5, skip_automl: bool = False, startup_runs: int = 5) -> dict:
+    """執行所有基準測試並回傳結果 dict (startup_runs=0 時略過啟動時間量測)。"""
+    startup = bench_startup(runs=startup_runs) if startup_runs else {}
+    # 使用記憶體內的 checkpoint，效能紀錄只保存在記憶體中 (需在匯入 agent_engine 前設定)
+    os.environ.setdefault("CHECKPOINT_DB", ":memory:")
+    os.environ.setdefault("TELEMETRY_DIR", "")
+
+    memory = {"start_mb": _rss_mb()}
+    server = StubLLMServer(latency_ms=latency_ms, token_rate=token_rate, completion_tokens=completion_tokens).start()
+    previous = {k: os.environ.get(k) for k in ("LLM_BASE_URL", "CEREBRAS_API_KEY")}
+    os.environ["LLM_BASE_URL"] = server.url
+    os.environ["CEREBRAS_API_KEY"] = previous["CEREBRAS_API_KEY"] or "stub-key"
+    try:
+        import agent_engine
+
+        agent_engine.clear_model_cache()
+        results = {
+            "meta": {
+                "timestamp": time.time(),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "config": {
+                    "requests": requests, "concurrency": list(concurrency), "latency_ms": latency_ms,
+                    "token_rate": token_rate, "completion_tokens": completion_tokens,
+                    "automl_sizes": [] if skip_automl else list(automl_sizes), "automl_budget": automl_budget,
+                },
+            },
+            "startup": startup,
+            "graph_overhead": bench_graph_overhead(agent_engine.app, server, requests),
+            "latency": bench_latency(agent_engine.app, requests),
+            "concurrency": bench_concurrency(agent_engine.app, list(concurrency), requests),
+        }
+        memory["after_agent_mb"] = _rss_mb()
+        memory["checkpointer"] = agent_engine.memory.stats()
+        results["llm_requests"] = server.requests
+    finally:
+        server.stop()
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        if "agent_engine" in sys.modules:
+            sys.modules["agent_engine"].clear_model_cache()
+
+    results["automl"] = [] if skip_automl else bench_automl(list(automl_sizes), automl_budget)
+    memory["end_mb"] = _rss_mb()
+    results["memory"] = memory
+    return results
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.1) -> list:
+    """與先前的結果比較，回傳超過 threshold (比例) 的效能退步描述。"""
+    regressions = []
+
+    def check(label: str, old, new, higher_is_worse: bool = True):
+        if not old or new is None:
+            return
+        change = (new - old) / old if higher_is_worse else (old - new) / old
+        if change > threshold:
+            regressions.append(f"{label}: {old:.2f} -> {new:.2f} ({change:+.0%})")
+
+    check("startup.import_ms.p50_ms", baseline.get("startup", {}).get("import_ms", {}).get("p50_ms"),
+          current.get("startup", {}).get("import_ms", {}).get("p50_ms"))
+    for key in ("p50_ms", "p95_ms"):
+        check(f"graph_overhead.{key}", baseline.get("graph_overhead", {}).get("overhead", {}).get(key),
+              current.get("graph_overhead", {}).get("overhead", {}).get(key))
+        for scenario, stats in current.get("latency", {}).items():
+            check(f"latency.{scenario}.{key}", baseline.get("latency", {}).get(scenario, {}).get(key), stats.get(key))
+
+    old_levels = {r["concurrency"]: r for r in baseline.get("concurrency", [])}
+    for row in current.get("concurrency", []):
+        old = old_levels.get(row["concurrency"])
+        if old:
+            check(f"concurrency[{row['concurrency']}].throughput_rps", old.get("throughput_rps"),
+                  row.get("throughput_rps"), higher_is_worse=False)
+
+    old_sizes = {r["rows"]: r for r in baseline.get("automl", [])}
+    for row in current.get("automl", []):
+        old = old_sizes.get(row["rows"])
+        if old:
+            check(f"automl[{row['rows']}].seconds", old.get("seconds"), row.get("seconds"))
+    return regressions
+
+
+def _int_list(value: str) -> list:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the agent graph against a local stub LLM server.")
+    parser.add_argument("--requests", type=int, default=20, help="requests per scenario / concurrency level")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 2, 4, 8], help="e.g. 1,2,4,8")
+    parser.add_argument("--latency-ms", type=float, default=50, help="stub time to first token")
+    parser.add_argument("--token-rate", type=float, default=200, help="stub tokens per second (0 = unlimited)")
+    parser.add_argument("--completion-tokens", type=int, default=20)
+    parser.add_argument("--automl-sizes", type=_int_list, default=[1000, 5000], help="e.g. 1000,5000,20000")
+    parser.add_argument("--automl-budget", type=float, default=5, help="AutoML time budget (seconds)")
+    parser.add_argument("--skip-automl", action="store_true")
+    parser.add_argument("--startup-runs", type=int, default=5, help="fresh interpreters for the import benchmark")
+    parser.add_argument("--max-startup-ms", type=float,
+                        help="exit with status 1 when the p50 import time of agent_engine exceeds this")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="baseline results JSON; exit with status 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed regression ratio (0.1 = 10%%)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+        requests=args.requests, concurrency=args.concurrency, latency_ms=args.latency_ms,
+        token_rate=args.token_rate, completion_tokens=args.completion_tokens,
+        automl_sizes=args.automl_sizes, automl_budget=args.automl_budget, skip_automl=args.skip_automl,
+        startup_runs=args.startup_runs,
+    )
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    failed = False
+    if results["startup"]:
+        startup_ms = results["startup"]["import_ms"]["p50_ms"]
+        print(f"🚦 Startup: import agent_engine p50 {startup_ms:.0f}ms")
+        if results["startup"]["heavy_modules"]:
+            print(f"⚠️ Heavy modules imported at startup: {', '.join(results['startup']['heavy_modules'])}")
+        if args.max_startup_ms is not None and startup_ms > args.max_startup_ms:
+            print(f"⚠️ Regression: startup {startup_ms:.0f}ms exceeds {args.max_startup_ms:.0f}ms")
+            failed = True
+    overhead = results["graph_overhead"]["overhead"]
+    print(f"📊 Graph overhead per turn: p50 {overhead['p50_ms']:.1f}ms / p95 {overhead['p95_ms']:.1f}ms")
+    for scenario, stats in results["latency"].items():
+        print(f"⏱️ {scenario}: p50 {stats['p50_ms']:.1f}ms / p95 {stats['p95_ms']:.1f}ms / p99 {stats['p99_ms']:.1f}ms")
+    for row in results["concurrency"]:
+        print(f"🚀 concurrency {row['concurrency']}: {row['throughput_rps']:.1f} req/s, p95 {row['p95_ms']:.1f}ms")
+    for row in results["automl"]:
+        print(f"🤖 AutoML {row['rows']} rows: {row['seconds']:.2f}s ({row['best_estimator']})")
+    print(f"💾 Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        for line in regressions:
+            print(f"⚠️ Regression: {line}")
+        failed = failed or bool(regressions)
+    if failed:
+        return 1
+    if args.compare or args.max_startup_ms is not None:
+        print("✅ No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,35 +1,94 @@
-import matplotlib.pyplot as plt
-import numpy as np
+import json
+import sys
 
-def plot_benchmark_results():
+
+def load_results(path: str = "benchmark_results.json") -> dict:
+    """讀取 benchmark.py 產生的結果 JSON。"""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def plot_benchmark_results(results_path: str = "benchmark_results.json", output_path: str = None):
     """
-    請將此函式複製到您的 Google Colab Notebook 中執行以生成圖表。
-    此圖表視覺化了 vLLM 與 TGI 在不同模型下的吞吐量比較。
+    將 benchmark.py 的實測結果繪製成圖表。
+
+    先執行 `python benchmark.py --output benchmark_results.json`，再執行本檔案
+    (或在 Colab 中呼叫此函式)。指定 output_path 時存成圖檔，否則直接顯示。
+
+    四張子圖：端對端延遲分佈、同時請求數與吞吐量、AutoML 訓練時間與資料大小、各階段記憶體。
     """
-    
-    # 範例數據 (請替換為您實際跑出的數據)
-    frameworks = ['vLLM', 'HF TGI']
-    throughput = [1950, 1420]  # tokens/sec
-    
-    # 設定圖表樣式
-    plt.figure(figsize=(10, 6))
-    bars = plt.bar(frameworks, throughput, color=['#4CAF50', '#FF5722'])
-    
-    # 加入標籤
-    plt.title('Inference Throughput Comparison (Llama-3.2-1B)', fontsize=15)
-    plt.ylabel('Throughput (tokens/s)', fontsize=12)
-    plt.grid(axis='y', linestyle='--', alpha=0.7)
-    
-    # 在柱狀圖上方顯示數值
+    import matplotlib
+    if output_path:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    results = load_results(results_path)
+    fig, axes = plt.subplots(2, 2, figsize=(14, 10))
+    config = results.get("meta", {}).get("config", {})
+    fig.suptitle(f"Agent Benchmark (stub latency {config.get('latency_ms')}ms, "
+                 f"{config.get('token_rate')} tok/s)", fontsize=15)
+
+    # 1. 延遲分佈 (含 LLM 以外的圖開銷)
+    ax = axes[0][0]
+    latency = dict(results.get("latency", {}))
+    latency["graph overhead"] = results.get("graph_overhead", {}).get("overhead", {})
+    if results.get("startup"):
+        latency["startup import"] = results["startup"]["import_ms"]
+    names = list(latency)
+    for i, quantile in enumerate(["p50_ms", "p95_ms", "p99_ms"]):
+        values = [latency[name].get(quantile, 0) for name in names]
+        bars = ax.bar([x + i * 0.25 for x in range(len(names))], values, width=0.25, label=quantile[:-3])
+        for bar in bars:
+            ax.text(bar.get_x() + bar.get_width() / 2., bar.get_height(), f"{bar.get_height():.0f}",
+                    ha="center", va="bottom", fontsize=8)
+    ax.set_xticks([x + 0.25 for x in range(len(names))])
+    ax.set_xticklabels(names)
+    ax.set_title("End-to-end Latency")
+    ax.set_ylabel("Latency (ms)")
+    ax.legend()
+
+    # 2. 同時請求數 vs 吞吐量
+    ax = axes[0][1]
+    rows = results.get("concurrency", [])
+    levels = [r["concurrency"] for r in rows]
+    ax.plot(levels, [r["throughput_rps"] for r in rows], marker="o", color="#4CAF50", label="throughput")
+    ax.set_xlabel("Concurrent requests")
+    ax.set_ylabel("Throughput (req/s)")
+    ax.set_title("Concurrency Scaling")
+    ax2 = ax.twinx()
+    ax2.plot(levels, [r.get("p95_ms", 0) for r in rows], marker="s", linestyle="--", color="#FF5722", label="p95")
+    ax2.set_ylabel("p95 latency (ms)")
+
+    # 3. AutoML 訓練時間
+    ax = axes[1][0]
+    rows = results.get("automl", [])
+    if rows:
+        ax.plot([r["rows"] for r in rows], [r["seconds"] for r in rows], marker="o", color="#2196F3")
+        ax.set_xscale("log")
+    ax.set_xlabel("Rows")
+    ax.set_ylabel("Training time (s)")
+    ax.set_title("AutoML Training Time")
+
+    # 4. 記憶體
+    ax = axes[1][1]
+    memory = {k: v for k, v in results.get("memory", {}).items() if isinstance(v, (int, float))}
+    bars = ax.bar(list(memory), list(memory.values()), color="#9C27B0")
     for bar in bars:
-        height = bar.get_height()
-        plt.text(bar.get_x() + bar.get_width()/2., height,
-                f'{height}',
-                ha='center', va='bottom', fontsize=12, fontweight='bold')
-                
+        ax.text(bar.get_x() + bar.get_width() / 2., bar.get_height(), f"{bar.get_height():.0f}",
+                ha="center", va="bottom", fontsize=10)
+    ax.set_ylabel("RSS (MB)")
+    ax.set_title("Process Memory")
+
+    for ax in axes.flat:
+        ax.grid(axis="y", linestyle="--", alpha=0.7)
     plt.tight_layout()
+    if output_path:
+        plt.savefig(output_path)
+        plt.close(fig)
+        return output_path
     plt.show()
 
+
 if __name__ == "__main__":
-    print("請將此檔案內容或 plot_benchmark_results 函式複製到 Colab 中執行以查看圖表。")
-    plot_benchmark_results()
+    # 用法: python benchmark_visualization.py [benchmark_results.json] [output.png]
+    plot_benchmark_results(*sys.argv[1:3])
@@ -0,0 +1,372 @@
+"""
+以 SQLite 為後端、有容量上限的 LangGraph checkpointer (取代程序內的 MemorySaver)。
+
+- 對話狀態寫入磁碟 (WAL 模式)，重新啟動後仍在，多個 Streamlit 工作程序可共用同一個資料庫。
+- 序列化結果超過 COMPRESS_THRESHOLD 時以 zlib 壓縮。
+- 每個 thread 只保留最新 keep_checkpoints 個 checkpoint (訊息狀態完整存在最新的 checkpoint 中)。
+- 閒置超過 ttl_seconds 的 thread 會被刪除；thread 數超過 max_threads 時淘汰最久未使用者。
+"""
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+import zlib
+
+import telemetry
+
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+COMPRESS_THRESHOLD = 1024
+_COMPRESSED_PREFIX = "z:"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_threads_last_access ON threads (last_access);
+"""
+
+
+def process_rss_bytes() -> int:
+    """目前程序的常駐記憶體 (RSS)，無法取得時回傳 0。"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        # 非 Linux 平台退而使用尖峰 RSS (macOS 單位為 bytes，Linux 為 KB)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+    except (ImportError, AttributeError):
+        return 0
+
+
+class SqliteCheckpointer(BaseCheckpointSaver):
+    def __init__(self, path: str = ":memory:", *, ttl_seconds: float = 7 * 24 * 3600, max_threads: int = 1000,
+                 keep_checkpoints: int = 4, evict_interval: float = 60.0, serde=None):
+        super().__init__(serde=serde)
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_threads = max_threads
+        self.keep_checkpoints = max(1, keep_checkpoints)
+        self.evict_interval = evict_interval
+        self._last_evict = 0.0
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        if path != ":memory:":
+            # WAL 模式讓多個工作程序可同時讀取、依序寫入
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+
+    # ---- 序列化 ----
+
+    def _dumps(self, value) -> tuple:
+        type_, data = self.serde.dumps_typed(value)
+        if data is not None and len(data) > COMPRESS_THRESHOLD:
+            return _COMPRESSED_PREFIX + type_, zlib.compress(data, 1)
+        return type_, data
+
+    def _loads(self, type_: str, data: bytes):
+        if type_.startswith(_COMPRESSED_PREFIX):
+            type_, data = type_[len(_COMPRESSED_PREFIX):], zlib.decompress(data)
+        return self.serde.loads_typed((type_, data))
+
+    # ---- 內部工具 ----
+
+    def _touch(self, thread_id: str):
+        self.conn.execute(
+            "INSERT INTO threads (thread_id, last_access) VALUES (?, ?) "
+            "ON CONFLICT(thread_id) DO UPDATE SET last_access = excluded.last_access",
+            (thread_id, time.time()),
+        )
+
+    def _load_tuple(self, thread_id, checkpoint_ns, row) -> CheckpointTuple:
+        checkpoint_id, parent_id, type_, checkpoint_b, metadata_type, metadata_b = row
+        checkpoint = self._loads(type_, checkpoint_b)
+        channel_values = {}
+        for channel, version in checkpoint.get("channel_versions", {}).items():
+            blob = self.conn.execute(
+                "SELECT type, value FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(version)),
+            ).fetchone()
+            if blob is not None and blob[0] != "empty":
+                channel_values[channel] = self._loads(*blob)
+
+        writes = self.conn.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_path, task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+
+        return CheckpointTuple(
+            config={"configurable": {
+                "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id,
+            }},
+            checkpoint={**checkpoint, "channel_values": channel_values},
+            metadata=self._loads(metadata_type, metadata_b),
+            parent_config=(
+                {"configurable": {
+                    "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id,
+                }}
+                if parent_id else None
+            ),
+            pending_writes=[(task_id, channel, self._loads(t, v)) for task_id, channel, t, v in writes],
+        )
+
+    def _prune_thread(self, thread_id: str, checkpoint_ns: str):
+        """只保留最新的 keep_checkpoints 個 checkpoint 以及它們引用的 blobs。"""
+        rows = self.conn.execute(
+            "SELECT checkpoint_id, type, checkpoint FROM checkpoints "
+            "WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC",
+            (thread_id, checkpoint_ns),
+        ).fetchall()
+        if len(rows) <= self.keep_checkpoints:
+            return
+        kept, dropped = rows[:self.keep_checkpoints], rows[self.keep_checkpoints:]
+        oldest_kept = kept[-1][0]
+        self.conn.execute(
+            "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+            (thread_id, checkpoint_ns, oldest_kept),
+        )
+        self.conn.execute(
+            "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+            (thread_id, checkpoint_ns, oldest_kept),
+        )
+        # 被刪除的舊版本 blob 若不再被保留的 checkpoint 引用，就一併刪除
+        referenced = set()
+        for _, type_, checkpoint_b in kept:
+            for channel, version in self._loads(type_, checkpoint_b).get("channel_versions", {}).items():
+                referenced.add((channel, str(version)))
+        candidates = set()
+        for _, type_, checkpoint_b in dropped:
+            for channel, version in self._loads(type_, checkpoint_b).get("channel_versions", {}).items():
+                candidates.add((channel, str(version)))
+        for channel, version in candidates - referenced:
+            self.conn.execute(
+                "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, version),
+            )
+
+    # ---- BaseCheckpointSaver 介面 ----
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self.conn.execute(
+                    "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+                    "FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+                    "FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            if row is None:
+                return None
+            self._touch(thread_id)
+            return self._load_tuple(thread_id, checkpoint_ns, row)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        query = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+                 "metadata_type, metadata FROM checkpoints")
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+            results = []
+            for thread_id, checkpoint_ns, *row in rows:
+                if limit is not None and len(results) >= limit:
+                    break
+                item = self._load_tuple(thread_id, checkpoint_ns, row)
+                if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                results.append(item)
+        yield from results
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        c = checkpoint.copy()
+        values = c.pop("channel_values")
+        type_, checkpoint_b = self._dumps(c)
+        metadata_type, metadata_b = self._dumps(get_checkpoint_metadata(config, metadata))
+
+        with self._lock, telemetry.step("checkpoint", config, bytes=len(checkpoint_b or b"")):
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for channel, version in new_versions.items():
+                    blob = self._dumps(values[channel]) if channel in values else ("empty", b"")
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)",
+                        (thread_id, checkpoint_ns, channel, str(version), *blob),
+                    )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                     type_, checkpoint_b, metadata_type, metadata_b),
+                )
+                self._touch(thread_id)
+                self._prune_thread(thread_id, checkpoint_ns)
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        if time.time() - self._last_evict > self.evict_interval:
+            self.evict()
+        return {"configurable": {
+            "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"],
+        }}
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # 特殊 channel (錯誤、中斷等) 覆寫既有紀錄；一般 write 已存在時保留原值
+        verb = "INSERT OR REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "INSERT OR IGNORE"
+        with self._lock:
+            for idx, (channel, value) in enumerate(writes):
+                self.conn.execute(
+                    f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel,
+                     *self._dumps(value), task_path),
+                )
+
+    def delete_thread(self, thread_id: str):
+        with self._lock:
+            for table in ("checkpoints", "blobs", "writes", "threads"):
+                self.conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    def get_next_version(self, current, channel):
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # ---- 非同步介面：在執行緒中執行，避免阻塞事件迴圈 ----
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    # ---- 淘汰與監控 ----
+
+    def evict(self) -> int:
+        """刪除閒置超過 TTL 的 thread，以及超過 max_threads 的最久未使用 thread；回傳刪除數量。"""
+        self._last_evict = time.time()
+        with self._lock:
+            expired = [row[0] for row in self.conn.execute(
+                "SELECT thread_id FROM threads WHERE last_access < ?", (time.time() - self.ttl_seconds,)
+            )]
+            overflow = [row[0] for row in self.conn.execute(
+                "SELECT thread_id FROM threads WHERE last_access >= ? ORDER BY last_access DESC LIMIT -1 OFFSET ?",
+                (time.time() - self.ttl_seconds, self.max_threads),
+            )]
+            for thread_id in expired + overflow:
+                self.delete_thread(thread_id)
+        return len(expired) + len(overflow)
+
+    def stats(self) -> dict:
+        """記憶體與儲存用量指標。"""
+        with self._lock:
+            threads = self.conn.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+            checkpoints = self.conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+            page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+        return {
+            "threads": threads,
+            "checkpoints": checkpoints,
+            "db_bytes": page_count * page_size,
+            "rss_bytes": process_rss_bytes(),
+        }
+
+    def gauges(self) -> dict:
+        """stats() 的 Prometheus gauge 形式 (供 telemetry.register_gauges 使用)。"""
+        stats = self.stats()
+        return {
+            "agent_checkpoint_threads": ("Conversation threads kept by the checkpointer.", stats["threads"]),
+            "agent_checkpoint_checkpoints": ("Checkpoints stored across all threads.", stats["checkpoints"]),
+            "agent_checkpoint_db_bytes": ("Size of the checkpoint SQLite database.", stats["db_bytes"]),
+            "agent_process_rss_bytes": ("Resident set size of the agent process.", stats["rss_bytes"]),
+        }
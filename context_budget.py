@@ -0,0 +1,141 @@
+"""
+依 token 預算建構送給 LLM 的對話脈絡。
+
+- 以「輪」(由 HumanMessage 開始) 為單位保留最近的對話，工具呼叫與其 ToolMessage 不會被拆開。
+- 較早的輪次摺疊成滾動摘要 (rolling summary)，摘要與已摘要的訊息數保存在圖的 state 中，
+  由 checkpointer 持久化；只有在邊界前移時才增量更新，不會每一步都重新摘要。
+- 非目前這一輪的工具結果 (搜尋片段、AutoML 報告) 超過 TOOL_RESULT_MAX_CHARS 時截斷。
+
+超出預算時近期訊息只保留到預算的 RECENT_RATIO，讓之後幾步不必立刻再摘要，
+每一步的輸入 token 數因此維持在預算附近，不隨對話長度成長。
+"""
+import os
+
+from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+MAX_CONTEXT_TOKENS = int(os.environ.get("CONTEXT_MAX_TOKENS", "6000"))
+RECENT_RATIO = 0.6
+TOOL_RESULT_MAX_CHARS = int(os.environ.get("CONTEXT_TOOL_RESULT_MAX_CHARS", "2000"))
+SUMMARY_MAX_CHARS = 2000
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and an AI research assistant.
+Keep facts the assistant may need later: the user's goals, datasets and file paths, AutoML Job IDs and Model IDs,
+scores, numeric results and open questions. Be concise (at most {max_chars} characters). Reply with the summary only.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}"""
+
+
+def count_tokens(messages) -> int:
+    """估算訊息的 token 數 (以字元數估算，不需要 tokenizer)。"""
+    return count_tokens_approximately(messages)
+
+
+def _clip(message, max_chars: int):
+    """截斷過長的工具結果 (回傳新物件，不修改 state 中的訊息)。"""
+    if not isinstance(message, ToolMessage) or not isinstance(message.content, str):
+        return message
+    if len(message.content) <= max_chars:
+        return message
+    dropped = len(message.content) - max_chars
+    return message.model_copy(update={"content": f"{message.content[:max_chars]}\n...[truncated {dropped} chars]"})
+
+
+def _turn_starts(messages, start: int = 0) -> list:
+    """每一輪 (HumanMessage) 的起始索引；只在這些位置切分，才不會拆開工具呼叫。"""
+    return [i for i in range(start, len(messages)) if isinstance(messages[i], HumanMessage)]
+
+
+def _render(messages) -> str:
+    lines = []
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        if getattr(message, "tool_calls", None):
+            calls = ", ".join(f"{c['name']}({c['args']})" for c in message.tool_calls)
+            content = f"{content} [calls: {calls}]".strip()
+        lines.append(f"{message.type}: {content[:TOOL_RESULT_MAX_CHARS]}")
+    return "\n".join(lines)
+
+
+def fallback_summary(previous: str, messages) -> str:
+    """無法呼叫 LLM 時的摘要：保留舊摘要與新訊息的開頭，截到 SUMMARY_MAX_CHARS。"""
+    lines = [previous] if previous else []
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        lines.append(f"{message.type}: {content[:200]}")
+    # 超過上限時保留最新的內容
+    return "\n".join(lines)[-SUMMARY_MAX_CHARS:]
+
+
+def summarize(model, previous: str, messages) -> str:
+    """
+    以 LLM 將 messages 併入既有摘要。
+
+    呼叫加上 "nostream" 標籤，摘要內容不會出現在 UI 的 token 串流中；失敗時改用 fallback_summary。
+    """
+    prompt = SUMMARY_PROMPT.format(max_chars=SUMMARY_MAX_CHARS, summary=previous or "(empty)",
+                                   messages=_render(messages))
+    try:
+        response = model.with_config(tags=["nostream"]).invoke([HumanMessage(content=prompt)])
+        content = response.content if isinstance(response.content, str) else ""
+    except Exception as e:
+        print(f"Summary failed, using fallback: {e}")
+        content = ""
+    return content.strip()[:SUMMARY_MAX_CHARS] or fallback_summary(previous, messages)
+
+
+def build_context(messages, summary: str = "", summarized_count: int = 0, summarize_fn=None,
+                  max_tokens: int = None) -> tuple:
+    """
+    依預算挑選送給 LLM 的歷史訊息。
+
+    Args:
+        messages: 完整的 state["messages"] (不含系統提示)。
+        summary: 目前的滾動摘要。
+        summarized_count: 已併入摘要的訊息數 (messages[:summarized_count])。
+        summarize_fn: summarize_fn(previous_summary, messages) -> str，邊界前移時呼叫。
+        max_tokens: 歷史 (摘要 + 近期訊息) 的 token 預算。
+
+    Returns:
+        (input_messages, summary, summarized_count)：後兩者有變動時應寫回 state。
+    """
+    max_tokens = max_tokens or MAX_CONTEXT_TOKENS
+    if summarized_count > len(messages):
+        # state 被重設或截斷，舊摘要已不適用
+        summary, summarized_count = "", 0
+
+    starts = _turn_starts(messages, summarized_count)
+    last_turn = starts[-1] if starts else summarized_count
+
+    def clipped(start: int) -> list:
+        return [_clip(m, TOOL_RESULT_MAX_CHARS) if i < last_turn else m
+                for i, m in enumerate(messages[start:], start)]
+
+    summary_tokens = count_tokens([SystemMessage(content=summary)]) if summary else 0
+    recent = clipped(summarized_count)
+    if summary_tokens + count_tokens(recent) > max_tokens and starts:
+        # 由舊到新找出第一個放得進目標大小的輪次起點；至少保留目前這一輪
+        target = max(0, max_tokens - summary_tokens) * RECENT_RATIO
+        cut = last_turn
+        for start in starts:
+            if start > summarized_count and count_tokens(clipped(start)) <= target:
+                cut = start
+                break
+        if cut > summarized_count:
+            dropped = messages[summarized_count:cut]
+            summary = (summarize_fn or fallback_summary)(summary, dropped)
+            summarized_count = cut
+            recent = clipped(cut)
+
+    if count_tokens(recent) > max_tokens:
+        # 目前這一輪本身就超過預算 (例如多個大型工具結果)，連同本輪的工具結果一併截斷
+        recent = [_clip(m, TOOL_RESULT_MAX_CHARS) for m in recent]
+
+    input_messages = list(recent)
+    if summary:
+        input_messages.insert(0, SystemMessage(content=f"Summary of the earlier conversation:\n{summary}"))
+    return input_messages, summary, summarized_count
@@ -0,0 +1,159 @@
+"""
+大型 CSV 的串流讀取。
+
+以固定大小的 chunk 讀取檔案，每個 chunk 先做 dtype 縮減
+(float64 -> float32、整數縮到最小寬度、低基數字串 -> category)，
+並可抽樣到指定的列數上限，讓尖峰記憶體只與 row_cap + chunksize 成正比，
+而不是與整個檔案大小成正比。
+"""
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+CHUNK_SIZE = int(os.environ.get("CSV_CHUNK_SIZE", "100000"))
+# 超過此大小的 CSV 會自動改用串流讀取
+STREAMING_THRESHOLD_BYTES = int(os.environ.get("CSV_STREAMING_THRESHOLD_MB", "100")) * 1024 * 1024
+# 粗估 AutoML 每秒預算能處理的列數，用來推算列數上限
+ROWS_PER_SECOND = int(os.environ.get("AUTOML_ROWS_PER_SECOND", "5000"))
+MIN_ROW_CAP = 1000
+# 唯一值比例低於此門檻的字串欄位轉為 category
+CATEGORY_RATIO = 0.5
+# 目標欄位唯一值不超過此數量時使用分層抽樣
+MAX_STRATIFY_CLASSES = 50
+# 分層抽樣時代表缺值目標的類別鍵
+_MISSING = "__missing__"
+
+
+def row_cap_for_budget(time_budget: float) -> int:
+    """依時間預算推算訓練列數上限。"""
+    return max(MIN_ROW_CAP, int(time_budget * ROWS_PER_SECOND))
+
+
+def _plan_dtypes(chunk: pd.DataFrame) -> dict:
+    """根據第一個 chunk 決定各欄位的目標 dtype，之後所有 chunk 保持一致。"""
+    plan = {}
+    for col in chunk.columns:
+        series = chunk[col]
+        if pd.api.types.is_float_dtype(series):
+            plan[col] = "float32"
+        elif pd.api.types.is_integer_dtype(series):
+            plan[col] = "integer"
+        elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            n_unique = series.nunique(dropna=True)
+            if n_unique <= max(1, len(series) * CATEGORY_RATIO):
+                plan[col] = "category"
+    return plan
+
+
+def _downcast(chunk: pd.DataFrame, plan: dict) -> pd.DataFrame:
+    for col, kind in plan.items():
+        if kind == "float32":
+            chunk[col] = chunk[col].astype("float32")
+        elif kind == "integer":
+            if pd.api.types.is_integer_dtype(chunk[col]):
+                chunk[col] = pd.to_numeric(chunk[col], downcast="integer")
+            else:
+                # 後續 chunk 出現缺值時整數欄位會變成浮點數
+                chunk[col] = chunk[col].astype("float32")
+        elif kind == "category":
+            chunk[col] = chunk[col].astype("category")
+    return chunk
+
+
+def _concat(frames: list) -> pd.DataFrame:
+    """合併 chunk；category 欄位以 union_categoricals 合併，避免退化成 object。"""
+    frames = [f for f in frames if len(f)]
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0]
+    columns = {}
+    for col in frames[0].columns:
+        parts = [f[col] for f in frames]
+        if all(isinstance(p.dtype, pd.CategoricalDtype) for p in parts):
+            try:
+                columns[col] = pd.Series(union_categoricals(parts, ignore_order=True))
+            except TypeError:
+                # 例如某個 chunk 全為缺值，類別型別不一致
+                columns[col] = pd.concat([p.astype(object) for p in parts], ignore_index=True).astype("category")
+        else:
+            columns[col] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+def _stratum(target: pd.Series) -> pd.Series:
+    """
+    分層抽樣的類別鍵：取自 dtype 縮減前的原始目標值，缺值以 _MISSING 表示。
+
+    縮減後的值 (例如 float32) 與原始值不一定相等，NaN 也無法當作 dict 的 key 比對。
+    """
+    target = target.astype(object)
+    return target.where(target.notna(), _MISSING)
+
+
+def _iter_chunks(path: str, chunksize: int, stratify_column: str = None):
+    """讀取並縮減每個 chunk；指定 stratify_column 時先以原始值加上 __stratum 欄位。"""
+    plan = None
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        if plan is None:
+            plan = _plan_dtypes(chunk)
+        if stratify_column is not None:
+            chunk["__stratum"] = _stratum(chunk[stratify_column])
+        yield _downcast(chunk, plan)
+
+
+def _class_quotas(path: str, target_column: str, row_cap: int, chunksize: int):
+    """第一輪只讀取目標欄位，依類別比例分配每個類別 (以 _stratum 為鍵) 的抽樣數量。"""
+    counts = pd.Series(dtype="int64")
+    for chunk in pd.read_csv(path, usecols=[target_column], chunksize=chunksize):
+        counts = counts.add(_stratum(chunk[target_column]).value_counts(), fill_value=0)
+    if len(counts) > MAX_STRATIFY_CLASSES:
+        return None
+    total = counts.sum()
+    if total <= row_cap:
+        return {}
+    # 每個類別至少保留一列
+    return {cls: max(1, int(round(row_cap * n / total))) for cls, n in counts.items()}
+
+
+def read_csv_streaming(path: str, target_column: str = None, row_cap: int = None,
+                       chunksize: int = None, stratify: bool = True, random_state: int = 42) -> pd.DataFrame:
+    """
+    以串流方式讀取 CSV，並可抽樣到 row_cap 列。
+
+    抽樣使用 bottom-k 法：每列指派一個隨機鍵，只保留鍵值最小的 k 列，
+    等價於不放回的均勻抽樣，且記憶體只需 k + chunksize 列。
+    提供 target_column 且類別數不多時，各類別依原始比例分別抽樣 (分層抽樣)。
+    """
+    chunksize = chunksize or CHUNK_SIZE
+    if row_cap is None:
+        return _concat(list(_iter_chunks(path, chunksize)))
+
+    quotas = None
+    if stratify and target_column is not None:
+        quotas = _class_quotas(path, target_column, row_cap, chunksize)
+        if quotas == {}:
+            # 檔案本身未超過上限，不需抽樣
+            return _concat(list(_iter_chunks(path, chunksize)))
+
+    rng = np.random.RandomState(random_state)
+    reservoir = None
+    for chunk in _iter_chunks(path, chunksize, target_column if quotas is not None else None):
+        chunk["__sample_key"] = rng.random_sample(len(chunk))
+        merged = chunk if reservoir is None else _concat([reservoir, chunk])
+        if quotas is None:
+            reservoir = merged.nsmallest(row_cap, "__sample_key")
+        else:
+            # 依類別保留各自配額內鍵值最小的列
+            keep = []
+            for cls, group in merged.groupby("__stratum", sort=False):
+                keep.append(group.nsmallest(quotas.get(cls, 0), "__sample_key"))
+            reservoir = _concat(keep)
+        reservoir = reservoir.reset_index(drop=True)
+
+    if reservoir is None:
+        return pd.DataFrame()
+    # 移除抽樣用的輔助欄位
+    return reservoir.drop(columns=["__sample_key", "__stratum"], errors="ignore")
@@ -0,0 +1,168 @@
+"""
+內容定址的資料集快取。
+
+CSV 以檔案內容的 SHA-256 為 key，OpenML 資料集以 ID 為 key，
+解析後的 DataFrame 以欄式二進位格式保存 (有 pyarrow 時用 Parquet，否則用 pickle)，
+保留推斷出的 dtypes，重複訓練時可跳過 CSV 解析與網路下載。
+快取目錄超過 DATASET_CACHE_MAX_MB 時，依最近使用時間淘汰舊項目。
+"""
+import hashlib
+import json
+import os
+import threading
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+except ImportError:
+    pyarrow = None
+
+CACHE_DIR = os.environ.get("DATASET_CACHE_DIR", ".dataset_cache")
+MAX_CACHE_BYTES = int(os.environ.get("DATASET_CACHE_MAX_MB", "1024")) * 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# (絕對路徑, 檔案大小, mtime) -> 內容雜湊，避免同一個未變更的檔案重複計算雜湊
+_digest_memo = {}
+_lock = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    """計算檔案內容的 SHA-256 (以串流方式讀取，不載入整個檔案)。"""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        if memo_key in _digest_memo:
+            return _digest_memo[memo_key]
+
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    with _lock:
+        _digest_memo[memo_key] = digest
+    return digest
+
+
+def _data_path(key: str) -> str:
+    ext = "parquet" if pyarrow is not None else "pkl"
+    return os.path.join(CACHE_DIR, f"{key}.{ext}")
+
+
+def _meta_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+
+def get(key: str):
+    """讀取快取的 (DataFrame, metadata)；未命中時回傳 None。"""
+    data_path = _data_path(key)
+    if not os.path.exists(data_path):
+        return None
+    try:
+        if data_path.endswith(".parquet"):
+            df = pd.read_parquet(data_path)
+        else:
+            df = pd.read_pickle(data_path)
+        meta = {}
+        if os.path.exists(_meta_path(key)):
+            with open(_meta_path(key), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+    except Exception as e:
+        print(f"Dataset cache read failed for {key}: {e}")
+        return None
+    # 更新存取時間，供 LRU 淘汰使用 (檔案可能剛被其他程序淘汰)
+    try:
+        os.utime(data_path)
+    except OSError:
+        pass
+    return df, meta
+
+
+def put(key: str, df: pd.DataFrame, meta: dict = None):
+    """寫入快取，並在超過大小上限時淘汰最久未使用的項目。"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    data_path = _data_path(key)
+    tmp_path = f"{data_path}.{os.getpid()}.tmp"
+    try:
+        # 先寫 metadata，資料檔最後以原子方式出現，讀取端不會看到不完整的項目
+        with open(_meta_path(key), "w", encoding="utf-8") as f:
+            json.dump(meta or {}, f, ensure_ascii=False)
+        if data_path.endswith(".parquet"):
+            df.to_parquet(tmp_path, index=False)
+        else:
+            df.to_pickle(tmp_path)
+        os.replace(tmp_path, data_path)
+    except Exception as e:
+        # 快取失敗不影響訓練 (例如欄位型別無法寫入 Parquet)
+        print(f"Dataset cache write failed for {key}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    evict()
+
+
+def evict(max_bytes: int = None):
+    """淘汰最久未使用的項目，直到快取大小不超過上限。"""
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    if not os.path.isdir(CACHE_DIR):
+        return
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith((".parquet", ".pkl")):
+            path = os.path.join(CACHE_DIR, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        for victim in (path, os.path.splitext(path)[0] + ".json"):
+            try:
+                os.remove(victim)
+            except OSError:
+                pass
+        total -= size
+
+
+def load_csv(path: str, reader=None, variant: str = None) -> pd.DataFrame:
+    """
+    讀取 CSV；內容相同的檔案只解析一次。
+
+    Args:
+        path: CSV 檔案路徑。
+        reader: 可選，自訂的解析函式 reader(path) -> DataFrame (預設 pd.read_csv)。
+        variant: 可選，區分同一檔案不同讀取方式 (例如抽樣設定) 的快取 key 後綴。
+    """
+    key = f"csv-{file_digest(path)}"
+    if variant:
+        key = f"{key}-{hashlib.sha256(variant.encode()).hexdigest()[:12]}"
+    cached = get(key)
+    if cached is not None:
+        return cached[0]
+
+    df = (reader or pd.read_csv)(path)
+    put(key, df, {"source": os.path.basename(path)})
+    return df
+
+
+def load_openml(dataset_id: int):
+    """下載 (或從快取讀取) OpenML 資料集，回傳 (X, y)。"""
+    key = f"openml-{int(dataset_id)}"
+    cached = get(key)
+    if cached is not None:
+        df, meta = cached
+        target = meta["target"]
+        return df.drop(columns=[target]), df[target]
+
+    import openml
+
+    dataset = openml.datasets.get_dataset(dataset_id)
+    target = dataset.default_target_attribute
+    X, y, _, _ = dataset.get_data(target=target, dataset_format="dataframe")
+    put(key, pd.concat([X, y.rename(target)], axis=1), {"target": target, "name": dataset.name})
+    return X, y
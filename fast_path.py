@@ -0,0 +1,117 @@
+"""
+確定性請求的快速路徑 (在 agent 節點之前判斷)。
+
+純算術問題 (例如 "What is 100 * 200?"、"compute (2 + 3) * 4"、"5 plus 7") 直接以安全的
+運算式求值器計算並回答，不呼叫 LLM：原本需要兩次 LLM 往返 (產生工具呼叫、再組成回答)，
+現在只需微秒等級的時間。
+
+求值器只解析 AST 中的數字、四則運算、取餘數、次方與正負號，不使用 eval()，
+次方與結果大小都有上限；無法處理的輸入一律回傳 None，交給 LLM 處理。
+
+沒有空格的斜線數字 (例如 "What is 9/11?"、"24/7"、"12/25/2024") 多半是事件、日期或比例，
+只有明確要求計算 (calculate / compute / evaluate / solve) 時才當作除法。
+"""
+import ast
+import operator
+import re
+
+MAX_EXPONENT = 64
+MAX_RESULT_DIGITS = 100
+
+_BINARY_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+_UNARY_OPS = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+
+_PREFIX_RE = re.compile(
+    r"^(?:please\s+)?(?:what\s+is|what's|whats|how\s+much\s+is|calculate|compute|evaluate|solve)\s*[:,]?\s*",
+    re.IGNORECASE,
+)
+_WORD_OPS = [
+    (r"\bmultiplied\s+by\b", "*"),
+    (r"\btimes\b", "*"),
+    (r"\bdivided\s+by\b", "/"),
+    (r"\bover\b", "/"),
+    (r"\bplus\b", "+"),
+    (r"\bminus\b", "-"),
+    (r"\bmod(?:ulo)?\b", "%"),
+    (r"\bto\s+the\s+power\s+of\b", "**"),
+    (r"(?<=\d)\s*[x×]\s*(?=[\d(])", "*"),
+    (r"÷", "/"),
+    (r"\^", "**"),
+]
+_EXPRESSION_RE = re.compile(r"^[\d\s.+\-*/%()]+$")
+_CALCULATE_RE = re.compile(r"^(?:please\s+)?(?:calculate|compute|evaluate|solve)\b", re.IGNORECASE)
+_BARE_SLASH_RE = re.compile(r"^\d+(?:/\d+)+$")
+
+
+def _check(value):
+    if isinstance(value, int) and len(str(abs(value))) > MAX_RESULT_DIGITS:
+        raise ValueError("result too large")
+    return value
+
+
+def _eval(node):
+    if isinstance(node, ast.Expression):
+        return _eval(node.body)
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return node.value
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPS:
+        return _UNARY_OPS[type(node.op)](_eval(node.operand))
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+        left, right = _eval(node.left), _eval(node.right)
+        if isinstance(node.op, ast.Pow) and abs(right) > MAX_EXPONENT:
+            raise ValueError("exponent too large")
+        return _check(_BINARY_OPS[type(node.op)](left, right))
+    raise ValueError(f"unsupported expression: {ast.dump(node)}")
+
+
+def safe_eval(expression: str):
+    """
+    安全地計算算術運算式；無法解析或計算 (例如除以零) 時回傳 None。
+
+    >>> safe_eval("100 * 200")
+    20000
+    """
+    try:
+        return _eval(ast.parse(expression, mode="eval"))
+    except (SyntaxError, ValueError, TypeError, ZeroDivisionError, OverflowError, RecursionError):
+        return None
+
+
+def parse_arithmetic(text: str):
+    """從自然語言問題中取出純算術運算式，不是純算術時回傳 None。"""
+    expression = _PREFIX_RE.sub("", text.strip()).rstrip(" ?.!=")
+    if _BARE_SLASH_RE.match(expression) and not _CALCULATE_RE.match(text.strip()):
+        return None
+    for pattern, replacement in _WORD_OPS:
+        expression = re.sub(pattern, f" {replacement} ", expression, flags=re.IGNORECASE)
+    expression = re.sub(r"(?<=\d),(?=\d{3}\b)", "", expression)  # 千分位逗號
+    if not _EXPRESSION_RE.match(expression) or not re.search(r"\d\s*[-+*/%]", expression):
+        return None
+    return " ".join(expression.split())
+
+
+def _format(value) -> str:
+    if isinstance(value, float):
+        if value.is_integer() and abs(value) < 1e15:
+            return str(int(value))
+        return format(value, ".12g")
+    return str(value)
+
+
+def try_answer(text: str):
+    """若 text 是可以直接計算的問題，回傳回答字串；否則回傳 None。"""
+    expression = parse_arithmetic(text)
+    if expression is None:
+        return None
+    value = safe_eval(expression)
+    if value is None:
+        return None
+    return f"{expression} = {_format(value)}"
@@ -0,0 +1,193 @@
+"""
+模型註冊表：版本化保存 AutoML 產出的模型，並提供常駐記憶體的推論。
+
+目錄結構 (MODEL_REGISTRY_DIR，預設 models/)：
+
+    <name>/v0001/model.joblib   已 fit 的 Pipeline
+    <name>/v0001/meta.json      訓練資訊 (最佳模型、分數、類別標籤、特徵欄位...)
+
+每個模型名稱只保留最新的 MODEL_REGISTRY_MAX_VERSIONS 個版本。
+推論時模型以 joblib mmap_mode 載入並保存在 LRU 中，不會每次呼叫都重新 unpickle。
+"""
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+import joblib
+
+REGISTRY_DIR = os.environ.get("MODEL_REGISTRY_DIR", "models")
+MAX_VERSIONS = int(os.environ.get("MODEL_REGISTRY_MAX_VERSIONS", "5"))
+WARM_MODELS = int(os.environ.get("MODEL_REGISTRY_WARM_MODELS", "4"))
+
+_VERSION_RE = re.compile(r"^v(\d+)$")
+
+# (name, version) -> (pipeline, meta)
+_warm = OrderedDict()
+_warm_lock = threading.Lock()
+
+
+def _safe_name(name: str) -> str:
+    """將資料集名稱轉為可作為目錄名稱的模型名稱。"""
+    return re.sub(r"[^A-Za-z0-9_.-]+", "-", name).strip("-.") or "model"
+
+
+def _versions(name: str) -> list:
+    model_dir = os.path.join(REGISTRY_DIR, name)
+    if not os.path.isdir(model_dir):
+        return []
+    versions = []
+    for entry in os.listdir(model_dir):
+        match = _VERSION_RE.match(entry)
+        if match and os.path.exists(os.path.join(model_dir, entry, "meta.json")):
+            versions.append(int(match.group(1)))
+    return sorted(versions)
+
+
+def _version_dir(name: str, version: int) -> str:
+    return os.path.join(REGISTRY_DIR, name, f"v{version:04d}")
+
+
+def register(pipeline, name: str, metadata: dict = None) -> dict:
+    """
+    保存模型為新版本，回傳其 metadata (包含 model_id 與 path)。
+
+    版本目錄以 os.mkdir 原子建立，同時訓練完成的兩個工作不會互相覆蓋。
+    """
+    name = _safe_name(name)
+    os.makedirs(os.path.join(REGISTRY_DIR, name), exist_ok=True)
+
+    version = (max(_versions(name), default=0)) + 1
+    while True:
+        try:
+            os.mkdir(_version_dir(name, version))
+            break
+        except FileExistsError:
+            version += 1
+
+    version_dir = _version_dir(name, version)
+    model_path = os.path.join(version_dir, "model.joblib")
+    # 不壓縮，讓推論時可以用 mmap_mode 直接映射 numpy 陣列
+    joblib.dump(pipeline, model_path)
+
+    meta = dict(metadata or {})
+    meta.update({
+        "name": name,
+        "version": version,
+        "model_id": f"{name}:v{version}",
+        "path": model_path,
+        "created_at": time.time(),
+    })
+    # meta.json 最後寫入，代表此版本已完整可用
+    with open(os.path.join(version_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, default=str)
+
+    _apply_retention(name)
+    return meta
+
+
+def _apply_retention(name: str):
+    """刪除超過保留數量的舊版本。"""
+    versions = _versions(name)
+    for version in versions[:-MAX_VERSIONS] if MAX_VERSIONS > 0 else []:
+        shutil.rmtree(_version_dir(name, version), ignore_errors=True)
+        with _warm_lock:
+            _warm.pop((name, version), None)
+
+
+def resolve(model_id: str) -> tuple:
+    """將 "name" (最新版本) 或 "name:vN" 解析為 (name, version)。"""
+    name, _, version = model_id.strip().partition(":")
+    name = _safe_name(name)
+    if version:
+        match = _VERSION_RE.match(version)
+        if not match:
+            raise ValueError(f"Invalid model version: {version}")
+        return name, int(match.group(1))
+    versions = _versions(name)
+    if not versions:
+        raise KeyError(f"Model not found: {model_id}")
+    return name, versions[-1]
+
+
+def get_metadata(model_id: str) -> dict:
+    name, version = resolve(model_id)
+    meta_path = os.path.join(_version_dir(name, version), "meta.json")
+    if not os.path.exists(meta_path):
+        raise KeyError(f"Model not found: {model_id}")
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def list_models() -> list:
+    """列出所有模型的所有版本 metadata。"""
+    if not os.path.isdir(REGISTRY_DIR):
+        return []
+    models = []
+    for name in sorted(os.listdir(REGISTRY_DIR)):
+        for version in _versions(name):
+            models.append(get_metadata(f"{name}:v{version}"))
+    return models
+
+
+def load(model_id: str) -> tuple:
+    """取得 (pipeline, meta)；常用模型保留在記憶體 LRU 中。"""
+    name, version = resolve(model_id)
+    key = (name, version)
+    with _warm_lock:
+        if key in _warm:
+            _warm.move_to_end(key)
+            return _warm[key]
+
+    meta = get_metadata(f"{name}:v{version}")
+    # mmap_mode: 大型陣列 (例如樹的節點) 直接映射檔案，多個程序可共用同一份分頁
+    pipeline = joblib.load(meta["path"], mmap_mode="r")
+
+    with _warm_lock:
+        _warm[key] = (pipeline, meta)
+        _warm.move_to_end(key)
+        while len(_warm) > WARM_MODELS:
+            _warm.popitem(last=False)
+    return pipeline, meta
+
+
+def clear_warm_cache():
+    with _warm_lock:
+        _warm.clear()
+
+
+def predict(model_id: str, records) -> dict:
+    """
+    以註冊表中的模型進行推論。
+
+    Args:
+        model_id: "name" 或 "name:vN"。
+        records: list[dict] 或 DataFrame，欄位需與訓練資料相同。
+
+    Returns:
+        dict: predictions (原始標籤)，以及分類模型的 probabilities。
+    """
+    import pandas as pd
+
+    pipeline, meta = load(model_id)
+    X = records if isinstance(records, pd.DataFrame) else pd.DataFrame(list(records))
+    feature_columns = meta.get("feature_columns")
+    if feature_columns:
+        missing = [col for col in feature_columns if col not in X.columns]
+        if missing:
+            raise ValueError(f"Missing feature columns: {missing}")
+        X = X[feature_columns]
+
+    encoded = pipeline.predict(X)
+    classes = meta.get("classes")
+    # 訓練時目標欄位經過 LabelEncoder，這裡轉回原始標籤
+    predictions = [classes[int(i)] for i in encoded] if classes else encoded.tolist()
+
+    output = {"model_id": meta["model_id"], "predictions": predictions}
+    if classes and hasattr(pipeline, "predict_proba"):
+        output["probabilities"] = pipeline.predict_proba(X).round(4).tolist()
+        output["classes"] = classes
+    return output
@@ -0,0 +1,180 @@
+"""
+Agent 回答快取 (放在 agent_engine.app 前面)。
+
+key 為 (provider, model_name, 正規化後的問題)：
+- 第一層：問題正規化後的雜湊完全相同。
+- 第二層 (預設關閉，lookup(similarity=True) 時才使用)：字元 trigram 的 cosine 相似度超過
+  SIMILARITY_THRESHOLD，且去掉停用詞後的詞集合完全相同 (數字與否定詞也必須一致，
+  避免 "Should I not use pandas?" 命中 "Should I use pandas?"，或 dataset 61 命中 dataset 31)。
+  只容許詞序、單複數、停用詞與標點的差異。
+
+項目有 TTL 與數量上限 (LRU)。使用了有副作用或結果會隨時間改變的工具 (訓練、查詢工作狀態、
+批次預測、網路搜尋...) 的回答不會被快取。
+"""
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "512"))
+CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "3600"))
+SIMILARITY_THRESHOLD = float(os.environ.get("RESPONSE_CACHE_SIMILARITY", "0.9"))
+
+# 這些工具有副作用，或結果取決於當下的狀態，使用過它們的回答不可重複使用
+UNCACHEABLE_TOOLS = {
+    "train_tabular_model",
+    "get_training_status",
+    "get_training_results",
+    "cancel_training",
+    "predict",
+    "batch_predict",
+    # 搜尋結果 (新聞、價格...) 很快就過時
+    "search_duckduckgo",
+}
+
+# 比對詞集合時忽略的停用詞 (不含否定詞)
+STOP_WORDS = frozenset(
+    "a an the is are was were be been am do does did i me my we our you your it its this that these those "
+    "of in on at to for from with by about and or please can could would will tell".split()
+)
+NEGATIONS = frozenset({"not", "no", "never", "without", "nor", "none", "nothing", "cannot"})
+
+# hash -> entry dict (scope, prompt, numbers, terms, ngrams, norm, answer, expires_at)
+_entries = OrderedDict()
+_lock = threading.Lock()
+_stats = {"exact_hits": 0, "similar_hits": 0, "misses": 0, "bypassed": 0, "stores": 0}
+
+
+def normalize_prompt(prompt: str) -> str:
+    text = re.sub(r"\s+", " ", prompt).strip().lower()
+    return text.rstrip(" ?.!")
+
+
+def _key(provider: str, model_name: str, normalized: str) -> str:
+    return hashlib.sha256(f"{provider}\x00{model_name}\x00{normalized}".encode()).hexdigest()
+
+
+def _ngrams(text: str, n: int = 3) -> Counter:
+    padded = f"  {text} "
+    return Counter(padded[i:i + n] for i in range(len(padded) - n + 1))
+
+
+def _cosine(a: Counter, norm_a: float, b: Counter, norm_b: float) -> float:
+    if not norm_a or not norm_b:
+        return 0.0
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(count * b.get(gram, 0) for gram, count in a.items()) / (norm_a * norm_b)
+
+
+def _numbers(text: str) -> tuple:
+    return tuple(re.findall(r"\d+(?:\.\d+)?", text))
+
+
+def _terms(text: str) -> frozenset:
+    """去掉停用詞後的詞集合 ("don't" 展開為 "do not"，簡單去除複數的 s)。"""
+    words = re.findall(r"[a-z0-9]+(?:'[a-z]+)?", text.replace("n't", " not"))
+    terms = set()
+    for word in words:
+        word = word.split("'")[0]
+        if word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss") and word not in NEGATIONS:
+            word = word[:-1]
+        terms.add(word)
+    return frozenset(terms)
+
+
+def lookup(provider: str, model_name: str, prompt: str, similarity: bool = False):
+    """
+    查詢快取的回答；未命中回傳 None。similarity=True 時也使用第二層 (相似問題)。
+
+    Returns:
+        (answer, tier)：tier 為 "exact" 或 "similar"。
+    """
+    normalized = normalize_prompt(prompt)
+    key = _key(provider, model_name, normalized)
+    now = time.time()
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry["expires_at"] >= now:
+            _entries.move_to_end(key)
+            _stats["exact_hits"] += 1
+            return entry["answer"], "exact"
+
+        if similarity and SIMILARITY_THRESHOLD < 1:
+            grams = _ngrams(normalized)
+            norm = math.sqrt(sum(c * c for c in grams.values()))
+            numbers = _numbers(normalized)
+            terms = _terms(normalized)
+            best_key, best_score = None, SIMILARITY_THRESHOLD
+            for other_key, other in _entries.items():
+                if (other["expires_at"] < now or other["scope"] != (provider, model_name)
+                        or other["numbers"] != numbers or other["terms"] != terms
+                        or other["terms"] & NEGATIONS != terms & NEGATIONS):
+                    continue
+                score = _cosine(grams, norm, other["ngrams"], other["norm"])
+                if score >= best_score:
+                    best_key, best_score = other_key, score
+            if best_key is not None:
+                _entries.move_to_end(best_key)
+                _stats["similar_hits"] += 1
+                return _entries[best_key]["answer"], "similar"
+
+        _stats["misses"] += 1
+    return None
+
+
+def store(provider: str, model_name: str, prompt: str, answer: str, tools_used=()) -> bool:
+    """保存回答；回答為空或使用過 UNCACHEABLE_TOOLS 時不保存 (回傳 False)。"""
+    if not answer or UNCACHEABLE_TOOLS.intersection(tools_used):
+        with _lock:
+            _stats["bypassed"] += 1
+        return False
+    normalized = normalize_prompt(prompt)
+    grams = _ngrams(normalized)
+    entry = {
+        "scope": (provider, model_name),
+        "prompt": prompt,
+        "answer": answer,
+        "numbers": _numbers(normalized),
+        "terms": _terms(normalized),
+        "ngrams": grams,
+        "norm": math.sqrt(sum(c * c for c in grams.values())),
+        "expires_at": time.time() + CACHE_TTL,
+    }
+    key = _key(provider, model_name, normalized)
+    with _lock:
+        _entries[key] = entry
+        _entries.move_to_end(key)
+        _stats["stores"] += 1
+        _evict()
+    return True
+
+
+def _evict():
+    """刪除過期項目與超過上限的最久未使用項目 (呼叫端需持有 _lock)。"""
+    now = time.time()
+    for key in [k for k, e in _entries.items() if e["expires_at"] < now]:
+        del _entries[key]
+    while len(_entries) > CACHE_SIZE:
+        _entries.popitem(last=False)
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+        for key in _stats:
+            _stats[key] = 0
+
+
+def stats() -> dict:
+    """快取統計，包含命中率 (hit_rate = 命中次數 / 查詢次數)。"""
+    with _lock:
+        result = {**_stats, "entries": len(_entries)}
+    lookups = result["exact_hits"] + result["similar_hits"] + result["misses"]
+    result["hit_rate"] = (result["exact_hits"] + result["similar_hits"]) / lookups if lookups else 0.0
+    return result
@@ -0,0 +1,238 @@
+"""
+網路搜尋結果快取。
+
+- 查詢字串正規化 (小寫、合併空白) 後作為 key，記憶體 LRU 加上 TTL。
+- 設定 SEARCH_CACHE_DIR 時另有磁碟層，重新啟動或多個工作程序之間也能共用結果。
+- 同時送出的相同查詢會合併 (request coalescing)，只有第一個呼叫者真的發出請求，其餘等待同一個結果。
+- SessionPool 重複使用搜尋用戶端 (例如 DDGS)，不必每次查詢都建立新的 HTTP session。
+- SEARCH_BACKEND=stub 時使用本地的假搜尋後端，測試與壓力測試不需要網路。
+"""
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", "256"))
+CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", "3600"))
+CACHE_DIR = os.environ.get("SEARCH_CACHE_DIR") or None
+BACKEND = os.environ.get("SEARCH_BACKEND", "ddgs")
+STUB_LATENCY = float(os.environ.get("SEARCH_STUB_LATENCY_MS", "0")) / 1000
+
+# key -> (expires_at, results)
+_memory = OrderedDict()
+# key -> Future，進行中的請求
+_inflight = {}
+_lock = threading.Lock()
+_stats = {"hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0}
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+def _cache_key(query: str, max_results: int) -> str:
+    return hashlib.sha256(f"{normalize_query(query)}\x00{max_results}".encode()).hexdigest()
+
+
+def _disk_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+
+def _disk_get(key: str):
+    if not CACHE_DIR:
+        return None
+    try:
+        with open(_disk_path(key), "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if entry.get("expires_at", 0) < time.time():
+        return None
+    return entry["expires_at"], entry["results"]
+
+
+def _disk_put(key: str, query: str, expires_at: float, results: list):
+    if not CACHE_DIR:
+        return
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{_disk_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"query": normalize_query(query), "expires_at": expires_at, "results": results},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, _disk_path(key))
+    except OSError as e:
+        # 磁碟快取失敗不影響搜尋結果
+        print(f"Search cache write failed: {e}")
+
+
+def _remember(key: str, expires_at: float, results: list):
+    """寫入記憶體 LRU (呼叫端需持有 _lock)。"""
+    _memory[key] = (expires_at, results)
+    _memory.move_to_end(key)
+    while len(_memory) > CACHE_SIZE:
+        _memory.popitem(last=False)
+
+
+def cached_search(query: str, max_results: int, fetch) -> list:
+    """
+    回傳 fetch(query, max_results) 的結果，優先使用快取。
+
+    Args:
+        query: 搜尋字串。
+        max_results: 結果數量上限 (屬於快取 key 的一部分)。
+        fetch: 實際執行搜尋的函式，回傳 list[dict]。
+
+    fetch 拋出的例外會傳給所有等待同一個查詢的呼叫者，且不會被快取；
+    空的結果 (常見於暫時性的節流或錯誤) 也不快取，下次查詢會重新搜尋。
+    """
+    key = _cache_key(query, max_results)
+    with _lock:
+        entry = _memory.get(key)
+        if entry is not None and entry[0] >= time.time():
+            _memory.move_to_end(key)
+            _stats["hits"] += 1
+            return entry[1]
+        future = _inflight.get(key)
+        if future is not None:
+            _stats["coalesced"] += 1
+            leader = False
+        else:
+            future = _inflight[key] = Future()
+            leader = True
+
+    if not leader:
+        return future.result()
+
+    try:
+        entry = _disk_get(key)
+        if entry is not None:
+            with _lock:
+                _stats["disk_hits"] += 1
+        else:
+            with _lock:
+                _stats["misses"] += 1
+            results = list(fetch(query, max_results))
+            entry = (time.time() + CACHE_TTL, results)
+            if results:
+                _disk_put(key, query, *entry)
+        if entry[1]:
+            with _lock:
+                _remember(key, *entry)
+        future.set_result(entry[1])
+        return entry[1]
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+
+
+def clear():
+    """清空記憶體快取與統計 (不刪除磁碟層)。"""
+    with _lock:
+        _memory.clear()
+        for key in _stats:
+            _stats[key] = 0
+
+
+def stats() -> dict:
+    with _lock:
+        return {**_stats, "entries": len(_memory)}
+
+
+class SessionPool:
+    """
+    搜尋用戶端的物件池。
+
+    session 以 factory() 延遲建立，最多 size 個；使用中拋出例外的 session 會被丟棄，
+    下次需要時再建立新的。
+    """
+
+    def __init__(self, factory, size: int = 2):
+        self.factory = factory
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                return self.factory()
+            except BaseException:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get()
+
+    def release(self, session, discard: bool = False):
+        if discard:
+            with self._lock:
+                self._created -= 1
+            _close(session)
+        else:
+            self._idle.put(session)
+
+    def run(self, fn):
+        """以池中的 session 執行 fn(session)。"""
+        session = self.acquire()
+        try:
+            result = fn(session)
+        except BaseException:
+            self.release(session, discard=True)
+            raise
+        self.release(session)
+        return result
+
+    def clear(self):
+        """
+        關閉並移除所有閒置的 session (測試或設定變更時使用)。
+
+        使用中的 session 仍計入上限，歸還後回到池中，因此池的大小不會超過 size。
+        """
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            _close(session)
+            with self._lock:
+                self._created -= 1
+
+
+def _close(session):
+    """結束 session (支援 close() 或 context manager 介面)。"""
+    try:
+        if hasattr(session, "close"):
+            session.close()
+        elif hasattr(session, "__exit__"):
+            session.__exit__(None, None, None)
+    except Exception:
+        pass
+
+
+def stub_search(query: str, max_results: int) -> list:
+    """本地假搜尋後端：回傳由查詢字串決定的固定結果 (可用 SEARCH_STUB_LATENCY_MS 模擬延遲)。"""
+    if STUB_LATENCY:
+        time.sleep(STUB_LATENCY)
+    q = normalize_query(query)
+    return [
+        {"title": f"Result {i + 1} for {q}", "href": f"https://example.com/{i + 1}?q={q.replace(' ', '+')}",
+         "body": f"Stub snippet {i + 1} about {q}."}
+        for i in range(max_results)
+    ]
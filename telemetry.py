@@ -0,0 +1,239 @@
+"""
+Agent 每一步的效能紀錄。
+
+每個步驟 (agent / tools / should_continue / checkpoint / ui_render) 記錄一筆事件：
+牆鐘時間、prompt/completion tokens、工具名稱、重試次數、排隊等待時間等。
+
+- 最近 MAX_EVENTS 筆保存在記憶體中，供 latency_percentiles() 依模型計算 p50/p95/p99。
+- 設定 TELEMETRY_DIR (預設 .telemetry，設為空字串則停用) 時：
+    steps.jsonl    每筆事件一行 JSON (超過 TELEMETRY_MAX_MB 時輪替為 steps.jsonl.1)
+    metrics.prom   Prometheus 文字格式的彙總指標 (write_prometheus() 寫入)
+- register_gauges() 註冊的即時數值 (例如 checkpoint 資料庫大小、RSS) 在輸出指標時才讀取，以 gauge 輸出。
+
+record() 會在事件迴圈 (aagent) 與 checkpoint 寫入路徑上同步呼叫，因此只在鎖內把事件加入記憶體，
+steps.jsonl 的寫入與輪替交給背景寫入執行緒批次處理；需要讀檔前可呼叫 flush() 等待寫完。
+"""
+import atexit
+import json
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+TELEMETRY_DIR = os.environ.get("TELEMETRY_DIR", ".telemetry")
+MAX_EVENTS = int(os.environ.get("TELEMETRY_MAX_EVENTS", "10000"))
+MAX_FILE_BYTES = int(os.environ.get("TELEMETRY_MAX_MB", "50")) * 1024 * 1024
+QUANTILES = (0.5, 0.95, 0.99)
+
+_events = deque(maxlen=MAX_EVENTS)
+_lock = threading.Lock()
+# (目錄, 事件)：等待背景執行緒寫入 steps.jsonl
+_pending = queue.Queue()
+_writer = None
+_writer_lock = threading.Lock()
+# 名稱 -> provider()，回傳 {指標名稱: (說明, 數值)}
+_gauges = {}
+
+
+def _context(config) -> dict:
+    configurable = (config or {}).get("configurable", {})
+    return {"thread_id": configurable.get("thread_id"), "model": configurable.get("model_name", "unknown")}
+
+
+def record(event: dict):
+    """記錄一筆事件 (補上時間戳記)；設定 TELEMETRY_DIR 時由背景執行緒附加到 steps.jsonl。"""
+    event = {"ts": time.time(), **event}
+    with _lock:
+        _events.append(event)
+    if TELEMETRY_DIR:
+        _start_writer()
+        _pending.put((TELEMETRY_DIR, event))
+
+
+def _start_writer():
+    global _writer
+    if _writer is not None:
+        return
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_loop, name="telemetry-writer", daemon=True)
+            _writer.start()
+
+
+def _write_loop():
+    while True:
+        # 一次取出所有排隊的事件，每個目錄只開一次檔
+        batch = [_pending.get()]
+        while True:
+            try:
+                batch.append(_pending.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            by_dir = {}
+            for directory, event in batch:
+                by_dir.setdefault(directory, []).append(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+            for directory, lines in by_dir.items():
+                _append_lines(directory, lines)
+        finally:
+            for _ in batch:
+                _pending.task_done()
+
+
+def _append_lines(directory: str, lines: list):
+    try:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, "steps.jsonl")
+        if os.path.exists(path) and os.path.getsize(path) > MAX_FILE_BYTES:
+            os.replace(path, path + ".1")
+        with open(path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+    except OSError as e:
+        # 紀錄失敗不影響對話
+        print(f"Telemetry write failed: {e}")
+
+
+def flush():
+    """等待背景執行緒寫完目前排隊的事件。"""
+    if _writer is not None:
+        _pending.join()
+
+
+atexit.register(flush)
+
+
+@contextmanager
+def step(node: str, config=None, **fields):
+    """
+    量測一個步驟的牆鐘時間；區塊內可以在 yield 出來的 dict 補充欄位 (例如 tokens)。
+
+    >>> with step("agent", config) as event:
+    ...     event["retries"] = 1
+    """
+    event = {"node": node, **_context(config), **fields}
+    start = time.perf_counter()
+    try:
+        yield event
+        event.setdefault("status", "ok")
+    except BaseException:
+        event["status"] = "error"
+        raise
+    finally:
+        event["wall_ms"] = (time.perf_counter() - start) * 1000
+        record(event)
+
+
+def token_usage(message) -> dict:
+    """從 AIMessage 的 usage_metadata 取得 prompt/completion tokens (沒有則為 0)。"""
+    usage = getattr(message, "usage_metadata", None) or {}
+    return {"prompt_tokens": usage.get("input_tokens", 0), "completion_tokens": usage.get("output_tokens", 0)}
+
+
+def register_gauges(name: str, provider):
+    """註冊 gauge 來源 (同名覆蓋)；provider() 回傳 {指標名稱: (說明, 數值)}，於 prometheus_text() 時呼叫。"""
+    with _lock:
+        _gauges[name] = provider
+
+
+def events(node: str = None) -> list:
+    with _lock:
+        return [e for e in _events if node is None or e.get("node") == node]
+
+
+def clear():
+    with _lock:
+        _events.clear()
+
+
+def _percentile(sorted_values: list, q: float) -> float:
+    """nearest-rank 百分位數。"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def latency_percentiles(node: str = "agent") -> dict:
+    """依模型彙總 node 的牆鐘時間：{model: {"count", "p50", "p95", "p99"}} (毫秒)。"""
+    by_model = {}
+    for event in events(node):
+        by_model.setdefault(event.get("model", "unknown"), []).append(event["wall_ms"])
+    result = {}
+    for model, values in by_model.items():
+        values.sort()
+        result[model] = {"count": len(values), **{f"p{int(q * 100)}": _percentile(values, q) for q in QUANTILES}}
+    return result
+
+
+def _labels(**labels) -> str:
+    def escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{k}="{escape(v)}"' for k, v in labels.items())
+
+
+def prometheus_text() -> str:
+    """以 Prometheus 文字格式輸出彙總指標。"""
+    groups, tokens, retries, queue_wait = {}, {}, {}, {}
+    for event in events():
+        key = (event.get("node"), event.get("model", "unknown"), event.get("tool") or "")
+        groups.setdefault(key, []).append(event["wall_ms"] / 1000)
+        model = event.get("model", "unknown")
+        for kind in ("prompt", "completion"):
+            tokens[(model, kind)] = tokens.get((model, kind), 0) + event.get(f"{kind}_tokens", 0)
+        retries[key] = retries.get(key, 0) + event.get("retries", 0)
+        queue_wait[key] = queue_wait.get(key, 0) + event.get("queue_wait_ms", 0) / 1000
+
+    lines = [
+        "# HELP agent_step_seconds Wall time of agent graph steps.",
+        "# TYPE agent_step_seconds summary",
+    ]
+    for (node, model, tool), values in sorted(groups.items()):
+        labels = dict(node=node, model=model, **({"tool": tool} if tool else {}))
+        values = sorted(values)
+        for q in QUANTILES:
+            lines.append(f"agent_step_seconds{{{_labels(**labels, quantile=q)}}} {_percentile(values, q):.6f}")
+        lines.append(f"agent_step_seconds_sum{{{_labels(**labels)}}} {sum(values):.6f}")
+        lines.append(f"agent_step_seconds_count{{{_labels(**labels)}}} {len(values)}")
+
+    lines += ["# HELP agent_tokens_total LLM tokens used.", "# TYPE agent_tokens_total counter"]
+    for (model, kind), value in sorted(tokens.items()):
+        lines.append(f"agent_tokens_total{{{_labels(model=model, type=kind)}}} {value}")
+
+    for name, help_text, values in (
+        ("agent_retries_total", "Retried LLM calls.", retries),
+        ("agent_queue_wait_seconds_total", "Time spent waiting for a tool slot.", queue_wait),
+    ):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for (node, model, tool), value in sorted(values.items()):
+            if value:
+                labels = dict(node=node, model=model, **({"tool": tool} if tool else {}))
+                lines.append(f"{name}{{{_labels(**labels)}}} {value:g}")
+
+    with _lock:
+        providers = list(_gauges.values())
+    for provider in providers:
+        try:
+            gauges = provider()
+        except Exception:
+            # 單一來源失敗 (例如資料庫已關閉) 不影響其他指標
+            continue
+        for name, (help_text, value) in sorted(gauges.items()):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: str = None):
+    """寫入 Prometheus 文字檔 (供 node_exporter textfile collector 等讀取)。"""
+    if path is None:
+        if not TELEMETRY_DIR:
+            return None
+        path = os.path.join(TELEMETRY_DIR, "metrics.prom")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(tmp_path, path)
+    return path
@@ -3,20 +3,27 @@ import time
 from unittest.mock import MagicMock, patch
 import sys
 import os
-# 將父目錄加入 sys.path 以便匯入 agent
+# 將父目錄加入 sys.path 以便匯入 agent_engine
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from agent import app
+# 測試使用記憶體內的 checkpoint 資料庫且不輸出效能紀錄檔，不留下檔案，也不會讀到上次執行的對話
+os.environ.setdefault("CHECKPOINT_DB", ":memory:")
+os.environ.setdefault("TELEMETRY_DIR", "")
+import agent_engine
+from agent_engine import app, clear_model_cache, get_bound_model
 from langchain_core.messages import HumanMessage, AIMessage
 
 # 模擬 LLM 以避免需要 API 金鑰並確保確定性測試
 @pytest.fixture
 def mock_llm_response():
-    with patch("agent.ChatOpenAI") as mock_chat:
+    # 用戶端會被快取，每個測試前後都要清空以套用新的模擬物件
+    clear_model_cache()
+    with patch("agent_engine.ChatOpenAI") as mock_chat:
         mock_instance = mock_chat.return_value
         # 配置模擬以返回特定響應
         # 當被調用時，它應該返回一個 AIMessage
         mock_instance.bind_tools.return_value = mock_instance
         yield mock_instance
+    clear_model_cache()
 
 def test_math_workflow_success(mock_llm_response):
     """
@@ -80,6 +87,10 @@ def test_search_workflow_latency(mock_llm_response):
     # 但如果沒有金鑰/網絡，它可能會不穩定。我將在這個“基本”測試中模擬工具執行以保持穩定性。
     
     # 模擬 tools.DDGS (因為我們現在直接使用它)
+    import search_cache
+    import tools
+    search_cache.clear()
+    tools._ddgs_pool.clear()
     with patch("tools.DDGS") as mock_ddgs_cls:
         mock_ddgs_instance = mock_ddgs_cls.return_value
         mock_ddgs_instance.__enter__.return_value = mock_ddgs_instance
@@ -100,4 +111,485 @@ def test_search_workflow_latency(mock_llm_response):
         
         print(f"\n工作流程延遲: {duration:.4f}s")
         # 斷言它相當快（模擬應該非常快）
-        assert duration < 5.0 
+        assert duration < 5.0
+
+def test_bound_model_is_cached(mock_llm_response):
+    """同一個 (provider, model) 應重複使用已綁定工具的用戶端"""
+    with patch("agent_engine.ChatOpenAI") as mock_chat:
+        first = get_bound_model("cerebras", "llama-3.3-70b")
+        second = get_bound_model("cerebras", "llama-3.3-70b")
+
+        assert first is second
+        assert mock_chat.call_count == 1
+        assert mock_chat.return_value.bind_tools.call_count == 1
+
+def test_bound_model_invalidated_on_api_key_change(mock_llm_response, monkeypatch):
+    """API 金鑰變更後應重建用戶端"""
+    with patch("agent_engine.ChatOpenAI") as mock_chat:
+        monkeypatch.setenv("CEREBRAS_API_KEY", "key-a")
+        get_bound_model("cerebras", "llama-3.3-70b")
+        get_bound_model("cerebras", "llama-3.3-70b")
+        monkeypatch.setenv("CEREBRAS_API_KEY", "key-b")
+        get_bound_model("cerebras", "llama-3.3-70b")
+
+        assert mock_chat.call_count == 2
+        assert mock_chat.call_args.kwargs["api_key"] == "key-b"
+
+def test_bound_model_lru_eviction(mock_llm_response, monkeypatch):
+    """超過快取大小時應淘汰最久未使用的用戶端"""
+    monkeypatch.setattr(agent_engine, "MODEL_CACHE_SIZE", 2)
+    with patch("agent_engine.ChatOpenAI") as mock_chat:
+        get_bound_model("cerebras", "model-a")
+        get_bound_model("cerebras", "model-b")
+        get_bound_model("cerebras", "model-a")  # model-a 變為最近使用
+        get_bound_model("cerebras", "model-c")  # 淘汰 model-b
+
+        assert list(agent_engine._model_cache) == [("cerebras", "model-a"), ("cerebras", "model-c")]
+        get_bound_model("cerebras", "model-b")
+        assert mock_chat.call_count == 4
+
+def test_async_workflow(mock_llm_response):
+    """測試非同步路徑 (astream)：agent 節點應使用 ainvoke"""
+    import asyncio
+    from unittest.mock import AsyncMock
+
+    mock_llm_response.ainvoke = AsyncMock(side_effect=[
+        AIMessage(content="", tool_calls=[{"name": "multiply", "args": {"a": 6, "b": 7}, "id": "call_async_1"}]),
+        AIMessage(content="The result is 42.")
+    ])
+
+    async def run():
+        inputs = {"messages": [HumanMessage(content="What is 6 * 7?")]}
+        config = {"configurable": {"thread_id": "test_async_1"}}
+        return [event async for event in app.astream(inputs, config=config, stream_mode="values")]
+
+    events = asyncio.run(run())
+    assert "42" in events[-1]["messages"][-1].content
+    assert mock_llm_response.ainvoke.await_count == 2
+    mock_llm_response.invoke.assert_not_called()
+
+def test_token_streaming_events(mock_llm_response):
+    """UI 串流應逐 token 收到文字，而不是整段回答一次出現"""
+    import asyncio
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+    from agent_engine import astream_events
+
+    mock_llm_response.bind_tools.return_value = GenericFakeChatModel(
+        messages=iter([AIMessage(content="LangGraph streams tokens one by one")])
+    )
+
+    async def run():
+        inputs = {"messages": [HumanMessage(content="Hi")]}
+        config = {"configurable": {"thread_id": "test_stream_tokens"}}
+        return [event async for event in astream_events(inputs, config)]
+
+    events = asyncio.run(run())
+    tokens = [data for kind, data in events if kind == "token"]
+    assert len(tokens) > 1
+    assert tokens[-1] == "LangGraph streams tokens one by one"
+    assert events[-1] == ("final", "LangGraph streams tokens one by one")
+
+def test_streaming_reports_tool_progress(mock_llm_response):
+    """工具呼叫與結果應以事件回報給 UI"""
+    import asyncio
+    from unittest.mock import AsyncMock
+    from agent_engine import astream_events
+
+    mock_llm_response.ainvoke = AsyncMock(side_effect=[
+        AIMessage(content="", tool_calls=[{"name": "add", "args": {"a": 1, "b": 2}, "id": "call_stream_1"}]),
+        AIMessage(content="The result is 3.")
+    ])
+
+    async def run():
+        inputs = {"messages": [HumanMessage(content="What is 1 + 2?")]}
+        config = {"configurable": {"thread_id": "test_stream_tools"}}
+        return [event async for event in astream_events(inputs, config)]
+
+    events = asyncio.run(run())
+    kinds = [kind for kind, _ in events]
+    assert kinds.index("tool_call") < kinds.index("tool_result") < kinds.index("final")
+    assert events[kinds.index("tool_call")][1]["name"] == "add"
+    assert events[-1] == ("final", "The result is 3.")
+
+def _run_conversation(checkpointer, thread_id, llm, turns=1):
+    """以指定的 checkpointer 編譯同一張圖並執行數輪對話"""
+    graph = agent_engine.workflow.compile(checkpointer=checkpointer)
+    config = {"configurable": {"thread_id": thread_id}}
+    for i in range(turns):
+        llm.invoke.side_effect = [AIMessage(content=f"answer {i} " + "x" * 2000)]
+        graph.invoke({"messages": [HumanMessage(content=f"question {i}")]}, config)
+    return graph, config
+
+def test_checkpointer_persists_across_instances(mock_llm_response, tmp_path):
+    """對話狀態寫入 SQLite，另一個 checkpointer (例如另一個工作程序) 可讀回"""
+    from checkpointer import SqliteCheckpointer
+
+    db = str(tmp_path / "agent.sqlite")
+    _run_conversation(SqliteCheckpointer(db), "persist", mock_llm_response, turns=2)
+
+    graph = agent_engine.workflow.compile(checkpointer=SqliteCheckpointer(db))
+    messages = graph.get_state({"configurable": {"thread_id": "persist"}}).values["messages"]
+    assert [m.content for m in messages if isinstance(m, HumanMessage)] == ["question 0", "question 1"]
+    assert messages[-1].content.startswith("answer 1")
+
+def test_checkpointer_bounded_and_compressed(mock_llm_response):
+    """每個 thread 只保留最新的幾個 checkpoint，大型訊息以壓縮格式保存"""
+    from checkpointer import SqliteCheckpointer
+
+    saver = SqliteCheckpointer(keep_checkpoints=2)
+    graph, config = _run_conversation(saver, "bounded", mock_llm_response, turns=5)
+
+    assert saver.stats()["checkpoints"] == 2
+    assert len(graph.get_state(config).values["messages"]) == 10
+    # 只保留最新 checkpoint 仍引用的 messages 版本
+    assert saver.conn.execute("SELECT COUNT(*) FROM blobs WHERE channel = 'messages'").fetchone()[0] <= 2
+    types = {row[0] for row in saver.conn.execute("SELECT type FROM blobs WHERE channel = 'messages'")}
+    assert all(t.startswith("z:") for t in types)
+
+def test_checkpointer_evicts_idle_threads(mock_llm_response):
+    """閒置超過 TTL 或超過 thread 數上限的對話會被刪除"""
+    from checkpointer import SqliteCheckpointer
+
+    saver = SqliteCheckpointer(max_threads=2, ttl_seconds=3600)
+    for thread_id in ("t1", "t2", "t3"):
+        _run_conversation(saver, thread_id, mock_llm_response)
+    saver.conn.execute("UPDATE threads SET last_access = last_access - 10 WHERE thread_id = 't1'")
+    assert saver.evict() == 1
+    assert saver.get_tuple({"configurable": {"thread_id": "t1"}}) is None
+    assert saver.get_tuple({"configurable": {"thread_id": "t3"}}) is not None
+
+    saver.conn.execute("UPDATE threads SET last_access = last_access - 7200 WHERE thread_id = 't2'")
+    assert saver.evict() == 1
+    stats = saver.stats()
+    assert stats["threads"] == 1
+    assert stats["db_bytes"] > 0 and stats["rss_bytes"] > 0
+    assert saver.gauges()["agent_checkpoint_db_bytes"][1] == stats["db_bytes"]
+
+def test_context_budget_keeps_input_tokens_flat():
+    """對話變長時，每一步的輸入 token 數維持在預算內，且工具呼叫不會與結果拆開"""
+    from langchain_core.messages import ToolMessage
+    from context_budget import build_context, count_tokens
+
+    calls = []
+    def summarize_fn(previous, dropped):
+        calls.append(len(dropped))
+        return f"{previous} +{len(dropped)}".strip()
+
+    messages, summary, count, sizes = [], "", 0, []
+    for i in range(30):
+        messages += [
+            HumanMessage(content=f"search topic {i}"),
+            AIMessage(content="", tool_calls=[{"name": "search_duckduckgo", "args": {"query": str(i)}, "id": f"c{i}"}]),
+            ToolMessage(content="snippet " * 1000, tool_call_id=f"c{i}"),
+            AIMessage(content=f"answer {i}"),
+        ]
+        context, summary, count = build_context(messages, summary, count, summarize_fn, max_tokens=3000)
+        sizes.append(count_tokens(context))
+        ids = {m.tool_call_id for m in context if isinstance(m, ToolMessage)}
+        assert ids == {c["id"] for m in context if isinstance(m, AIMessage) for c in m.tool_calls}
+
+    assert max(sizes) <= 3000
+    # 摘要是增量且有快取的：不會每一步都重新摘要
+    assert 0 < len(calls) < 30
+    assert sum(calls) == count
+    assert context[0].content.startswith("Summary of the earlier conversation")
+
+def test_agent_writes_rolling_summary_to_state(mock_llm_response):
+    """超出預算時，代理人節點以 (未綁定工具的) 模型產生摘要並寫入 state"""
+    responses = [AIMessage(content=f"long answer {i} " + "y" * 4000) for i in range(3)]
+    mock_llm_response.with_config.return_value = mock_llm_response
+    mock_llm_response.invoke.side_effect = [
+        responses[0], responses[1], AIMessage(content="user asked three questions"), responses[2]
+    ]
+    config = {"configurable": {"thread_id": "test_summary", "context_max_tokens": 1500}}
+    for i in range(3):
+        result = app.invoke({"messages": [HumanMessage(content=f"question {i}")]}, config)
+
+    state = app.get_state(config).values
+    assert state["summary"] == "user asked three questions"
+    assert state["summarized_count"] == 4
+    assert result["messages"][-1].content.startswith("long answer 2")
+    # 最後一次呼叫只送出系統提示、摘要與目前這一輪
+    final_input = mock_llm_response.invoke.call_args_list[-1].args[0]
+    assert len(final_input) == 3
+
+def _sleepy_tools():
+    from langchain_core.tools import tool
+
+    @tool
+    def slow_search(query: str) -> str:
+        """模擬延遲的搜尋。"""
+        time.sleep(0.3)
+        return f"result for {query}"
+
+    @tool
+    def heavy_job(name: str) -> str:
+        """模擬重量級工作。"""
+        time.sleep(0.2)
+        return f"done {name}"
+
+    return slow_search, heavy_job
+
+def test_tool_executor_runs_calls_in_parallel_and_in_order():
+    """多個工具呼叫平行執行 (耗時約為最慢的一個)，結果依原始順序回傳"""
+    from tool_executor import ParallelToolExecutor
+
+    slow_search, heavy_job = _sleepy_tools()
+    executor = ParallelToolExecutor([slow_search, heavy_job], limits={"slow_search": 4, "heavy_job": 1})
+    calls = [{"name": "slow_search", "args": {"query": f"q{i}"}, "id": f"s{i}"} for i in range(4)]
+    calls += [{"name": "heavy_job", "args": {"name": f"j{i}"}, "id": f"h{i}"} for i in range(2)]
+
+    start = time.time()
+    results = executor.invoke_calls(calls)
+    duration = time.time() - start
+
+    assert [m.tool_call_id for m in results] == [c["id"] for c in calls]
+    assert results[0].content == "result for q0" and results[5].content == "done j1"
+    # 4 個搜尋同時進行 (0.3s)；重量級工具上限為 1，兩個依序執行 (0.4s)
+    assert 0.35 < duration < 0.9
+    executor.shutdown()
+
+def test_tool_executor_timeouts_and_errors():
+    """逾時、工具錯誤與不存在的工具都以錯誤 ToolMessage 回報"""
+    import asyncio
+    from tool_executor import ParallelToolExecutor
+    from tools import add
+
+    slow_search, _ = _sleepy_tools()
+    executor = ParallelToolExecutor([slow_search, add], timeouts={"slow_search": 0.05})
+    calls = [
+        {"name": "slow_search", "args": {"query": "late"}, "id": "c1"},
+        {"name": "add", "args": {"a": "not a number"}, "id": "c2"},
+        {"name": "missing_tool", "args": {}, "id": "c3"},
+        {"name": "add", "args": {"a": 1, "b": 2}, "id": "c4"},
+    ]
+    for results in (executor.invoke_calls(calls), asyncio.run(executor.ainvoke_calls(calls))):
+        assert [m.status for m in results] == ["error", "error", "error", "success"]
+        assert "timed out" in results[0].content
+        assert "not a valid tool" in results[2].content
+        assert results[3].content == "3"
+    # 等逾時但仍在執行的呼叫結束，避免其效能紀錄混入之後的測試
+    executor.shutdown(wait=True)
+
+def test_tool_executor_skips_calls_that_timed_out_while_queued():
+    """等待同時執行名額時已逾時的呼叫不會再執行 (不產生副作用)"""
+    from langchain_core.tools import tool
+    from tool_executor import ParallelToolExecutor
+
+    started = []
+
+    @tool
+    def side_effect(name: str) -> str:
+        """模擬有副作用的工具。"""
+        started.append(name)
+        time.sleep(0.5)
+        return name
+
+    executor = ParallelToolExecutor([side_effect], limits={"side_effect": 1}, timeouts={"side_effect": 0.7})
+    calls = [{"name": "side_effect", "args": {"name": f"j{i}"}, "id": f"j{i}"} for i in range(3)]
+    results = executor.invoke_calls(calls)
+    executor.shutdown(wait=True)
+
+    assert [m.status for m in results] == ["success", "error", "error"]
+    assert "timed out after 0.7s" in results[2].content
+    # 第二個在截止前拿到名額 (無法中途停止)，第三個排隊時已逾時，不再執行
+    assert started == ["j0", "j1"]
+
+def test_graph_executes_multiple_tool_calls(mock_llm_response):
+    """圖中的工具節點一次執行同一則訊息中的所有 tool_calls"""
+    mock_llm_response.invoke.side_effect = [
+        AIMessage(content="", tool_calls=[
+            {"name": "multiply", "args": {"a": 6, "b": 7}, "id": "m1"},
+            {"name": "add", "args": {"a": 1, "b": 2}, "id": "a1"},
+        ]),
+        AIMessage(content="42 and 3"),
+    ]
+    config = {"configurable": {"thread_id": "test_multi_tools"}}
+    result = app.invoke({"messages": [HumanMessage(content="6*7 and 1+2?")]}, config)
+    tool_messages = [m.content for m in result["messages"] if m.type == "tool"]
+    assert tool_messages == ["42", "3"]
+    assert result["messages"][-1].content == "42 and 3"
+
+def test_fast_path_safe_evaluator():
+    """快速路徑只處理純算術，其餘 (或不安全的運算式) 交給 LLM"""
+    from fast_path import safe_eval, try_answer
+
+    assert try_answer("What is 100 * 200?") == "100 * 200 = 20000"
+    assert try_answer("compute (2 + 3) * 4") == "(2 + 3) * 4 = 20"
+    assert try_answer("what's 5 plus 7") == "5 + 7 = 12"
+    assert try_answer("10 divided by 4") == "10 / 4 = 2.5"
+    assert try_answer("Calculate 1,000 x 3") == "1000 * 3 = 3000"
+
+    assert try_answer("Search for LangGraph") is None
+    # 沒有空格的斜線數字多半是事件或日期，除非明確要求計算
+    assert try_answer("What is 9/11?") is None
+    assert try_answer("what's 24/7") is None and try_answer("12/25/2024") is None
+    assert try_answer("Calculate 9/11") == "9/11 = 0.818181818182"
+    assert try_answer("What is 9 / 12?") == "9 / 12 = 0.75"
+    assert try_answer("What is 1 / 0?") is None
+    assert try_answer("What is 9 ** 9 ** 9?") is None
+    assert safe_eval("__import__('os').system('echo hi')") is None
+    assert safe_eval("(1).__class__") is None
+
+def test_fast_path_skips_llm_when_enabled(mock_llm_response):
+    """開啟 fast_path 時算術問題不呼叫 LLM；預設關閉時仍走原本的流程"""
+    inputs = {"messages": [HumanMessage(content="What is 100 * 200?")]}
+    result = app.invoke(inputs, {"configurable": {"thread_id": "test_fast_on", "fast_path": True}})
+    assert result["messages"][-1].content == "100 * 200 = 20000"
+    mock_llm_response.invoke.assert_not_called()
+
+    mock_llm_response.invoke.side_effect = [AIMessage(content="The result is 20000.")]
+    result = app.invoke(inputs, {"configurable": {"thread_id": "test_fast_off"}})
+    assert result["messages"][-1].content == "The result is 20000."
+    assert mock_llm_response.invoke.call_count == 1
+
+    # 非算術問題即使開啟快速路徑也交給 LLM
+    mock_llm_response.invoke.side_effect = [AIMessage(content="Hello!")]
+    result = app.invoke({"messages": [HumanMessage(content="Hi there")]},
+                        {"configurable": {"thread_id": "test_fast_other", "fast_path": True}})
+    assert result["messages"][-1].content == "Hello!"
+
+def test_response_cache_tiers_and_bypass(monkeypatch):
+    """完全相同與 (開啟時) 高度相似的問題命中快取；數字或否定詞不同、過期或使用有副作用工具的回答不命中"""
+    import response_cache
+    response_cache.clear()
+
+    assert response_cache.store("cerebras", "llama", "What is LangGraph?", "A graph library.", {"multiply"})
+    assert response_cache.lookup("cerebras", "llama", "  what is langgraph ") == ("A graph library.", "exact")
+    assert response_cache.lookup("cerebras", "llama", "What is LangChain?", similarity=True) is None
+
+    response_cache.store("cerebras", "llama", "What are the latest trends in large language model inference?", "Trends.")
+    similar = "what are the latest trends in large language models inference"
+    assert response_cache.lookup("cerebras", "llama", similar) is None
+    assert response_cache.lookup("cerebras", "llama", similar, similarity=True) == ("Trends.", "similar")
+    assert response_cache.lookup("cerebras", "other-model", "What is LangGraph?") is None
+    assert response_cache.lookup("cerebras", "llama", "How do I bake bread?", similarity=True) is None
+
+    response_cache.store("cerebras", "llama", "Summarize OpenML dataset 61", "Iris.")
+    assert response_cache.lookup("cerebras", "llama", "Summarize OpenML dataset 31", similarity=True) is None
+    response_cache.store("cerebras", "llama", "Should I use pandas for this task?", "Yes.")
+    assert response_cache.lookup("cerebras", "llama", "Should I not use pandas for this task?", similarity=True) is None
+    assert response_cache.lookup("cerebras", "llama", "Shouldn't I use pandas for this task?", similarity=True) is None
+
+    assert not response_cache.store("cerebras", "llama", "Train on titanic", "Job ID: abc", {"train_tabular_model"})
+    assert response_cache.lookup("cerebras", "llama", "Train on titanic") is None
+    assert not response_cache.store("cerebras", "llama", "Latest AI news?", "News.", {"search_duckduckgo"})
+
+    monkeypatch.setattr(response_cache, "CACHE_TTL", -1)
+    response_cache.store("cerebras", "llama", "Expired question", "old")
+    assert response_cache.lookup("cerebras", "llama", "Expired question") is None
+
+    stats = response_cache.stats()
+    assert (stats["exact_hits"], stats["similar_hits"], stats["bypassed"]) == (1, 1, 2)
+    assert stats["hit_rate"] == pytest.approx(2 / 11)
+    response_cache.clear()
+
+def test_response_cache_in_front_of_agent(mock_llm_response):
+    """新對話的重複問題不再呼叫 LLM，且回答寫入 thread 的 state"""
+    import asyncio
+    import response_cache
+    from unittest.mock import AsyncMock
+    from agent_engine import astream_events
+    response_cache.clear()
+
+    mock_llm_response.ainvoke = AsyncMock(side_effect=[
+        AIMessage(content="", tool_calls=[{"name": "add", "args": {"a": 1, "b": 2}, "id": "call_cache"}]),
+        AIMessage(content="LangGraph builds agents."),
+    ])
+
+    def ask(thread_id, prompt):
+        config = {"configurable": {"thread_id": thread_id, "provider": "cerebras",
+                                   "model_name": "llama-3.3-70b", "response_cache": True}}
+        async def run():
+            return [event async for event in astream_events({"messages": [HumanMessage(content=prompt)]}, config)]
+        return asyncio.run(run())[-1][1], config
+
+    assert ask("cache_a", "What is LangGraph?")[0] == "LangGraph builds agents."
+    answer, config = ask("cache_b", "what is langgraph")
+    assert answer == "LangGraph builds agents."
+    assert mock_llm_response.ainvoke.call_count == 2
+
+    messages = app.get_state(config).values["messages"]
+    assert [m.type for m in messages] == ["human", "ai"]
+    assert response_cache.stats()["exact_hits"] == 1
+
+    # 既有對話中的追問不使用快取
+    mock_llm_response.ainvoke.side_effect = [AIMessage(content="A follow-up answer.")]
+    assert ask("cache_b", "What is LangGraph?")[0] == "A follow-up answer."
+    response_cache.clear()
+
+def test_telemetry_records_agent_and_tool_steps(mock_llm_response, monkeypatch, tmp_path):
+    """每一步記錄牆鐘時間、tokens、重試次數、工具名稱與排隊時間，並輸出 JSONL 與 Prometheus 文字檔"""
+    import json
+    import httpx
+    import openai
+    import telemetry
+
+    telemetry.clear()
+    monkeypatch.setattr(telemetry, "TELEMETRY_DIR", str(tmp_path))
+    monkeypatch.setattr(agent_engine, "_backoff", lambda attempt: 0)
+    connection_error = openai.APIConnectionError(request=httpx.Request("POST", "https://api.cerebras.ai/v1"))
+    mock_llm_response.invoke.side_effect = [
+        connection_error,
+        AIMessage(content="", tool_calls=[{"name": "add", "args": {"a": 1, "b": 2}, "id": "call_t"}],
+                  usage_metadata={"input_tokens": 120, "output_tokens": 8, "total_tokens": 128}),
+        AIMessage(content="3", usage_metadata={"input_tokens": 140, "output_tokens": 2, "total_tokens": 142}),
+    ]
+    config = {"configurable": {"thread_id": "test_telemetry", "model_name": "llama-3.3-70b"}}
+    app.invoke({"messages": [HumanMessage(content="1 + 2?")]}, config)
+
+    agent_steps = telemetry.events("agent")
+    assert [e["retries"] for e in agent_steps] == [1, 0]
+    assert [(e["prompt_tokens"], e["completion_tokens"]) for e in agent_steps] == [(120, 8), (140, 2)]
+    assert all(e["model"] == "llama-3.3-70b" and e["wall_ms"] >= e["llm_ms"] for e in agent_steps)
+    tool_step, = telemetry.events("tools")
+    assert tool_step["tool"] == "add" and tool_step["queue_wait_ms"] >= 0
+    assert len(telemetry.events("should_continue")) == 2
+    assert telemetry.events("checkpoint")
+
+    latency = telemetry.latency_percentiles("agent")["llama-3.3-70b"]
+    assert latency["count"] == 2 and latency["p50"] <= latency["p95"] <= latency["p99"]
+
+    # steps.jsonl 由背景執行緒寫入
+    telemetry.flush()
+    lines = (tmp_path / "steps.jsonl").read_text(encoding="utf-8").splitlines()
+    assert {json.loads(line)["node"] for line in lines} >= {"agent", "tools", "should_continue"}
+    metrics = open(telemetry.write_prometheus(), encoding="utf-8").read()
+    assert 'agent_step_seconds_count{node="agent",model="llama-3.3-70b"} 2' in metrics
+    assert 'agent_tokens_total{model="llama-3.3-70b",type="prompt"} 260' in metrics
+    assert 'agent_retries_total{node="agent",model="llama-3.3-70b"} 1' in metrics
+    # agent_engine 的 checkpointer 用量以 gauge 輸出
+    assert "# TYPE agent_checkpoint_db_bytes gauge" in metrics
+    assert int(metrics.split("\nagent_process_rss_bytes ")[1].split("\n")[0]) > 0
+    telemetry.clear()
+
+def test_telemetry_file_writes_do_not_block_record(monkeypatch, tmp_path):
+    """steps.jsonl 在背景執行緒寫入：檔案 I/O 變慢時 record() 與 events() 不會被卡住"""
+    import json
+    import threading
+    import telemetry
+
+    telemetry.clear()
+    monkeypatch.setattr(telemetry, "TELEMETRY_DIR", str(tmp_path))
+    writing, release = threading.Event(), threading.Event()
+    original = telemetry._append_lines
+
+    def slow_append(directory, lines):
+        writing.set()
+        release.wait(5)
+        original(directory, lines)
+
+    monkeypatch.setattr(telemetry, "_append_lines", slow_append)
+    telemetry.record({"node": "slow_io", "wall_ms": 1.0})
+    assert writing.wait(5)
+
+    start = time.perf_counter()
+    telemetry.record({"node": "slow_io", "wall_ms": 2.0})
+    assert len(telemetry.events("slow_io")) == 2
+    assert time.perf_counter() - start < 0.1
+
+    release.set()
+    telemetry.flush()
+    lines = (tmp_path / "steps.jsonl").read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["wall_ms"] for line in lines] == [1.0, 2.0]
+    telemetry.clear()
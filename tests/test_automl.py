@@ -1,7 +1,26 @@
 import pytest
+import os
+import time
 from automl_v3_final import AutoMLEngine
 from tools import train_tabular_model
 
+@pytest.fixture(autouse=True)
+def isolated_dirs(tmp_path, monkeypatch):
+    # 訓練會寫入模型登錄、資料集快取與工作目錄；全部導向 tmp_path，避免在專案目錄留下 models/ 等檔案
+    import automl_jobs
+    import automl_pool
+    import dataset_cache
+    import model_registry
+    monkeypatch.setattr(model_registry, "REGISTRY_DIR", str(tmp_path / "models"))
+    monkeypatch.setattr(dataset_cache, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(automl_jobs, "JOB_DIR", str(tmp_path / "jobs"))
+    model_registry.clear_warm_cache()
+    # 常駐的工作程序在建立時才取得目錄設定，每個測試使用新的程序池
+    automl_pool.shutdown_pool()
+    yield
+    automl_pool.shutdown_pool()
+    model_registry.clear_warm_cache()
+
 def test_iris_training():
     engine = AutoMLEngine(time_budget=5)
     result = engine.train_from_openml(61)
@@ -11,8 +30,15 @@ def test_iris_training():
     assert result["test_accuracy"] > 0.5
     
 def test_tool_execution():
-    result = train_tabular_model.invoke({"dataset_source": "openml:61"})
-    
+    import automl_jobs
+    from tools import get_training_status
+
+    submitted = train_tabular_model.invoke({"dataset_source": "openml:61"})
+    assert "Job ID" in submitted
+    job_id = submitted.split("Job ID: ")[1].split("\n")[0]
+    automl_jobs.wait_for_job(job_id, timeout=120)
+
+    result = get_training_status.invoke({"job_id": job_id})
     assert "AutoML Training Complete" in result
     assert "Accuracy" in result
     assert "Precision" in result
@@ -21,3 +47,487 @@ def test_tool_execution():
     
     # Iris 是一個簡單的資料集，準確率應該要很高
     # 但因為時間只有 5-10 秒，不做過度嚴格要求
+
+def test_job_submit_returns_immediately_and_completes():
+    import automl_jobs
+    from tools import get_training_status, get_training_results
+
+    start = time.time()
+    job_id = automl_jobs.submit_job("titanic.csv", "Survived", time_budget=10)
+    assert time.time() - start < 1.0
+    assert automl_jobs.get_job(job_id)["status"] in (automl_jobs.QUEUED, automl_jobs.RUNNING)
+
+    job = automl_jobs.wait_for_job(job_id, timeout=120)
+    assert job["status"] == automl_jobs.COMPLETED
+    assert "test_accuracy" in job["result"]
+    assert "AutoML Training Complete" in get_training_status.invoke({"job_id": job_id})
+    assert "Leaderboard" in get_training_results.invoke({"job_id": job_id})
+    assert len(automl_jobs.get_leaderboard(job_id)) >= 1
+    # 背景計算的附加資訊完成後補進 job.json
+    deadline = time.time() + 60
+    while "classification_report" not in automl_jobs.get_job(job_id)["result"] and time.time() < deadline:
+        time.sleep(0.2)
+    assert "feature_importance" in automl_jobs.get_job(job_id)["result"]
+
+def test_job_cancellation():
+    import automl_jobs
+    from tools import cancel_training
+
+    job_id = automl_jobs.submit_job("titanic.csv", "Survived", time_budget=10)
+    assert "cancel" in cancel_training.invoke({"job_id": job_id}).lower()
+
+    job = automl_jobs.wait_for_job(job_id, timeout=120)
+    assert job["status"] == automl_jobs.CANCELLED
+
+def test_job_not_found(tmp_path):
+    import automl_jobs
+    from tools import cancel_training, get_training_status
+    assert "not found" in get_training_status.invoke({"job_id": "missing"})
+
+    # job ID 來自 LLM，不能用來讀寫工作目錄以外的檔案
+    (tmp_path / "job.json").write_text('{"status": "completed", "result": {}}')
+    assert automl_jobs.get_job("..") is None
+    assert automl_jobs.get_leaderboard("../jobs") == []
+    assert "not found" in cancel_training.invoke({"job_id": ".."})
+    assert not (tmp_path / "cancel").exists()
+    with pytest.raises(ValueError):
+        automl_jobs._job_path(automl_jobs.JOB_DIR, "../../etc", "job.json")
+
+def test_pool_training_on_csv():
+    import automl_pool
+    result = automl_pool.submit_training("titanic.csv", "Survived", time_budget=10).result()
+
+    assert "best_estimator" in result
+    assert result["test_accuracy"] > 0.5
+
+def test_pool_dev_reload_only_on_mtime_change(tmp_path, monkeypatch):
+    import automl_pool
+    module_file = tmp_path / "automl_v3_final.py"
+    module_file.write_text("# stub")
+    os.utime(module_file, (1000, 1000))
+    monkeypatch.setattr(automl_pool, "AUTOML_MODULE_PATH", str(module_file))
+    monkeypatch.setattr(automl_pool, "DEV_RELOAD", True)
+    automl_pool.shutdown_pool()
+
+    pool = automl_pool.get_pool()
+    # 檔案未變更時應重複使用同一個程序池
+    assert automl_pool.get_pool() is pool
+
+    os.utime(module_file, (2000, 2000))
+    assert automl_pool.get_pool() is not pool
+    automl_pool.shutdown_pool()
+
+def test_scheduler_preempts_at_deadline():
+    from automl_scheduler import run_with_deadline, OK, TIMEOUT
+
+    start = time.time()
+    outcomes = run_with_deadline(
+        [("fast", abs, (-1,)), ("slow", time.sleep, (30,))],
+        deadline=start + 1.0,
+        n_jobs=2,
+    )
+
+    assert time.time() - start < 5.0
+    assert outcomes["fast"] == (OK, 1)
+    assert outcomes["slow"][0] == TIMEOUT
+
+def test_scheduler_reports_errors_and_cancellation():
+    from automl_scheduler import run_with_deadline, ERROR, CANCELLED
+
+    outcomes = run_with_deadline([("bad", int, ("x",))], deadline=time.time() + 10)
+    assert outcomes["bad"][0] == ERROR
+
+    outcomes = run_with_deadline(
+        [("slow", time.sleep, (30,))],
+        deadline=time.time() + 30,
+        should_stop=lambda: True,
+    )
+    assert outcomes["slow"][0] == CANCELLED
+
+def test_training_keeps_only_finished_candidates():
+    engine = AutoMLEngine(time_budget=10, n_jobs=3)
+    result = engine.train_from_csv("titanic.csv", "Survived")
+
+    assert result["best_estimator"] in ("RandomForest", "GradientBoosting", "LogisticRegression")
+    assert result["training_duration"] < 10 + 5
+
+def test_preprocessing_fit_once_and_pipeline_predicts_raw_rows():
+    import pandas as pd
+    from unittest.mock import patch
+    from sklearn.compose import ColumnTransformer
+
+    df = pd.read_csv("titanic.csv")
+    X, y = df.drop(columns=["Survived"]), df["Survived"]
+    engine = AutoMLEngine(time_budget=10)
+
+    original = ColumnTransformer.fit_transform
+    with patch.object(ColumnTransformer, "fit_transform", autospec=True, side_effect=original) as spy:
+        result = engine.train(X, y)
+
+    assert spy.call_count == 1
+    assert "best_estimator" in result
+    assert len(engine.best_model.predict(X.head(5))) == 5
+
+def test_successive_halving_search_logs_trials():
+    from sklearn.datasets import make_classification
+    import numpy as np
+    from automl_evaluation import HoldoutEvaluator
+    from automl_search import SuccessiveHalvingSearch, estimate_cost
+
+    X, y = make_classification(n_samples=400, n_features=8, random_state=0)
+    search = SuccessiveHalvingSearch(n_configs=9, eta=3, min_samples=50)
+    assert search._schedule(320) == [106, 320]
+
+    best = search.run(X[:320], y[:320], deadline=time.time() + 60)
+    family, params, model, score = best
+
+    rungs = [t["rung"] for t in search.trials]
+    assert rungs.count(0) == 9
+    assert max(rungs) >= 1
+    assert all(t["status"] == "ok" for t in search.trials)
+    assert score > 0.5
+    assert model.predict(X[:5]).shape == (5,)
+    # 預設的 holdout 驗證集取自傳入的訓練列 (分層抽樣)，搜尋不需要測試集
+    (train_rows, val_rows), = HoldoutEvaluator().splits(np.arange(320), y[:320])
+    assert len(val_rows) == 64 and sorted(np.concatenate([train_rows, val_rows])) == list(range(320))
+    assert abs(y[val_rows].mean() - y[:320].mean()) < 0.02
+    # 成本估計：大型森林應比邏輯迴歸昂貴
+    assert estimate_cost("RandomForest", {"n_estimators": 300}, 1000) > estimate_cost("LogisticRegression", {}, 1000)
+
+def test_scheduler_aborts_cancelled_keys():
+    from automl_scheduler import run_with_deadline, OK, ABORTED
+
+    aborted = set()
+    outcomes = run_with_deadline(
+        [("first", int, ("1",)), ("slow", time.sleep, (30,)), ("never", time.sleep, (30,))],
+        deadline=time.time() + 30,
+        n_jobs=2,
+        on_result=lambda key, status, value: aborted.update({"slow", "never"}) if key == "first" else None,
+        should_cancel=lambda key: key in aborted,
+    )
+    assert outcomes == {"first": (OK, 1), "slow": (ABORTED, None), "never": (ABORTED, None)}
+
+def test_cross_validation_search_aborts_weak_candidates():
+    from sklearn.datasets import make_classification
+    from automl_evaluation import CrossValidationEvaluator, HoldoutEvaluator, can_beat, choose_evaluator
+    from automl_search import SuccessiveHalvingSearch
+
+    # 3 個 fold 平均 0.6，即使剩下 2 個 fold 滿分也只有 0.76
+    assert not can_beat([0.6, 0.6, 0.6], 5, incumbent=0.8)
+    assert can_beat([0.6], 5, incumbent=0.8) and can_beat([0.1], 5, incumbent=None)
+    assert isinstance(choose_evaluator(500), CrossValidationEvaluator)
+    assert isinstance(choose_evaluator(500, max_rows=100), HoldoutEvaluator)
+    assert isinstance(choose_evaluator(500, cv_folds=1), HoldoutEvaluator)
+
+    X, y = make_classification(n_samples=300, n_features=8, random_state=0)
+    search = SuccessiveHalvingSearch(n_configs=6, eta=3, min_samples=500, n_jobs=2,
+                                     evaluator=CrossValidationEvaluator(n_splits=4))
+    family, params, model, score = search.run(X, y, deadline=time.time() + 60)
+
+    assert {t["status"] for t in search.trials} <= {"ok", "aborted"}
+    for trial in search.trials:
+        if trial["status"] == "ok":
+            assert trial["folds"] == 4 and trial["score"] == pytest.approx(sum(trial["fold_scores"]) / 4)
+        else:
+            assert trial["incumbent"] >= trial["score"]
+    assert score == max(t["score"] for t in search.trials if t["status"] == "ok")
+    # 選出的設定以全部的訓練列重新訓練
+    assert model.predict(X[:5]).shape == (5,)
+
+def test_holdout_selection_never_sees_test_split():
+    """holdout (大資料或 cv_folds < 2) 也只從訓練列切驗證集，測試集不傳入搜尋"""
+    import pandas as pd
+    from unittest.mock import patch
+    from automl_search import SuccessiveHalvingSearch
+
+    df = pd.read_csv("titanic.csv")
+    X, y = df.drop(columns=["Survived"]), df["Survived"]
+    engine = AutoMLEngine(time_budget=10, n_configs=3, cv_folds=0)
+
+    original = SuccessiveHalvingSearch.run
+    with patch.object(SuccessiveHalvingSearch, "run", autospec=True, side_effect=original) as spy:
+        result = engine.train(X, y)
+
+    (_, Xt_seen, y_seen), kwargs = spy.call_args
+    assert set(kwargs) == {"deadline"}
+    assert Xt_seen.shape[0] == len(y_seen) == len(df) - 179
+    assert result["evaluation"] == "holdout"
+    assert 0 < result["validation_score"] <= 1 and "test_accuracy" in result
+
+def test_training_reports_search_results():
+    engine = AutoMLEngine(time_budget=15, n_configs=9)
+    result = engine.train_from_csv("titanic.csv", "Survived")
+
+    assert result["trials"]
+    assert isinstance(result["best_params"], dict)
+    assert result["feature_importance"]
+    assert result["evaluation"] == "cv-5"
+    assert result["encoding"]["Name"] == "drop"
+    assert 0 < result["validation_score"] <= 1
+    assert "weighted avg" in result["classification_report"]
+
+def test_training_result_computes_extras_lazily():
+    import json
+    import pickle
+    import pandas as pd
+    from unittest.mock import patch
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder
+    from sklearn.compose import ColumnTransformer
+    from automl_results import TrainingResult
+
+    X = pd.DataFrame({"signal": [0, 1] * 50, "color": ["red", "blue", "green", "red"] * 25})
+    y = X["signal"].values
+    model = Pipeline(steps=[
+        ("preprocessor", ColumnTransformer([("num", "passthrough", ["signal"]),
+                                            ("cat", OneHotEncoder(), ["color"])])),
+        ("classifier", LogisticRegression()),
+    ]).fit(X, y)
+    def new_result():
+        return TrainingResult("LogisticRegression", {}, "classification", 1.0, "holdout", 0.1, "model.joblib",
+                              "demo:v1", [], classes=[0, 1], test_accuracy=1.0, precision=1.0, recall=1.0,
+                              f1_score=1.0, confusion_matrix=[[50, 0], [0, 50]]
+                              ).with_evaluation(model, X, y, model.predict(X))
+
+    result = new_result()
+    # 非樹模型以 permutation importance 計算原始欄位的重要性，只計算一次；
+    # 只取便宜的欄位或 pickle 時不觸發計算
+    with patch("sklearn.inspection.permutation_importance", wraps=__import__(
+            "sklearn.inspection", fromlist=["permutation_importance"]).permutation_importance) as spy:
+        assert "feature_importance" not in result.to_dict(extras=False)
+        assert pickle.loads(pickle.dumps(new_result())).feature_importance == {}
+        assert spy.call_count == 0
+        assert list(result["feature_importance"])[0] == "signal"
+        assert result.get("feature_importance") is result.feature_importance
+    assert spy.call_count == 1
+    assert result["classification_report"]["accuracy"] == 1.0
+
+    # 與原本的 dict 結果相容，跨程序傳遞時不帶模型與測試資料
+    assert "model_id" in result and "error" not in result and "r2" not in result
+    restored = pickle.loads(pickle.dumps(result))
+    assert restored.to_dict() == json.loads(json.dumps(result.to_dict()))
+    assert restored._model is None
+
+def test_dataset_cache_skips_reparsing():
+    import pandas as pd
+    import dataset_cache
+    from unittest.mock import MagicMock
+
+    reader = MagicMock(side_effect=pd.read_csv)
+    first = dataset_cache.load_csv("titanic.csv", reader=reader)
+    # data/titanic.csv 內容相同，應命中同一個快取項目
+    second = dataset_cache.load_csv("data/titanic.csv", reader=reader)
+
+    assert reader.call_count == 1
+    pd.testing.assert_frame_equal(first, second)
+    assert list(second.dtypes) == list(first.dtypes)
+
+def test_dataset_cache_size_eviction():
+    import pandas as pd
+    import dataset_cache
+
+    dataset_cache.put("old", pd.DataFrame({"a": range(1000)}))
+    os.utime(dataset_cache._data_path("old"), (1000, 1000))
+    dataset_cache.put("new", pd.DataFrame({"a": range(1000)}))
+
+    dataset_cache.evict(max_bytes=os.path.getsize(dataset_cache._data_path("new")))
+    assert dataset_cache.get("old") is None
+    assert dataset_cache.get("new") is not None
+
+def test_streaming_csv_downcasts_and_samples(tmp_path):
+    import pandas as pd
+    import csv_ingest
+
+    full = pd.read_csv("titanic.csv")
+    sampled = csv_ingest.read_csv_streaming("titanic.csv", "Survived", row_cap=200, chunksize=100)
+
+    assert len(sampled) == 200
+    assert sampled["Fare"].dtype == "float32"
+    assert isinstance(sampled["Sex"].dtype, pd.CategoricalDtype)
+    # 分層抽樣應維持目標類別比例
+    assert abs(sampled["Survived"].mean() - full["Survived"].mean()) < 0.02
+
+    streamed = csv_ingest.read_csv_streaming("titanic.csv", chunksize=100)
+    assert len(streamed) == len(full)
+    assert streamed.memory_usage(deep=True).sum() < full.memory_usage(deep=True).sum()
+
+    # 浮點數目標縮減為 float32 後與原始值不相等，缺值目標也要依比例抽樣
+    import numpy as np
+    rng = np.random.RandomState(0)
+    target = rng.choice([0.1, 0.2, np.nan], size=3000, p=[0.6, 0.3, 0.1])
+    pd.DataFrame({"x": rng.random_sample(3000), "y": target}).to_csv(tmp_path / "float_target.csv", index=False)
+    sampled = csv_ingest.read_csv_streaming(str(tmp_path / "float_target.csv"), "y", row_cap=300, chunksize=500)
+    assert len(sampled) == 300 and list(sampled.columns) == ["x", "y"]
+    assert sampled["y"].isna().sum() == pytest.approx(30, abs=5)
+    assert (sampled["y"] > 0.15).sum() == pytest.approx(90, abs=5)
+
+def test_train_from_large_csv_uses_streaming(monkeypatch):
+    import csv_ingest
+    monkeypatch.setattr(csv_ingest, "STREAMING_THRESHOLD_BYTES", 0)
+    monkeypatch.setattr(csv_ingest, "MIN_ROW_CAP", 300)
+    monkeypatch.setattr(csv_ingest, "ROWS_PER_SECOND", 1)
+
+    engine = AutoMLEngine(time_budget=10, n_configs=9)
+    result = engine.train_from_csv("titanic.csv", "Survived")
+
+    assert "best_estimator" in result
+    assert max(t["n_samples"] for t in result["trials"]) <= 300
+
+def test_registry_versions_and_retention(monkeypatch):
+    import model_registry
+    from sklearn.dummy import DummyClassifier
+
+    monkeypatch.setattr(model_registry, "MAX_VERSIONS", 2)
+    model = DummyClassifier().fit([[0], [1]], [0, 1])
+    ids = [model_registry.register(model, "demo data", {"classes": [0, 1]})["model_id"] for _ in range(3)]
+
+    assert ids == ["demo-data:v1", "demo-data:v2", "demo-data:v3"]
+    assert [m["version"] for m in model_registry.list_models()] == [2, 3]
+    assert model_registry.resolve("demo-data") == ("demo-data", 3)
+
+def test_registry_serves_warm_models():
+    import model_registry
+    from unittest.mock import patch
+
+    engine = AutoMLEngine(time_budget=10, n_configs=3)
+    result = engine.train_from_csv("titanic.csv", "Survived")
+    assert result["model_id"] == "titanic:v1"
+    assert os.path.exists(result["saved_model_path"])
+
+    rows = [{"Pclass": 1, "Sex": "female", "Age": 30, "SibSp": 0, "Parch": 0, "Fare": 80.0, "Embarked": "C",
+             "PassengerId": 1, "Name": "x", "Ticket": "x", "Cabin": None}]
+    with patch("model_registry.joblib.load", wraps=model_registry.joblib.load) as spy:
+        first = model_registry.predict("titanic", rows)
+        second = model_registry.predict("titanic:v1", rows)
+
+    assert spy.call_count == 1
+    assert first["predictions"] == second["predictions"]
+    assert first["predictions"][0] in (0, 1)
+    assert len(first["probabilities"][0]) == 2
+
+def test_cardinality_aware_encoding():
+    import pandas as pd
+    from automl_encoding import FrequencyEncoder, build_preprocessor, plan_columns
+
+    df = pd.read_csv("titanic.csv")
+    y = df.pop("Survived")
+    plan = plan_columns(df)
+    assert plan["PassengerId"] == plan["Name"] == "drop"
+    assert plan["Sex"] == plan["Embarked"] == "onehot"
+    assert plan["Ticket"] == "frequency" and plan["Cabin"] == "target"
+    assert plan["Age"] == plan["Fare"] == "numeric"
+
+    preprocessor, _ = build_preprocessor(df)
+    # 原本對 Name / Ticket / Cabin 做 one-hot 會產生上千個欄位
+    assert preprocessor.fit_transform(df, y).shape[1] < 20
+
+    sizes = pd.DataFrame({"size": pd.Categorical(["S", "M", "L"] * 10, categories=["S", "M", "L"], ordered=True),
+                          "row": range(30)})
+    assert plan_columns(sizes) == {"size": "ordinal", "row": "drop"}
+
+    encoder = FrequencyEncoder().fit(pd.DataFrame({"t": ["a", "a", "b", None]}))
+    assert encoder.transform(pd.DataFrame({"t": ["a", "b", None, "unseen"]}))[:, 0].tolist() == [0.5, 0.25, 0.25, 0.0]
+
+    # StringDtype (pd.NA 缺值) 的文字欄位同樣要納入，不能因為不是 object 就被略過
+    text = pd.DataFrame({
+        "color": pd.array(["red", "blue", None] * 20, dtype="string"),
+        "city": pd.array([f"c{i % 20}" for i in range(60)], dtype="string"),
+        "code": pd.array([f"k{i % 40}" if i % 7 else None for i in range(60)], dtype="string"),
+    })
+    assert plan_columns(text) == {"color": "onehot", "city": "target", "code": "frequency"}
+    preprocessor, _ = build_preprocessor(text)
+    assert preprocessor.fit_transform(text, [0, 1] * 30).shape == (60, 5)
+
+def test_detect_task_from_target():
+    import pandas as pd
+    from automl_v3_final import detect_task
+
+    assert detect_task(pd.Series([0, 1, 1, 0])) == "classification"
+    assert detect_task(pd.Series(["setosa", "virginica", "versicolor"])) == "classification"
+    assert detect_task(pd.Series([1, 2, 3, 2, 1, 3])) == "classification"
+    assert detect_task(pd.Series([True, False])) == "classification"
+    assert detect_task(pd.Series([1.5, 2.25, 3.0])) == "regression"
+    assert detect_task(pd.Series(range(100))) == "regression"
+
+def test_regression_training():
+    import pandas as pd
+    import model_registry
+    from sklearn.datasets import make_regression
+    from tools import _format_training_summary
+
+    X, y = make_regression(n_samples=300, n_features=5, noise=5, random_state=0)
+    X = pd.DataFrame(X, columns=[f"f{i}" for i in range(5)])
+    X["group"] = ["a", "b", "c"] * 100
+    engine = AutoMLEngine(time_budget=15, n_configs=3)
+    engine.dataset_name = "synthetic"
+    result = engine.train(X, pd.Series(y * 1000))
+
+    assert result["task"] == "regression"
+    assert {t["model"] for t in result["trials"]} == {"RandomForest", "GradientBoosting", "Ridge"}
+    assert result["r2"] > 0.8 and result["rmse"] > 0
+    assert "test_accuracy" not in result and "classification_report" not in result
+    assert "R²" in _format_training_summary(result.to_dict())
+
+    output = model_registry.predict(result["model_id"], X.head(3).to_dict("records"))
+    assert "probabilities" not in output
+    assert all(isinstance(p, float) for p in output["predictions"])
+
+def test_predict_tool():
+    from tools import predict
+
+    AutoMLEngine(time_budget=10, n_configs=3).train_from_csv("titanic.csv", "Survived")
+    output = predict.invoke({"model_id": "titanic", "records_json": '[{"Pclass": 3, "Sex": "male", "Age": 22}]'})
+    assert "Predictions from titanic:v1" in output
+    assert "Failed" in predict.invoke({"model_id": "missing", "records_json": "[]"})
+
+def test_batch_scoring_matches_single_predictions(tmp_path, monkeypatch):
+    import pandas as pd
+    import batch_scoring
+    import model_registry
+    import tools
+    from tools import batch_predict
+
+    monkeypatch.setattr(tools, "DATA_DIR", str(tmp_path))
+
+    AutoMLEngine(time_budget=10, n_configs=3).train_from_csv("titanic.csv", "Survived")
+    inputs = pd.read_csv("titanic.csv").drop(columns=["Survived"])
+    input_path = tmp_path / "to_score.csv"
+    inputs.to_csv(input_path, index=False)
+
+    serial = batch_scoring.score_csv("titanic", str(input_path), str(tmp_path / "serial.csv"),
+                                     chunksize=200, n_workers=1, keep_columns=["PassengerId"])
+    parallel = batch_scoring.score_csv("titanic", str(input_path), str(tmp_path / "parallel.csv"),
+                                       chunksize=200, n_workers=2)
+    # 工作程序池常駐，之後的批次預測重複使用 (模型已在工作程序中載入)
+    pool = batch_scoring.get_pool(2)
+    again = batch_scoring.score_csv("titanic", str(input_path), str(tmp_path / "again.csv"),
+                                    chunksize=200, n_workers=2)
+    assert batch_scoring.get_pool(2) is pool and again["rows"] == parallel["rows"]
+
+    assert serial["rows"] == parallel["rows"] == len(inputs)
+    assert serial["rows_per_sec"] > 0
+    serial_out = pd.read_csv(tmp_path / "serial.csv")
+    parallel_out = pd.read_csv(tmp_path / "parallel.csv")
+    assert list(serial_out["row"]) == list(range(len(inputs)))
+    assert list(serial_out["PassengerId"]) == list(inputs["PassengerId"])
+    assert list(serial_out["prediction"]) == list(parallel_out["prediction"])
+    assert {"proba_0", "proba_1"} <= set(serial_out.columns)
+
+    expected = model_registry.predict("titanic", inputs.head(20))["predictions"]
+    assert list(serial_out["prediction"].head(20)) == expected
+
+    report = batch_predict.invoke({"model_id": "titanic", "input_csv": str(input_path)})
+    assert "Rows Scored: 891" in report
+    assert (tmp_path / "to_score_predictions.csv").exists()
+
+    # 輸入與輸出都限制在 DATA_DIR 內，不能讀取任意 CSV 或覆寫程式碼
+    outside = batch_predict.invoke({"model_id": "titanic", "input_csv": str(tmp_path / ".." / "x.csv")})
+    assert outside.startswith("Error:") and "inside" in outside
+    overwrite = batch_predict.invoke({"model_id": "titanic", "input_csv": str(input_path),
+                                      "output_csv": os.path.abspath("tools.py")})
+    assert overwrite.startswith("Error:")
+    not_csv = batch_predict.invoke({"model_id": "titanic", "input_csv": str(input_path),
+                                    "output_csv": str(tmp_path / "evil.py")})
+    assert not_csv.startswith("Error:") and not (tmp_path / "evil.py").exists()
+    batch_scoring.shutdown_pool()
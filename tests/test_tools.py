@@ -6,8 +6,19 @@ from unittest.mock import patch
 # 將父目錄加入 sys.path 以便匯入 tools
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import search_cache
+import tools
 from tools import multiply, add, search_duckduckgo
 
+@pytest.fixture(autouse=True)
+def clean_search_state():
+    # 搜尋結果與 DDGS session 都是跨呼叫共用的，每個測試前後清空
+    search_cache.clear()
+    tools._ddgs_pool.clear()
+    yield
+    search_cache.clear()
+    tools._ddgs_pool.clear()
+
 def test_multiply():
     """測試乘法工具"""
     assert multiply.invoke({"a": 2, "b": 3}) == 6
@@ -47,3 +58,93 @@ def test_search_duckduckgo_no_results():
         
         result = search_duckduckgo.invoke({"query": "nothing"})
         assert result == "No results found."
+
+def test_search_cache_normalizes_queries_and_reuses_session():
+    """正規化後相同的查詢只搜尋一次，不同查詢共用同一個 DDGS session"""
+    with patch("tools.DDGS") as mock_ddgs_cls:
+        mock_ddgs_cls.return_value.text.side_effect = lambda query, max_results: [
+            {"title": query, "href": "http://test.com", "body": "Body"}
+        ]
+        first = search_duckduckgo.invoke({"query": "LangGraph  Agents"})
+        second = search_duckduckgo.invoke({"query": " langgraph agents "})
+        search_duckduckgo.invoke({"query": "another query"})
+
+    assert first == second
+    assert mock_ddgs_cls.return_value.text.call_count == 2
+    assert mock_ddgs_cls.call_count == 1
+    assert search_cache.stats()["hits"] == 1
+
+def test_search_cache_skips_empty_results():
+    """空的結果不快取，下次查詢會重新搜尋"""
+    responses = [[], [{"title": "t", "href": "h", "body": "b"}]]
+    backend = lambda query, max_results: responses.pop(0)
+
+    assert search_cache.cached_search("flaky", 3, backend) == []
+    assert search_cache.cached_search("flaky", 3, backend)[0]["title"] == "t"
+    assert search_cache.stats()["misses"] == 2 and search_cache.stats()["entries"] == 1
+
+def test_session_pool_clear_keeps_checked_out_sessions_counted():
+    """clear() 時使用中的 session 仍計入上限，池不會超過 size"""
+    created = []
+    def factory():
+        created.append(object())
+        return created[-1]
+
+    pool = search_cache.SessionPool(factory, size=1)
+    session = pool.acquire()
+    pool.clear()
+    pool.release(session)
+    assert pool.acquire() is session
+    pool.release(session)
+    pool.clear()
+    pool.acquire()
+    assert len(created) == 2 and pool._created == 1
+
+def test_search_cache_coalesces_concurrent_queries():
+    """同時進行的相同查詢只會發出一次請求"""
+    import threading
+    import time
+
+    calls = []
+    def slow_backend(query, max_results):
+        calls.append(query)
+        time.sleep(0.2)
+        return search_cache.stub_search(query, max_results)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(search_cache.cached_search("same query", 3, slow_backend)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert len(results) == 8 and all(r == results[0] for r in results)
+    assert search_cache.stats()["coalesced"] == 7
+
+def test_search_cache_ttl_and_disk_tier(tmp_path, monkeypatch):
+    """過期的結果會重新搜尋；磁碟層在記憶體清空後仍可命中"""
+    monkeypatch.setattr(search_cache, "CACHE_DIR", str(tmp_path))
+    calls = []
+    def backend(query, max_results):
+        calls.append(query)
+        return search_cache.stub_search(query, max_results)
+
+    search_cache.cached_search("disk query", 3, backend)
+    search_cache.clear()
+    assert search_cache.cached_search("disk query", 3, backend)[0]["title"] == "Result 1 for disk query"
+    assert len(calls) == 1 and search_cache.stats()["disk_hits"] == 1
+
+    monkeypatch.setattr(search_cache, "CACHE_TTL", -1)
+    search_cache.cached_search("expired query", 3, backend)
+    search_cache.cached_search("expired query", 3, backend)
+    assert calls.count("expired query") == 2
+
+def test_search_stub_backend(monkeypatch):
+    """SEARCH_BACKEND=stub 時不需要網路"""
+    monkeypatch.setattr(search_cache, "BACKEND", "stub")
+    with patch("tools.DDGS") as mock_ddgs_cls:
+        result = search_duckduckgo.invoke({"query": "offline"})
+    assert "Title: Result 1 for offline" in result
+    mock_ddgs_cls.assert_not_called()
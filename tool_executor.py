@@ -0,0 +1,158 @@
+"""
+平行工具執行節點 (取代 LangGraph 預設的 ToolNode)。
+
+LLM 一次回傳多個 tool_calls 時 (例如數個搜尋加上算術)，所有呼叫同時執行，
+整體耗時約為最慢的一個，而不是全部相加。
+
+- 每個工具有各自的同時執行上限 (整個程序共用)：AutoML 等重量級工具 1 個，搜尋 4 個。
+- 每個呼叫有逾時；逾時或發生錯誤時回傳錯誤的 ToolMessage，讓 LLM 可以改用其他做法。
+  排隊等待名額時已逾時的呼叫不會再執行 (避免結果被丟棄的工具仍產生副作用)。
+- 回傳的 ToolMessage 依 tool_calls 的原始順序排列。
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+
+import telemetry
+
+DEFAULT_LIMIT = 8
+DEFAULT_TIMEOUT = float(os.environ.get("TOOL_TIMEOUT_SECONDS", "60"))
+
+# 每個工具同時執行的上限
+TOOL_LIMITS = {
+    "train_tabular_model": 1,
+    "batch_predict": 1,
+    "search_duckduckgo": 4,
+}
+
+# 每個呼叫的逾時 (秒)，包含等待同時執行名額的時間
+TOOL_TIMEOUTS = {
+    "search_duckduckgo": 20.0,
+    "batch_predict": 600.0,
+}
+
+MAX_WORKERS = int(os.environ.get("TOOL_MAX_WORKERS", "16"))
+
+
+class ParallelToolExecutor:
+    def __init__(self, tools: list, limits: dict = None, timeouts: dict = None, max_workers: int = None):
+        self.tools_by_name = {t.name: t for t in tools}
+        self.limits = {**TOOL_LIMITS, **(limits or {})}
+        self.timeouts = {**TOOL_TIMEOUTS, **(timeouts or {})}
+        self._semaphores = {
+            name: threading.BoundedSemaphore(self.limits.get(name, DEFAULT_LIMIT)) for name in self.tools_by_name
+        }
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or MAX_WORKERS, thread_name_prefix="tool")
+
+    def _timeout(self, name: str) -> float:
+        return self.timeouts.get(name, DEFAULT_TIMEOUT)
+
+    def _run_call(self, call: dict, config: dict, submitted_at: float, deadline: float) -> ToolMessage:
+        """
+        在工作執行緒中執行單一工具呼叫 (受該工具的同時執行上限限制)。
+
+        等到名額時若已超過截止時間就不執行：呼叫端已回報逾時，結果只會被丟棄。
+        """
+        tool = self.tools_by_name[call["name"]]
+        semaphore = self._semaphores[call["name"]]
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not semaphore.acquire(timeout=remaining):
+            return self._timed_out(call)
+        try:
+            # 排隊時間 = 等待執行緒 + 等待該工具的同時執行名額
+            queue_wait_ms = (time.monotonic() - submitted_at) * 1000
+            with telemetry.step("tools", config, tool=call["name"], queue_wait_ms=queue_wait_ms) as event:
+                try:
+                    output = tool.invoke({**call, "type": "tool_call"}, config)
+                except Exception as e:
+                    event["status"] = "error"
+                    return _error_message(call, f"Error: {e!r}\n Please fix your mistakes.")
+        finally:
+            semaphore.release()
+        if isinstance(output, ToolMessage):
+            return output
+        return ToolMessage(content=str(output), name=call["name"], tool_call_id=call["id"])
+
+    def _submit(self, calls: list, config: dict) -> list:
+        """送出所有呼叫，回傳 (call, future 或 None, 截止時間)。"""
+        submitted = []
+        now = time.monotonic()
+        for call in calls:
+            if call["name"] not in self.tools_by_name:
+                submitted.append((call, None, now))
+                continue
+            # 複製 contextvars，工具內仍可取得 LangGraph 的執行設定
+            context = contextvars.copy_context()
+            deadline = now + self._timeout(call["name"])
+            future = self._pool.submit(context.run, self._run_call, call, config, now, deadline)
+            submitted.append((call, future, deadline))
+        return submitted
+
+    def _invalid_tool(self, call: dict) -> ToolMessage:
+        available = ", ".join(self.tools_by_name)
+        return _error_message(call, f"Error: {call['name']} is not a valid tool, try one of [{available}].")
+
+    def _timed_out(self, call: dict) -> ToolMessage:
+        return _error_message(
+            call, f"Error: tool '{call['name']}' timed out after {self._timeout(call['name']):g}s. "
+                  "Try again later or use a different approach."
+        )
+
+    def invoke_calls(self, calls: list, config: dict = None) -> list:
+        """同步執行多個工具呼叫，依原始順序回傳 ToolMessage。"""
+        results = []
+        for call, future, deadline in self._submit(calls, config):
+            if future is None:
+                results.append(self._invalid_tool(call))
+                continue
+            try:
+                results.append(future.result(timeout=max(0.0, deadline - time.monotonic())))
+            except FutureTimeoutError:
+                # 尚未開始的呼叫直接取消；執行中的無法強制停止，完成後結果會被丟棄
+                future.cancel()
+                results.append(self._timed_out(call))
+        return results
+
+    async def ainvoke_calls(self, calls: list, config: dict = None) -> list:
+        """非同步版本：在事件迴圈上等待，不佔用執行緒；同步與非同步共用相同的上限。"""
+        async def wait(call, future, deadline):
+            if future is None:
+                return self._invalid_tool(call)
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(future),
+                                              timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                future.cancel()
+                return self._timed_out(call)
+
+        return list(await asyncio.gather(*(wait(*item) for item in self._submit(calls, config))))
+
+    def as_node(self, name: str = "tools") -> RunnableLambda:
+        """包裝成 LangGraph 節點：執行最後一則 AIMessage 的 tool_calls。"""
+        def run(state: dict, config):
+            return {"messages": self.invoke_calls(_pending_calls(state), config)}
+
+        async def arun(state: dict, config):
+            return {"messages": await self.ainvoke_calls(_pending_calls(state), config)}
+
+        return RunnableLambda(run, afunc=arun, name=name)
+
+    def shutdown(self, wait: bool = False):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+def _pending_calls(state: dict) -> list:
+    for message in reversed(state["messages"]):
+        if isinstance(message, AIMessage):
+            return message.tool_calls
+    return []
+
+
+def _error_message(call: dict, content: str) -> ToolMessage:
+    return ToolMessage(content=content, name=call["name"], tool_call_id=call["id"], status="error")
@@ -1,8 +1,11 @@
+# 這裡只匯入註冊工具 (名稱、參數 schema) 所需的模組；duckduckgo_search、sklearn/pandas/openml 等
+# 實作依賴在第一次呼叫工具時才載入，讓 Streamlit 冷啟動與測試程序不必付出這些匯入時間
 from langchain_core.tools import tool
-from langchain_community.tools import DuckDuckGoSearchRun
-from duckduckgo_search import DDGS
+import os
 import warnings
 
+import search_cache
+
 # 忽略 DuckDuckGoSearch 的更名警告與可能的資源警告
 warnings.filterwarnings("ignore", category=RuntimeWarning, module="duckduckgo_search")
 warnings.filterwarnings("ignore", category=ResourceWarning)
@@ -17,20 +20,86 @@ def add(a: int, b: int) -> int:
     """相加兩個整數。"""
     return a + b
 
+def __getattr__(name: str):
+    # tools.DDGS 在第一次存取時才匯入 duckduckgo_search
+    if name == "DDGS":
+        from duckduckgo_search import DDGS
+        globals()["DDGS"] = DDGS
+        return DDGS
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _new_ddgs():
+    ddgs_cls = globals().get("DDGS") or __getattr__("DDGS")
+    return ddgs_cls()
+
+# 重複使用的 DDGS session (保留 HTTP 連線)，數量即為同時對 DuckDuckGo 發出的請求上限
+_ddgs_pool = search_cache.SessionPool(_new_ddgs, size=int(os.environ.get("SEARCH_POOL_SIZE", "2")))
+
+# 批次預測只能讀寫這個目錄內的檔案 (app.py 上傳的 CSV 存放於此)
+DATA_DIR = os.environ.get("AGENT_DATA_DIR", "data")
+
+def _resolve_data_path(path: str):
+    """把路徑解析成真實路徑 (展開 .. 與符號連結)；不在 DATA_DIR 內則回傳 None。"""
+    root = os.path.realpath(DATA_DIR)
+    resolved = os.path.realpath(path)
+    if os.path.commonpath([root, resolved]) != root:
+        return None
+    return resolved
+
+def _ddgs_search(query: str, max_results: int) -> list:
+    return _ddgs_pool.run(lambda ddgs: list(ddgs.text(query, max_results=max_results)))
+
 @tool
 def search_duckduckgo(query: str) -> str:
     """使用 DuckDuckGo 搜尋網路。"""
-    with DDGS() as ddgs:
-        # 減少搜尋結果數量以降低 Token 消耗 (避免 Groq 免費版 Rate Limit)
-        results = list(ddgs.text(query, max_results=3))
-        if not results:
-            return "No results found."
-        return "\n\n".join([f"Title: {r['title']}\nLink: {r['href']}\nSnippet: {r['body']}" for r in results])
+    backend = search_cache.stub_search if search_cache.BACKEND == "stub" else _ddgs_search
+    # 減少搜尋結果數量以降低 Token 消耗 (避免 Groq 免費版 Rate Limit)
+    # 相同查詢 (正規化後) 直接使用快取，同時進行的相同查詢只會發出一次請求
+    results = search_cache.cached_search(query, 3, backend)
+    if not results:
+        return "No results found."
+    return "\n\n".join([f"Title: {r['title']}\nLink: {r['href']}\nSnippet: {r['body']}" for r in results])
+
+def _format_training_summary(result: dict) -> str:
+    """將 AutoML 結果 dict 轉為易讀的摘要。"""
+    summary = (
+        f"✅ AutoML Training Complete!\n"
+        f"- Task: {result.get('task', 'classification')}\n"
+        f"- Best Estimator: {result['best_estimator']}\n"
+    )
+    if result.get('task') == 'regression':
+        summary += (
+            f"- R²: {result['r2']:.4f}\n"
+            f"- MAE: {result['mae']:.4f}\n"
+            f"- RMSE: {result['rmse']:.4f}\n"
+            f"- Validation R² ({result.get('evaluation', 'holdout')}): {result['validation_score']:.4f}\n"
+        )
+    else:
+        summary += (
+            f"- Accuracy: {result['test_accuracy']:.4f}\n"
+            f"- Validation Score ({result.get('evaluation', 'holdout')}): "
+            f"{result.get('validation_score', result['test_accuracy']):.4f}\n"
+            f"- Precision: {result.get('precision', 0):.4f}\n"
+            f"- Recall: {result.get('recall', 0):.4f}\n"
+            f"- F1 Score: {result.get('f1_score', 0):.4f}\n"
+            f"- Confusion Matrix: {result.get('confusion_matrix')}\n"
+        )
+    summary += (
+        f"- Training Time: {result['training_duration']:.2f}s\n"
+        f"- 💾 Model ID: {result.get('model_id')} (Ready for predict)\n"
+    )
+
+    if result.get('feature_importance'):
+        top_features = list(result['feature_importance'].keys())[:3]
+        summary += f"- Top Features: {top_features}\n"
+
+    return summary
 
 @tool
 def train_tabular_model(dataset_source: str, target_column: str = "target") -> str:
     """
-    使用 AutoML 自動訓練機器學習模型。
+    使用 AutoML 自動訓練機器學習模型 (非同步)。
+    提交訓練工作後立即回傳 Job ID，之後用 get_training_status 查詢結果。
     
     Args:
         dataset_source (str): 
@@ -38,54 +107,176 @@ def train_tabular_model(dataset_source: str, target_column: str = "target") -> s
             或者是本地 CSV 檔案路徑 (例如 "data.csv")。
         target_column (str): 
             目標欄位名稱 (Target Column)，預設為 "class" 或 "target"。
+            類別目標以分類模型訓練；數值且不同值很多 (例如價格) 的目標自動改為迴歸。
             OpenML 資料集通常不需要此參數。
 
     Returns:
-        str: 訓練結果摘要，包含準確率、最佳模型與特徵重要性。
+        str: 工作已提交的訊息，包含 Job ID。
     """
     try:
-        import importlib
-        import automl_v3_final
-        importlib.reload(automl_v3_final)
-        from automl_v3_final import AutoMLEngine
-        # 為了 Demo 快速回應，設定預算為 10-30 秒
-        engine = AutoMLEngine(time_budget=20) 
-        
-        result = {}
+        import automl_jobs
+
         # Smart Shortcut for Titanic
         if dataset_source.lower() == "titanic":
             dataset_source = "titanic.csv"
             if target_column == "target": # Only override if default
                 target_column = "Survived"
-                
-        if dataset_source.startswith("openml:"):
-            ds_id = int(dataset_source.split(":")[1])
-            result = engine.train_from_openml(ds_id)
-        else:
-            result = engine.train_from_csv(dataset_source, target_column)
-            
-        if "error" in result:
-            return f"Error: {result['error']}"
-            
-        # 建立易讀的摘要
-        summary = (
-            f"✅ AutoML Training Complete!\n"
-            f"- Best Estimator: {result['best_estimator']}\n"
-            f"- Accuracy: {result['test_accuracy']:.4f}\n"
-            f"- Precision: {result.get('precision', 0):.4f}\n"
-            f"- Recall: {result.get('recall', 0):.4f}\n"
-            f"- F1 Score: {result.get('f1_score', 0):.4f}\n"
-            f"- Confusion Matrix: {result.get('confusion_matrix')}\n"
-            f"- Training Time: {result['training_duration']:.2f}s\n"
-            f"- 💾 Model Saved: {result.get('saved_model_path')} (Ready for Deployment)\n"
+
+        # 在常駐的 AutoML 工作程序中背景訓練 (已預先匯入 sklearn 等模組)
+        # 為了 Demo 快速回應，設定預算為 10-30 秒
+        job_id = automl_jobs.submit_job(dataset_source, target_column, time_budget=20)
+        return (
+            f"🚀 AutoML training job submitted.\n"
+            f"- Job ID: {job_id}\n"
+            f"- Dataset: {dataset_source}\n"
+            f"Use get_training_status with this Job ID to check progress and results."
         )
-        
-        if result.get('feature_importance'):
-            top_features = list(result['feature_importance'].keys())[:3]
-            summary += f"- Top Features: {top_features}\n"
-            
-        return summary
     except Exception as e:
         return f"AutoML Failed: {str(e)}"
 
-tools = [multiply, add, search_duckduckgo, train_tabular_model]
+@tool
+def get_training_status(job_id: str) -> str:
+    """
+    查詢 AutoML 訓練工作的狀態；完成時回傳訓練結果摘要。
+
+    Args:
+        job_id (str): train_tabular_model 回傳的 Job ID。
+    """
+    import automl_jobs
+
+    job = automl_jobs.get_job(job_id)
+    if job is None:
+        return f"Error: Job {job_id} not found."
+
+    status = job["status"]
+    if status == automl_jobs.COMPLETED:
+        return _format_training_summary(job["result"])
+    if status == automl_jobs.FAILED:
+        return f"AutoML Failed: {job.get('error')}"
+
+    finished = len(automl_jobs.get_leaderboard(job_id))
+    return f"Job {job_id} is {status}. Candidate models finished so far: {finished}."
+
+@tool
+def get_training_results(job_id: str) -> str:
+    """
+    取得 AutoML 訓練工作目前的排行榜 (可在訓練途中取得部分結果)。
+
+    Args:
+        job_id (str): train_tabular_model 回傳的 Job ID。
+    """
+    import automl_jobs
+
+    job = automl_jobs.get_job(job_id)
+    if job is None:
+        return f"Error: Job {job_id} not found."
+
+    leaderboard = automl_jobs.get_leaderboard(job_id)
+    if not leaderboard:
+        return f"Job {job_id} is {job['status']}. No candidate models have finished yet."
+
+    lines = [f"📊 Leaderboard for job {job_id} ({job['status']}):"]
+    for rank, entry in enumerate(leaderboard, start=1):
+        lines.append(
+            f"{rank}. {entry['model']}: score={entry['score']:.4f} "
+            f"(rung {entry.get('rung', 0)}, {entry.get('n_samples', '?')} rows, fit {entry['fit_time']:.2f}s)"
+        )
+    return "\n".join(lines)
+
+@tool
+def cancel_training(job_id: str) -> str:
+    """
+    取消 AutoML 訓練工作。已完成的候選模型仍保留在排行榜中。
+
+    Args:
+        job_id (str): train_tabular_model 回傳的 Job ID。
+    """
+    import automl_jobs
+
+    job = automl_jobs.cancel_job(job_id)
+    if job is None:
+        return f"Error: Job {job_id} not found."
+    if job["status"] == automl_jobs.CANCELLED:
+        return f"🛑 Job {job_id} cancelled."
+    if job["status"] in automl_jobs.FINAL_STATES:
+        return f"Job {job_id} already {job['status']}."
+    return f"🛑 Cancellation requested for job {job_id}; it will stop before the next candidate model."
+
+@tool
+def predict(model_id: str, records_json: str) -> str:
+    """
+    使用已訓練的模型進行預測。
+
+    Args:
+        model_id (str): 訓練結果中的 Model ID (例如 "titanic:v3")，只給名稱 (例如 "titanic") 則使用最新版本。
+        records_json (str): JSON 格式的資料列，例如 '[{"Pclass": 3, "Sex": "male", "Age": 22}]'。
+            缺少的欄位會視為缺值。
+
+    Returns:
+        str: 每一列的預測結果 (分類模型另附機率)。
+    """
+    import json
+    import model_registry
+
+    try:
+        records = json.loads(records_json)
+        if isinstance(records, dict):
+            records = [records]
+        meta = model_registry.get_metadata(model_id)
+        # 缺少的特徵欄位補成缺值，交給 Pipeline 的 imputer 處理
+        columns = meta.get("feature_columns") or []
+        records = [{col: row.get(col) for col in columns} if columns else row for row in records]
+        output = model_registry.predict(model_id, records)
+    except Exception as e:
+        return f"Prediction Failed: {str(e)}"
+
+    lines = [f"🔮 Predictions from {output['model_id']}:"]
+    for i, label in enumerate(output["predictions"]):
+        line = f"{i + 1}. {label}"
+        if "probabilities" in output:
+            probs = ", ".join(f"{cls}={p:.3f}" for cls, p in zip(output["classes"], output["probabilities"][i]))
+            line += f" ({probs})"
+        lines.append(line)
+    return "\n".join(lines)
+
+@tool
+def batch_predict(model_id: str, input_csv: str, output_csv: str = "") -> str:
+    """
+    使用已訓練的模型對整個 CSV 檔案進行批次預測，結果寫入輸出檔。
+
+    Args:
+        model_id (str): 訓練結果中的 Model ID (例如 "titanic:v3" 或 "titanic")。
+        input_csv (str): 要評分的 CSV 檔案路徑，必須位於 data/ 內 (例如 "data/new_passengers.csv")。
+        output_csv (str): 輸出 CSV 路徑 (同樣限於 data/ 內)，預設為 "<input>_predictions.csv"。
+
+    Returns:
+        str: 評分列數、輸出檔案位置與速度 (rows/sec)。
+    """
+    import os
+    import batch_scoring
+
+    input_path = _resolve_data_path(input_csv)
+    if input_path is None:
+        return f"Error: input_csv must be inside {DATA_DIR}/: {input_csv}"
+    if not os.path.exists(input_path):
+        return f"Error: File not found: {input_csv}"
+    # 預設輸出路徑 (<input>_predictions.csv) 也要經過相同的檢查
+    output_path = _resolve_data_path(output_csv or batch_scoring.default_output_path(input_path))
+    if output_path is None:
+        return f"Error: output_csv must be inside {DATA_DIR}/: {output_csv or output_path}"
+    if not output_path.lower().endswith(".csv"):
+        return f"Error: output_csv must be a .csv file: {output_csv}"
+    try:
+        report = batch_scoring.score_csv(model_id, input_path, output_path)
+    except Exception as e:
+        return f"Batch Prediction Failed: {str(e)}"
+
+    return (
+        f"✅ Batch Prediction Complete!\n"
+        f"- Model: {report['model_id']}\n"
+        f"- Rows Scored: {report['rows']}\n"
+        f"- Output: {report['output_path']}\n"
+        f"- Speed: {report['rows_per_sec']:.0f} rows/sec ({report['seconds']:.2f}s)\n"
+    )
+
+tools = [multiply, add, search_duckduckgo, train_tabular_model, get_training_status, get_training_results, cancel_training, predict, batch_predict]